@@ -4,21 +4,31 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, r2_score
+from src.analysis.forecast_models import train_forecast_model
+from src.analysis.feature_store import load_feature_store
+from src.analysis.bootstrap_ci import bootstrap_effects
+from src.cleaning_data_src.artifact_manifest import start_run, end_run, publish_figure
 
-def run_advanced_analysis(lat, lon, year, processed_dir='processed', figures_dir='figures'):
+def run_advanced_analysis(lat, lon, year, processed_dir='processed', figures_dir='figures', models_dir='models',
+                          n_boot=2000, store_dir='features'):
     print("\n BẮT ĐẦU PHÂN TÍCH NÂNG CAO: DỰ BÁO PM2.5 (TẬP TRUNG TẾT)")
+    start_run(f'advanced_analysis_{lat}_{lon}_{year}')
     
-    # 1. Load dữ liệu
-    file_path = f"{processed_dir}/daily_weather_aqi_{lat}_{lon}_{year}.csv"
-    try:
-        df = pd.read_csv(file_path)
-    except FileNotFoundError:
-        print("Lỗi: Không tìm thấy file dữ liệu.")
-        return
+    # 1. Load dữ liệu: ưu tiên kho feature đã tính sẵn (feature_store.py), không có thì đọc file daily
+    table = load_feature_store(lat, lon, store_dir, start=f'{year}-01-01', end=f'{year}-12-31') if store_dir else None
+    if table is not None:
+        df = table.reset_index()
+    else:
+        file_path = f"{processed_dir}/daily_weather_aqi_{lat}_{lon}_{year}.csv"
+        try:
+            df = pd.read_csv(file_path)
+        except FileNotFoundError:
+            print("Lỗi: Không tìm thấy file dữ liệu.")
+            return
 
-    # --- SỬA ĐỔI QUAN TRỌNG: Xử lý thời gian ---
-    # Chuyển cột time sang datetime ngay từ đầu để lọc
-    df['time'] = pd.to_datetime(df['time'])
+        # --- SỬA ĐỔI QUAN TRỌNG: Xử lý thời gian ---
+        # Chuyển cột time sang datetime ngay từ đầu để lọc
+        df['time'] = pd.to_datetime(df['time'])
     
     # 2. Định nghĩa giai đoạn Tết và giai đoạn "Bình thường"
     # Giả sử Tết 2024: 08/02 - 14/02 (29 Tết đến Mùng 5)
@@ -33,6 +43,8 @@ def run_advanced_analysis(lat, lon, year, processed_dir='processed', figures_dir
     mask_tet_holiday = (df['time'] >= tet_start_date) & (df['time'] <= tet_end_date)
     
     # 3. Chọn Features và Target
+    # Mô hình phản thực tế chỉ dùng thời tiết cùng ngày: lag / trung bình trượt của PM2.5 trong kho
+    # mang theo chính hiệu ứng Tết nên KHÔNG đưa vào đây (chúng dùng cho mô hình dự báo ngày hôm sau).
     features = ['precipitation_sum', 'wind_speed_mean', 'temperature_mean', 'air_pressure']
     target = 'pm2_5_mean'
     
@@ -73,6 +85,15 @@ def run_advanced_analysis(lat, lon, year, processed_dir='processed', figures_dir
     diff = tet_only['predicted'].mean() - tet_only[target].mean()
     print(f"   -> Trong tuần Tết, mô hình dự báo cao hơn thực tế trung bình: {diff:.2f} µg/m³")
 
+    # Khoảng tin cậy 95% bằng bootstrap khối (mọi lần lặp giải theo lô, không fit lại sklearn)
+    data_sorted = data.sort_values('time')
+    X_all = np.column_stack([np.ones(len(data_sorted)), data_sorted[features].to_numpy(dtype=float)])
+    is_tet = ((data_sorted['time'] >= tet_start_date) & (data_sorted['time'] <= tet_end_date)).to_numpy()
+    boot = bootstrap_effects(X_all, data_sorted[target].to_numpy(dtype=float), ~is_tet,
+                             is_tet[None, :].astype(float), n_boot=n_boot)
+    print(f"   -> Khoảng tin cậy 95% (bootstrap khối, {n_boot} lần): "
+          f"[{boot['effect_ci_low'][0]:.2f}, {boot['effect_ci_high'][0]:.2f}] µg/m³")
+
     # 7. Trực quan hóa kết quả (ZOOM VÀO THÁNG 2)
     plt.figure(figsize=(12, 6))
     
@@ -95,6 +116,10 @@ def run_advanced_analysis(lat, lon, year, processed_dir='processed', figures_dir
     plt.grid(True, alpha=0.3)
     
     save_path = f"{figures_dir}/6_advanced_forecast_tet.png"
-    plt.savefig(save_path)
+    publish_figure(plt.gcf(), save_path)
     plt.close()
-    print(f"Đã lưu biểu đồ phân tích Tết: {save_path}")
\ No newline at end of file
+    print(f"Đã lưu biểu đồ phân tích Tết: {save_path}")
+    end_run()
+
+    # 8. Lưu mô hình dự báo PM2.5 ngày hôm sau của trạm (dùng lại qua ForecastModelStore)
+    train_forecast_model(lat, lon, [year], processed_dir=processed_dir, models_dir=models_dir, store_dir=store_dir)
@@ -0,0 +1,113 @@
+import numpy as np
+
+"""
+File: bootstrap_ci.py
+Mô tả: Khoảng tin cậy BOOTSTRAP KHỐI (moving block bootstrap) cho hiệu ứng phản thực tế
+(counterfactual effect = trung bình dự báo - thực tế trong khung sự kiện).
+
+Hai nguồn bất định được lấy mẫu lại:
+    1. Hệ số hồi quy: lấy mẫu lại các KHỐI ngày huấn luyện liên tiếp (giữ tự tương quan theo ngày)
+       -> mỗi lần lặp là một hồi quy có trọng số (trọng số = số lần ngày được chọn).
+    2. Nhiễu của chính khung sự kiện: cộng trung bình của một khối phần dư huấn luyện liên tiếp
+       có cùng độ dài với sự kiện.
+TẤT CẢ các lần lặp được giải cùng lúc bằng phương trình chuẩn theo lô
+(X^T W_b X) beta_b = X^T W_b y, dạng mảng (B x p x p) + np.linalg.solve — không lặp fit sklearn.
+"""
+
+DEFAULT_N_BOOT = 2000
+DEFAULT_BLOCK_LEN = 7
+CHUNK_SIZE = 500
+
+
+def block_bootstrap_counts(n, n_boot, block_len, rng):
+    """
+    Ma trận (n_boot x n): số lần mỗi ngày huấn luyện được chọn trong mỗi mẫu bootstrap khối.
+    Mỗi mẫu ghép ceil(n / block_len) khối liên tiếp, cắt còn đúng n ngày.
+    """
+    block_len = max(1, min(block_len, n))
+    n_blocks = int(np.ceil(n / block_len))
+    starts = rng.integers(0, n - block_len + 1, size=(n_boot, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block_len)[None, None, :]).reshape(n_boot, -1)[:, :n]
+    flat = (np.arange(n_boot)[:, None] * n + idx).ravel()
+    return np.bincount(flat, minlength=n_boot * n).reshape(n_boot, n).astype(float)
+
+
+def batched_weighted_lstsq(X, y, weights):
+    """
+    Giải đồng thời B bài toán bình phương tối thiểu có trọng số.
+    X: (n, p), y: (n,), weights: (B, n) -> hệ số (B, p).
+    """
+    WX = weights[:, :, None] * X[None, :, :]              # (B, n, p)
+    XtWX = np.einsum('bni,nj->bij', WX, X)                 # (B, p, p)
+    XtWy = np.einsum('bni,n->bi', WX, y)                   # (B, p)
+    try:
+        return np.linalg.solve(XtWX, XtWy[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        # Có mẫu suy biến (ví dụ một feature hằng số trong mẫu) -> giả nghịch đảo theo lô
+        return np.einsum('bij,bj->bi', np.linalg.pinv(XtWX), XtWy)
+
+
+def _block_means(values, length, starts):
+    """Trung bình của các khối liên tiếp [start, start + length) (dùng tổng tích luỹ)."""
+    csum = np.r_[0.0, np.cumsum(values)]
+    return (csum[starts + length] - csum[starts]) / length
+
+
+def bootstrap_effects(X, y, train_mask, event_weights, n_boot=DEFAULT_N_BOOT,
+                      block_len=DEFAULT_BLOCK_LEN, ci=0.95, seed=0):
+    """
+    Khoảng tin cậy bootstrap cho hiệu ứng của nhiều sự kiện cùng lúc.
+
+    - X: (n_days, p) ma trận feature ĐÃ có cột hệ số chặn; y: (n_days,) PM2.5 thực tế.
+    - train_mask: (n_days,) True với ngày dùng để huấn luyện (ngày thường), theo thứ tự thời gian.
+    - event_weights: (n_events, n_days) mặt nạ ngày của từng sự kiện (0/1).
+    Trả về dict các mảng (n_events,): 'effect_se', 'effect_ci_low', 'effect_ci_high', 'effect_p_boot'
+    ('effect_p_boot' = p-value hai phía kiểu bootstrap: 2 x tỉ lệ mẫu trái dấu với trung vị).
+    Sự kiện không có ngày nào trong dữ liệu -> NaN.
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    all_weights = np.asarray(event_weights, dtype=float)
+    has_days = all_weights.sum(axis=1) > 0
+    event_weights = all_weights[has_days]
+    out = {key: np.full(len(all_weights), np.nan)
+           for key in ('effect_se', 'effect_ci_low', 'effect_ci_high', 'effect_p_boot')}
+    if not has_days.any():
+        return out
+    rng = np.random.default_rng(seed)
+
+    X_train, y_train = X[train_mask], y[train_mask]
+    n_train = len(y_train)
+    n_event_days = event_weights.sum(axis=1)
+    event_X_mean = (event_weights @ X) / n_event_days[:, None]         # (E, p)
+    actual_mean = (event_weights @ y) / n_event_days                     # (E,)
+
+    # Phần dư của mô hình gốc trên ngày huấn luyện (theo thứ tự thời gian)
+    base_coef, *_ = np.linalg.lstsq(X_train, y_train, rcond=None)
+    train_resid = y_train - X_train @ base_coef
+
+    effects = np.empty((n_boot, len(event_weights)))
+    for lo in range(0, n_boot, CHUNK_SIZE):
+        b = min(CHUNK_SIZE, n_boot - lo)
+        counts = block_bootstrap_counts(n_train, b, block_len, rng)
+        coefs = batched_weighted_lstsq(X_train, y_train, counts)        # (b, p)
+        cf_mean = coefs @ event_X_mean.T                                 # (b, E)
+
+        # Nhiễu của khung sự kiện: trung bình khối phần dư cùng độ dài sự kiện
+        noise = np.zeros_like(cf_mean)
+        for length in np.unique(n_event_days).astype(int):
+            cols = np.flatnonzero(n_event_days == length)
+            length = min(length, n_train)
+            starts = rng.integers(0, n_train - length + 1, size=(b, len(cols)))
+            noise[:, cols] = _block_means(train_resid, length, starts)
+        effects[lo:lo + b] = cf_mean + noise - actual_mean[None, :]
+
+    alpha = (1 - ci) / 2
+    low, high = np.quantile(effects, [alpha, 1 - alpha], axis=0)
+    median = np.median(effects, axis=0)
+    opposite = np.where(median >= 0, effects < 0, effects > 0).mean(axis=0)
+    out['effect_se'][has_days] = effects.std(axis=0, ddof=1)
+    out['effect_ci_low'][has_days] = low
+    out['effect_ci_high'][has_days] = high
+    out['effect_p_boot'][has_days] = np.minimum(2 * opposite, 1.0)
+    return out
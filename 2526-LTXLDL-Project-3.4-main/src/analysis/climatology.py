@@ -0,0 +1,217 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.cleaning_data_src.artifact_manifest import start_run, end_run, publish_csv
+
+"""
+File: climatology.py
+Mô tả: Đường nền khí hậu (climatology) NHIỀU NĂM cho từng trạm và độ lệch (anomaly) theo ngày.
+
+AQI_index_100 hiện chia mỗi tháng cho trung bình của CHÍNH năm đó. Ở đây mỗi trạm có một
+trạng thái gọn (file .npz) lưu count / sum / sum-of-squares theo (năm x biến x 366 ngày trong năm).
+    - Cập nhật TĂNG DẦN: chỉ đọc các năm mới hoặc file daily đã thay đổi (so mtime);
+      năm đã có thì thay đúng phần đóng góp của năm đó, không gom lại toàn bộ lịch sử.
+    - Đường nền ngày-trong-năm: trung bình trượt VÒNG (cửa sổ 'window' ngày, nối 31/12 với 1/1)
+      tính bằng tổng tích luỹ trên sum và count; đường nền tháng gộp trực tiếp từ 366 ô ngày.
+    - Anomaly: tra bảng vector hoá theo chỉ số ngày-trong-năm (fancy indexing), không groupby.
+Ngày trong năm theo lịch năm nhuận (29/02 luôn là ô 59) để các năm khớp nhau theo ngày/tháng.
+"""
+
+CLIM_COLUMNS = ['temperature_mean', 'precipitation_sum', 'wind_speed_mean', 'air_pressure',
+                'pm10_mean', 'pm2_5_mean', 'ozone_mean', 'carbon_monoxide_mean']
+N_DOY = 366
+# Ô bắt đầu của mỗi tháng trong lịch 366 ngày
+MONTH_STARTS = np.r_[0, np.cumsum([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[:-1]]
+
+
+def leap_day_of_year(index):
+    """Chỉ số 0..365 theo lịch năm nhuận (ngày sau 28/02 của năm thường được dịch thêm 1)."""
+    index = pd.DatetimeIndex(index)
+    doy = index.dayofyear.to_numpy() - 1
+    return doy + ((~index.is_leap_year) & (index.month > 2)).astype(int)
+
+
+def empty_state(columns=None):
+    columns = CLIM_COLUMNS if columns is None else list(columns)
+    shape = (0, len(columns), N_DOY)
+    return {
+        'columns': columns,
+        'years': np.zeros(0, dtype=int),
+        'source_mtime': np.zeros(0),
+        'count': np.zeros(shape),
+        'sum': np.zeros(shape),
+        'sumsq': np.zeros(shape),
+    }
+
+
+def year_contribution(df_daily, columns):
+    """Đóng góp (count, sum, sumsq) của một năm dữ liệu ngày: mảng (biến x 366)."""
+    doy = leap_day_of_year(df_daily.index)
+    out = np.zeros((3, len(columns), N_DOY))
+    for i, col in enumerate(columns):
+        if col not in df_daily.columns:
+            continue
+        values = pd.to_numeric(df_daily[col], errors='coerce').to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        out[0, i] = np.bincount(doy[valid], minlength=N_DOY)
+        out[1, i] = np.bincount(doy[valid], weights=values[valid], minlength=N_DOY)
+        out[2, i] = np.bincount(doy[valid], weights=values[valid] ** 2, minlength=N_DOY)
+    return out
+
+
+def add_year(state, year, df_daily, source_mtime=0.0):
+    """Thêm (hoặc THAY nếu đã có) đóng góp của một năm vào trạng thái."""
+    contrib = year_contribution(df_daily, state['columns'])
+    years = state['years']
+    if year in years:
+        pos = int(np.flatnonzero(years == year)[0])
+        for k, key in enumerate(('count', 'sum', 'sumsq')):
+            state[key][pos] = contrib[k]
+        state['source_mtime'][pos] = source_mtime
+        return state
+    state['years'] = np.append(years, year)
+    state['source_mtime'] = np.append(state['source_mtime'], source_mtime)
+    for k, key in enumerate(('count', 'sum', 'sumsq')):
+        state[key] = np.concatenate([state[key], contrib[k][None]], axis=0)
+    return state
+
+
+def save_state(state, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(path, columns=np.array(state['columns']), years=state['years'],
+                        source_mtime=state['source_mtime'],
+                        count=state['count'], sum=state['sum'], sumsq=state['sumsq'])
+
+
+def load_state(path, columns=None):
+    """Nạp trạng thái; trả về trạng thái rỗng nếu chưa có file hoặc danh sách biến đã đổi."""
+    if not os.path.exists(path):
+        return empty_state(columns)
+    with np.load(path) as data:
+        state = {
+            'columns': data['columns'].tolist(),
+            'years': data['years'],
+            'source_mtime': data['source_mtime'],
+            'count': data['count'],
+            'sum': data['sum'],
+            'sumsq': data['sumsq'],
+        }
+    if columns is not None and list(columns) != state['columns']:
+        print(f"Cảnh báo: Danh sách biến của {path} đã thay đổi, tạo lại climatology.")
+        return empty_state(columns)
+    return state
+
+
+def _circular_window_sum(arr, window):
+    """Tổng trượt vòng (cửa sổ lẻ, căn giữa) trên trục cuối 366 ô, dùng tổng tích luỹ."""
+    half = window // 2
+    padded = np.concatenate([arr[..., -half:], arr, arr[..., :half]], axis=-1) if half else arr
+    csum = np.concatenate([np.zeros(arr.shape[:-1] + (1,)), np.cumsum(padded, axis=-1)], axis=-1)
+    return csum[..., window:] - csum[..., :-window]
+
+
+def doy_baseline(state, window=31, min_count=3):
+    """
+    Đường nền ngày-trong-năm đã làm trơn: (mean, std) dạng mảng (biến x 366).
+    Ô có ít hơn min_count giá trị trong cửa sổ -> NaN.
+    """
+    window = window if window % 2 else window + 1
+    count = _circular_window_sum(state['count'].sum(axis=0), window)
+    total = _circular_window_sum(state['sum'].sum(axis=0), window)
+    total_sq = _circular_window_sum(state['sumsq'].sum(axis=0), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        var = np.clip(total_sq / count - mean ** 2, 0, None) * count / (count - 1)
+    ok = count >= min_count
+    return np.where(ok, mean, np.nan), np.where(ok & (count > 1), np.sqrt(var), np.nan)
+
+
+def month_baseline(state):
+    """Đường nền tháng (trung bình nhiều năm của giá trị ngày): DataFrame index 1..12, cột là biến."""
+    count = np.add.reduceat(state['count'].sum(axis=0), MONTH_STARTS, axis=-1)
+    total = np.add.reduceat(state['sum'].sum(axis=0), MONTH_STARTS, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return pd.DataFrame(mean.T, index=pd.Index(range(1, 13), name='month'), columns=state['columns'])
+
+
+def compute_anomalies(df_daily, state, columns=None, window=31):
+    """
+    Anomaly ngày cho bảng daily (DatetimeIndex): với mỗi biến thêm
+    '<biến>_clim' (đường nền), '<biến>_anom' (giá trị - nền), '<biến>_z' (anom / độ lệch chuẩn nền).
+    """
+    columns = state['columns'] if columns is None else list(columns)
+    mean, std = doy_baseline(state, window=window)
+    doy = leap_day_of_year(df_daily.index)
+    out = pd.DataFrame(index=df_daily.index)
+    for col in columns:
+        if col not in df_daily.columns:
+            continue
+        i = state['columns'].index(col)
+        values = pd.to_numeric(df_daily[col], errors='coerce').to_numpy(dtype=float)
+        clim = mean[i][doy]
+        out[col] = values
+        out[f'{col}_clim'] = clim
+        out[f'{col}_anom'] = values - clim
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[f'{col}_z'] = np.where(std[i][doy] > 0, (values - clim) / std[i][doy], np.nan)
+    return out
+
+
+def _daily_path(processed_dir, lat, lon, year):
+    return f"{processed_dir}/daily_weather_aqi_{lat}_{lon}_{year}.csv"
+
+
+def _read_daily(path):
+    df = pd.read_csv(path)
+    df['time'] = pd.to_datetime(df['time'])
+    return df.set_index('time')
+
+
+def update_station_climatology(lat, lon, years, processed_dir='processed', clim_dir='climatology', columns=None):
+    """
+    Cập nhật climatology của một trạm: chỉ đọc file daily của năm CHƯA có trong trạng thái
+    hoặc có mtime khác lần trước. Trả về trạng thái đã cập nhật (và lưu lại nếu có thay đổi).
+    """
+    path = os.path.join(clim_dir, f"clim_{lat}_{lon}.npz")
+    state = load_state(path, columns)
+    known = dict(zip(state['years'].tolist(), state['source_mtime'].tolist()))
+    changed = 0
+    for year in years:
+        file_path = _daily_path(processed_dir, lat, lon, year)
+        if not os.path.exists(file_path):
+            print(f"Cảnh báo: Không tìm thấy file {file_path}, bỏ qua.")
+            continue
+        mtime = os.path.getmtime(file_path)
+        if known.get(int(year)) == mtime:
+            continue
+        state = add_year(state, int(year), _read_daily(file_path), mtime)
+        changed += 1
+    if changed:
+        save_state(state, path)
+    print(f"Climatology trạm ({lat}, {lon}): {len(state['years'])} năm, cập nhật {changed} năm -> {path}")
+    return state
+
+
+def run_climatology(stations, years, processed_dir='processed', clim_dir='climatology',
+                    output_dir='processed', window=31):
+    """
+    Cập nhật climatology cho các trạm và ghi anomaly ngày của từng (trạm, năm) ra
+    '<output_dir>/anomaly_daily_<lat>_<lon>_<year>.csv'. Trả về dict {(lat, lon): trạng thái}.
+    """
+    states = {}
+    start_run('climatology')
+    for lat, lon in stations:
+        state = update_station_climatology(lat, lon, years, processed_dir, clim_dir)
+        states[(lat, lon)] = state
+        for year in years:
+            file_path = _daily_path(processed_dir, lat, lon, year)
+            if not os.path.exists(file_path):
+                continue
+            anomalies = compute_anomalies(_read_daily(file_path), state, window=window)
+            out_path = f"{output_dir}/anomaly_daily_{lat}_{lon}_{year}.csv"
+            publish_csv(anomalies.round(3).reset_index(), out_path, index=False)
+            print(f" -> Xong file anomaly: {out_path}")
+    end_run()
+    return states
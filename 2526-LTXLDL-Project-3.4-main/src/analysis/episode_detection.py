@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+"""
+File: episode_detection.py
+Mô tả: Phát hiện các "đợt ô nhiễm" (episode) = chuỗi các bước thời gian LIÊN TIẾP
+vượt ngưỡng (ví dụ PM2.5 > 50 µg/m³), dùng được cho dữ liệu giờ hoặc ngày, nhiều trạm cùng lúc.
+
+Thuật toán run-length chạy trong MỘT lượt vector hoá (O(n)), không lặp Python theo từng dòng:
+    1. Sắp xếp theo (trạm, thời gian), đánh dấu các dòng vượt ngưỡng.
+    2. Một đợt mới bắt đầu khi dòng vượt ngưỡng mà dòng trước đó không vượt ngưỡng,
+       hoặc khác trạm, hoặc bị hở thời gian (khác đúng 1 bước).
+    3. Gom theo đợt bằng np.add.reduceat / np.maximum.reduceat.
+"""
+
+EPISODE_COLUMNS = ['station', 'start', 'end', 'duration_steps', 'duration_hours',
+                   'peak', 'peak_time', 'mean', 'excess_sum']
+
+
+def _freq_to_ns(freq):
+    """Đổi bước thời gian ('h', '3h', 'D' hoặc Timedelta) sang nano giây."""
+    if isinstance(freq, str) and not freq[0].isdigit():
+        freq = '1' + freq
+    return pd.Timedelta(freq).value
+
+
+def detect_episodes(df, value_col='pm2_5', threshold=50, min_duration=2, freq=None,
+                    station_col=None, time_col=None):
+    """
+    Trả về bảng các đợt vượt ngưỡng (mỗi dòng một đợt).
+
+    - df: DataFrame dạng dài. Thời gian lấy từ time_col hoặc từ index (DatetimeIndex).
+    - threshold: ngưỡng vượt (giá trị > threshold được tính là vượt).
+    - min_duration: số bước liên tiếp tối thiểu để được tính là một đợt.
+    - freq: bước thời gian ('h', 'D', ...). Mặc định suy ra từ khoảng cách phổ biến nhất.
+    - station_col: cột mã trạm (None = chỉ có một trạm).
+    """
+    times = pd.DatetimeIndex(df[time_col] if time_col else df.index).as_unit('ns')
+    tz = times.tz
+    values = pd.to_numeric(df[value_col], errors='coerce').to_numpy(dtype=float)
+
+    empty = pd.DataFrame(columns=EPISODE_COLUMNS if station_col else EPISODE_COLUMNS[1:])
+
+    if station_col is not None:
+        station_codes, station_labels = pd.factorize(df[station_col], sort=True)
+    else:
+        station_codes = np.zeros(len(df), dtype=np.int64)
+        station_labels = pd.Index([None])
+
+    # 1. Sắp xếp theo (trạm, thời gian)
+    t_ns = times.asi8
+    order = np.lexsort((t_ns, station_codes))
+    t_ns = t_ns[order]
+    values = values[order]
+    station_codes = station_codes[order]
+
+    if freq is not None:
+        step_ns = _freq_to_ns(freq)
+    else:
+        diffs = np.diff(t_ns)[np.diff(station_codes) == 0]
+        diffs = diffs[diffs > 0]
+        if len(diffs) == 0:
+            return empty
+        uniq, counts = np.unique(diffs, return_counts=True)
+        step_ns = int(uniq[np.argmax(counts)])
+
+    # 2. Đánh dấu điểm bắt đầu của mỗi đợt
+    exceed = values > threshold  # NaN > x luôn là False
+    continues = np.zeros(len(values), dtype=bool)
+    continues[1:] = (exceed[:-1]
+                     & (station_codes[1:] == station_codes[:-1])
+                     & (np.diff(t_ns) == step_ns))
+    run_start = exceed & ~continues
+
+    idx = np.flatnonzero(exceed)
+    if len(idx) == 0:
+        return empty
+
+    # 3. Gom theo đợt (reduceat trên các dòng vượt ngưỡng)
+    starts = np.flatnonzero(run_start[idx])
+    lengths = np.diff(np.append(starts, len(idx)))
+    v = values[idx]
+
+    peak = np.maximum.reduceat(v, starts)
+    total = np.add.reduceat(v, starts)
+    run_id = np.repeat(np.arange(len(starts)), lengths)
+    # Thời điểm đỉnh = dòng đầu tiên trong đợt đạt giá trị cực đại
+    is_peak = v == peak[run_id]
+    _, first_peak = np.unique(run_id[is_peak], return_index=True)
+    peak_pos = idx[np.flatnonzero(is_peak)[first_peak]]
+
+    first_pos = idx[starts]
+    last_pos = idx[starts + lengths - 1]
+
+    episodes = pd.DataFrame({
+        'station': station_labels.take(station_codes[first_pos]),
+        'start': pd.to_datetime(t_ns[first_pos]),
+        'end': pd.to_datetime(t_ns[last_pos]),
+        'duration_steps': lengths,
+        'duration_hours': lengths * step_ns / pd.Timedelta(hours=1).value,
+        'peak': peak,
+        'peak_time': pd.to_datetime(t_ns[peak_pos]),
+        'mean': total / lengths,
+        'excess_sum': total - threshold * lengths,
+    })
+    if tz is not None:
+        for col in ['start', 'end', 'peak_time']:
+            episodes[col] = episodes[col].dt.tz_localize('UTC').dt.tz_convert(tz)
+
+    episodes = episodes[episodes['duration_steps'] >= min_duration].reset_index(drop=True)
+    if station_col is None:
+        episodes = episodes.drop(columns='station')
+    return episodes
@@ -0,0 +1,225 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from src.analysis.bootstrap_ci import bootstrap_effects, DEFAULT_N_BOOT, DEFAULT_BLOCK_LEN
+from src.cleaning_data_src.artifact_manifest import start_run, end_run, publish_csv
+
+"""
+File: event_impact.py
+Mô tả: Bộ máy phân tích tác động sự kiện (Tết, ngày lễ, giãn cách...) lên PM2.5,
+tổng quát hoá từ phân tích "Hiệu ứng Tết" trong advanced_analysis.py.
+
+Với mỗi cặp (trạm, năm):
+    1. Huấn luyện MỘT mô hình hồi quy tuyến tính (khí tượng -> PM2.5) trên các ngày
+       KHÔNG thuộc sự kiện nào trong lịch (baseline "nếu không có sự kiện").
+    2. Tính hiệu ứng cho TẤT CẢ sự kiện cùng lúc bằng phép nhân ma trận
+       (ma trận mặt nạ sự kiện x vector phần dư), không lặp từng sự kiện.
+    3. (Tuỳ chọn) Khoảng tin cậy bootstrap khối cho hiệu ứng, giải mọi lần lặp theo lô
+       (xem bootstrap_ci.py).
+Các cặp (trạm, năm) độc lập với nhau nên có thể chạy song song (n_jobs > 1).
+"""
+
+FEATURES = ['precipitation_sum', 'wind_speed_mean', 'temperature_mean', 'air_pressure']
+TARGET = 'pm2_5_mean'
+
+# Ngày mùng 1 Tết Nguyên Đán theo năm dương lịch
+TET_DATES = {
+    2019: '2019-02-05',
+    2020: '2020-01-25',
+    2021: '2021-02-12',
+    2022: '2022-02-01',
+    2023: '2023-01-22',
+    2024: '2024-02-10',
+    2025: '2025-01-29',
+    2026: '2026-02-17',
+    2027: '2027-02-06',
+}
+
+
+def build_tet_events(years=None, days_before=2, days_after=4):
+    """
+    Tạo lịch sự kiện Tết: mặc định từ 29 Tết (mùng 1 - 2 ngày) đến mùng 5 (mùng 1 + 4 ngày),
+    giống khung 08/02 - 14/02/2024 trong advanced_analysis.py.
+    """
+    if years is None:
+        years = sorted(TET_DATES)
+    records = []
+    for year in years:
+        if int(year) not in TET_DATES:
+            print(f"Cảnh báo: Chưa có ngày Tết cho năm {year}. Bỏ qua.")
+            continue
+        tet_day = pd.Timestamp(TET_DATES[int(year)])
+        records.append({
+            'event': f'Tet_{year}',
+            'start': tet_day - pd.Timedelta(days=days_before),
+            'end': tet_day + pd.Timedelta(days=days_after),
+        })
+    return pd.DataFrame(records, columns=['event', 'start', 'end'])
+
+
+def _normalize_events(events):
+    """Chuẩn hoá lịch sự kiện về DataFrame với 3 cột: event, start, end (ngày, không múi giờ)."""
+    if events is None:
+        events = build_tet_events()
+    events = pd.DataFrame(events).copy()
+    missing_cols = {'event', 'start', 'end'} - set(events.columns)
+    if missing_cols:
+        raise ValueError(f"Lịch sự kiện thiếu cột: {sorted(missing_cols)}")
+    for col in ['start', 'end']:
+        events[col] = pd.to_datetime(events[col])
+        if events[col].dt.tz is not None:
+            events[col] = events[col].dt.tz_localize(None)
+        events[col] = events[col].dt.normalize()
+    return events[['event', 'start', 'end']].reset_index(drop=True)
+
+
+def _load_daily(lat, lon, year, processed_dir):
+    """Đọc file daily đã xử lý của một trạm/năm. Trả về None nếu không có file."""
+    file_path = f"{processed_dir}/daily_weather_aqi_{lat}_{lon}_{year}.csv"
+    if not os.path.exists(file_path):
+        print(f"Cảnh báo: Không tìm thấy file dữ liệu: {file_path}. Bỏ qua.")
+        return None
+    df = pd.read_csv(file_path)
+    df['time'] = pd.to_datetime(df['time'])
+    if df['time'].dt.tz is not None:
+        df['time'] = df['time'].dt.tz_localize(None)
+    df['time'] = df['time'].dt.normalize()
+    return df
+
+
+def _event_masks(times, events):
+    """Ma trận mặt nạ (n_events x n_days): True nếu ngày thuộc khung sự kiện."""
+    t = times.to_numpy(dtype='datetime64[ns]')[None, :]
+    starts = events['start'].to_numpy(dtype='datetime64[ns]')[:, None]
+    ends = events['end'].to_numpy(dtype='datetime64[ns]')[:, None]
+    return (t >= starts) & (t <= ends)
+
+
+def _analyze_station_year(lat, lon, year, events, processed_dir, n_boot=0, block_len=DEFAULT_BLOCK_LEN, seed=0):
+    """Tính hiệu ứng của mọi sự kiện trong một (trạm, năm). Trả về list các dòng kết quả."""
+    df = _load_daily(lat, lon, year, processed_dir)
+    if df is None:
+        return []
+
+    data = df[FEATURES + [TARGET, 'time']].dropna().reset_index(drop=True)
+    if data.empty:
+        return []
+
+    # Chỉ giữ các sự kiện giao với khoảng dữ liệu của năm này
+    in_range = (events['end'] >= data['time'].min()) & (events['start'] <= data['time'].max())
+    year_events = events.loc[in_range].reset_index(drop=True)
+    if year_events.empty:
+        return []
+
+    masks = _event_masks(data['time'], year_events)
+    train_mask = ~masks.any(axis=0)
+    n_train = int(train_mask.sum())
+    if n_train <= len(FEATURES) + 1:
+        print(f"Cảnh báo: Không đủ ngày huấn luyện cho ({lat}, {lon}, {year}). Bỏ qua.")
+        return []
+
+    # Hồi quy tuyến tính bằng bình phương tối thiểu (thêm cột hệ số chặn)
+    X = np.column_stack([np.ones(len(data)), data[FEATURES].to_numpy(dtype=float)])
+    y = data[TARGET].to_numpy(dtype=float)
+    coef, *_ = np.linalg.lstsq(X[train_mask], y[train_mask], rcond=None)
+
+    y_pred = X @ coef
+    residual = y_pred - y
+
+    train_resid = y[train_mask] - y_pred[train_mask]
+    ss_res = float(np.sum(train_resid ** 2))
+    ss_tot = float(np.sum((y[train_mask] - y[train_mask].mean()) ** 2))
+    train_r2 = 1 - ss_res / ss_tot if ss_tot > 0 else np.nan
+    resid_std = float(np.std(train_resid, ddof=len(coef)))
+
+    # Tính cho tất cả sự kiện cùng lúc: (n_events x n_days) @ (n_days,)
+    w = masks.astype(float)
+    n_days = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        actual_mean = (w @ y) / n_days
+        cf_mean = (w @ y_pred) / n_days
+        effect = (w @ residual) / n_days
+        effect_pct = effect / cf_mean * 100
+        effect_z = effect / resid_std if resid_std > 0 else np.full_like(effect, np.nan)
+
+    boot = None
+    if n_boot:
+        boot = bootstrap_effects(X, y, train_mask, w, n_boot=n_boot, block_len=block_len, seed=seed)
+
+    results = []
+    for i, ev in year_events.iterrows():
+        if n_days[i] == 0:
+            continue
+        results.append({
+            'lat': lat,
+            'lon': lon,
+            'year': year,
+            'event': ev['event'],
+            'start': ev['start'].date(),
+            'end': ev['end'].date(),
+            'n_event_days': int(n_days[i]),
+            'actual_mean': actual_mean[i],
+            'counterfactual_mean': cf_mean[i],
+            'effect': effect[i],
+            'effect_pct': effect_pct[i],
+            'effect_z': effect_z[i],
+            'train_days': n_train,
+            'train_r2': train_r2,
+        })
+        if boot is not None:
+            results[-1].update({key: values[i] for key, values in boot.items()})
+    return results
+
+
+def run_event_impact_analysis(stations, years, events=None, processed_dir='processed',
+                              output_path='reports/event_impact_summary.csv', n_jobs=1,
+                              n_boot=DEFAULT_N_BOOT, block_len=DEFAULT_BLOCK_LEN, seed=0):
+    """
+    Chạy phân tích tác động cho tất cả sự kiện x trạm x năm, gom vào MỘT bảng kết quả.
+
+    - stations: danh sách (lat, lon), ví dụ [("10.823", "106.6296")]
+    - years: danh sách năm, ví dụ ["2023", "2024"]
+    - events: DataFrame/list dict có cột 'event', 'start', 'end'.
+      Mặc định dùng lịch Tết (build_tet_events()).
+    - n_jobs: số tiến trình chạy song song (1 = chạy tuần tự).
+    - n_boot: số lần lặp bootstrap khối (khối 'block_len' ngày) cho khoảng tin cậy 95%
+      (cột effect_se, effect_ci_low, effect_ci_high, effect_p_boot); 0 = bỏ qua.
+
+    'effect' = trung bình (dự báo - thực tế) trong khung sự kiện (µg/m³).
+    Giá trị dương nghĩa là PM2.5 thực tế THẤP hơn baseline khí tượng.
+    """
+    print("\n BẮT ĐẦU PHÂN TÍCH TÁC ĐỘNG SỰ KIỆN (EVENT IMPACT)")
+    events = _normalize_events(events)
+    cases = [(lat, lon, year) for (lat, lon) in stations for year in years]
+    print(f"Số trường hợp (trạm x năm): {len(cases)} | Số sự kiện trong lịch: {len(events)}")
+
+    all_rows = []
+    if n_jobs is not None and n_jobs > 1 and len(cases) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_analyze_station_year, lat, lon, year, events, processed_dir,
+                                       n_boot, block_len, seed)
+                       for (lat, lon, year) in cases]
+            for future in futures:
+                all_rows.extend(future.result())
+    else:
+        for (lat, lon, year) in cases:
+            all_rows.extend(_analyze_station_year(lat, lon, year, events, processed_dir,
+                                                  n_boot, block_len, seed))
+
+    result_df = pd.DataFrame(all_rows)
+    if result_df.empty:
+        print("Lỗi: Không có sự kiện nào được phân tích.")
+        return result_df
+
+    result_df = result_df.sort_values(['lat', 'lon', 'year', 'start']).reset_index(drop=True)
+
+    if output_path:
+        # Qua manifest: chỉ ghi lại khi bảng kết quả thay đổi
+        start_run('event_impact')
+        publish_csv(result_df.round(3), output_path, index=False)
+        end_run()
+        print(f"Đã lưu bảng tác động sự kiện ({len(result_df)} dòng): {output_path}")
+
+    return result_df
@@ -0,0 +1,252 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.cleaning_data_src.columnar_cache import TIME_FILE, META_FILE, CACHE_TZ, load_columnar_cache
+
+"""
+File: feature_store.py
+Mô tả: Kho feature (feature store) theo NGÀY cho từng trạm, tính sẵn MỘT lần mỗi lần chạy pipeline
+để các mô hình (advanced_analysis.py, forecast_models.py) đọc thẳng ma trận thay vì dựng lại từ CSV.
+
+    - Feature: các cột gốc của file daily, LAG theo ngày lịch (pm2_5_mean_lag1, ...),
+      cửa sổ TRƯỢT kết thúc tại ngày hiện tại (pm2_5_mean_roll7_mean, precipitation_sum_roll3_sum, ...),
+      feature LỊCH (thứ trong tuần, ngày trong năm dạng sin/cos, cuối tuần, tháng)
+      và nhãn dự báo 'target_pm2_5_next_day' (PM2.5 của ngày hôm sau).
+    - Tính trên lưới ngày LIÊN TỤC (ngày thiếu là NaN) nên lag k luôn là "k ngày trước", không ghép nhầm
+      qua chỗ thiếu. Cửa sổ trượt dùng sliding_window_view: mỗi cửa sổ tính độc lập (không cộng dồn),
+      cửa sổ có ngày thiếu -> NaN.
+    - Lưu dạng CỘT giống columnar_cache.py: <store_dir>/<lat>_<lon>/time.npy + <cột>.npy + meta.json
+      (meta ghi sau cùng), đọc lại bằng memory-map qua load_columnar_cache().
+    - Cập nhật TĂNG DẦN: file daily không đổi (so mtime) thì không đọc lại; có ngày mới / ngày bị sửa thì
+      chỉ tính lại từ ngày thay đổi sớm nhất (kèm đoạn lịch sử LOOKBACK_DAYS ngày làm ngữ cảnh).
+      Kết quả giống hệt tính lại toàn bộ.
+"""
+
+BASE_COLUMNS = ['pm2_5_mean', 'pm10_mean', 'precipitation_sum', 'wind_speed_mean',
+                'temperature_mean', 'air_pressure']
+LAG_SPEC = {
+    'pm2_5_mean': [1, 2, 3, 7],
+    'precipitation_sum': [1],
+    'wind_speed_mean': [1],
+}
+# (cột, phép gộp, số ngày) — cửa sổ gồm ngày hiện tại và (số ngày - 1) ngày trước đó
+ROLLING_SPEC = [
+    ('pm2_5_mean', 'mean', 3),
+    ('pm2_5_mean', 'mean', 7),
+    ('pm2_5_mean', 'std', 7),
+    ('precipitation_sum', 'sum', 3),
+    ('precipitation_sum', 'sum', 7),
+    ('wind_speed_mean', 'mean', 3),
+    ('temperature_mean', 'mean', 7),
+]
+CALENDAR_COLUMNS = ['dow_sin', 'dow_cos', 'doy_sin', 'doy_cos', 'is_weekend', 'month']
+TARGET_COLUMN = 'target_pm2_5_next_day'
+HORIZON_DAYS = 1
+
+LAG_COLUMNS = [f"{col}_lag{k}" for col, lags in LAG_SPEC.items() for k in lags]
+ROLLING_COLUMNS = [f"{col}_roll{w}_{how}" for col, how, w in ROLLING_SPEC]
+FEATURE_COLUMNS = BASE_COLUMNS + LAG_COLUMNS + ROLLING_COLUMNS + CALENDAR_COLUMNS
+STORE_COLUMNS = FEATURE_COLUMNS + [TARGET_COLUMN]
+
+# Số ngày lịch sử cần để tính đúng feature của một ngày (lag / cửa sổ dài nhất)
+LOOKBACK_DAYS = max([k for lags in LAG_SPEC.values() for k in lags] + [w - 1 for _, _, w in ROLLING_SPEC])
+
+# Bộ feature mặc định cho mô hình PM2.5 ngày hôm sau khi đọc từ kho
+MODEL_FEATURES = ['pm2_5_mean', 'precipitation_sum', 'wind_speed_mean', 'temperature_mean', 'air_pressure',
+                  'pm2_5_mean_lag1', 'pm2_5_mean_lag7', 'pm2_5_mean_roll7_mean', 'precipitation_sum_roll3_sum',
+                  'dow_sin', 'dow_cos', 'doy_sin', 'doy_cos']
+
+
+def store_path(store_dir, lat, lon):
+    return os.path.join(store_dir, f"{lat}_{lon}")
+
+
+def compute_features(base):
+    """
+    Tính toàn bộ cột feature từ bảng cột gốc 'base' (index: lưới ngày LIÊN TỤC, múi giờ Việt Nam).
+    Trả về DataFrame cùng index, cột theo STORE_COLUMNS.
+    """
+    n = len(base)
+    out = {col: base[col].to_numpy(dtype=float) for col in BASE_COLUMNS}
+
+    for col, lags in LAG_SPEC.items():
+        values = out[col]
+        for k in lags:
+            lagged = np.full(n, np.nan)
+            lagged[k:] = values[:n - k] if k < n else []
+            out[f"{col}_lag{k}"] = lagged
+
+    for col, how, w in ROLLING_SPEC:
+        rolled = np.full(n, np.nan)
+        if n >= w:
+            windows = sliding_window_view(out[col], w)                 # (n - w + 1, w), không copy
+            if how == 'mean':
+                rolled[w - 1:] = windows.mean(axis=1)
+            elif how == 'sum':
+                rolled[w - 1:] = windows.sum(axis=1)
+            else:
+                rolled[w - 1:] = windows.std(axis=1, ddof=1)
+        out[f"{col}_roll{w}_{how}"] = rolled
+
+    dow = base.index.dayofweek.to_numpy()
+    doy = base.index.dayofyear.to_numpy() - 1
+    days_in_year = np.where(base.index.is_leap_year, 366, 365)
+    out['dow_sin'] = np.sin(2 * np.pi * dow / 7)
+    out['dow_cos'] = np.cos(2 * np.pi * dow / 7)
+    out['doy_sin'] = np.sin(2 * np.pi * doy / days_in_year)
+    out['doy_cos'] = np.cos(2 * np.pi * doy / days_in_year)
+    out['is_weekend'] = (dow >= 5).astype(float)
+    out['month'] = base.index.month.to_numpy().astype(float)
+
+    target = np.full(n, np.nan)
+    target[:n - HORIZON_DAYS] = out['pm2_5_mean'][HORIZON_DAYS:]
+    out[TARGET_COLUMN] = target
+    return pd.DataFrame(out, index=base.index)[STORE_COLUMNS]
+
+
+def _read_daily_base(path):
+    """Đọc các cột gốc của file daily; index là nửa đêm theo giờ Việt Nam."""
+    df = pd.read_csv(path, usecols=lambda c: c == 'time' or c in BASE_COLUMNS)
+    index = pd.DatetimeIndex(pd.to_datetime(df['time']))
+    index = index.tz_localize('UTC') if index.tz is None else index
+    df.index = index.tz_convert(CACHE_TZ).normalize()
+    return df.drop(columns='time').reindex(columns=BASE_COLUMNS)
+
+
+def _load_meta(path):
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_array(path, name, values):
+    """np.save nguyên tử (file tạm + os.replace) để tiến trình đang đọc memmap không thấy file ghi dở."""
+    tmp_path = os.path.join(path, f"{name}.npy.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+
+def save_store(path, table, sources):
+    """Ghi bảng feature (index: lưới ngày) ra các file cột + meta.json (ghi SAU CÙNG)."""
+    os.makedirs(path, exist_ok=True)
+    _save_array(path, os.path.splitext(TIME_FILE)[0], table.index.tz_convert('UTC').as_unit('ns').asi8.astype(np.int64))
+    for col in STORE_COLUMNS:
+        _save_array(path, col, table[col].to_numpy(dtype=np.float64))
+    meta = {
+        'columns': STORE_COLUMNS,
+        'tz': CACHE_TZ,
+        'n_rows': len(table),
+        'first_day': table.index[0].strftime('%Y-%m-%d'),
+        'last_day': table.index[-1].strftime('%Y-%m-%d'),
+        'lookback_days': LOOKBACK_DAYS,
+        'sources': sources,
+    }
+    tmp_path = os.path.join(path, META_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+    return meta
+
+
+def merge_and_recompute(stored, new_base):
+    """
+    Ghép dữ liệu ngày mới vào bảng feature đã lưu (ngày trùng: dữ liệu mới thắng) và chỉ tính lại
+    các dòng từ ngày thay đổi sớm nhất. Trả về (bảng mới, số dòng được tính lại).
+    """
+    new_base = new_base[~new_base.index.duplicated(keep='last')]
+    if stored is None or stored.empty:
+        start = new_base.index.min()
+        end = new_base.index.max()
+    else:
+        start = min(stored.index.min(), new_base.index.min())
+        end = max(stored.index.max(), new_base.index.max())
+    grid = pd.date_range(start, end, freq='D')
+
+    old = (pd.DataFrame(index=grid, columns=STORE_COLUMNS, dtype=float) if stored is None
+           else stored.reindex(grid))
+    old_base = old[BASE_COLUMNS].to_numpy(dtype=float)
+    merged_base = old[BASE_COLUMNS].copy()
+    merged_base.loc[new_base.index, BASE_COLUMNS] = new_base[BASE_COLUMNS].to_numpy(dtype=float)
+    merged_values = merged_base.to_numpy(dtype=float)
+
+    same = (old_base == merged_values) | (np.isnan(old_base) & np.isnan(merged_values))
+    changed = ~same.all(axis=1)
+    if stored is not None:
+        changed |= ~grid.isin(stored.index)
+    else:
+        changed[:] = True
+    if not changed.any():
+        return old, 0
+
+    first = int(np.argmax(changed))
+    # Nhãn ngày hôm sau phụ thuộc ngày sau -> tính lại từ trước ngày thay đổi HORIZON_DAYS ngày
+    recompute_from = max(first - HORIZON_DAYS, 0)
+    context_from = max(recompute_from - LOOKBACK_DAYS, 0)
+    fresh = compute_features(merged_base.iloc[context_from:])
+    table = old.copy()
+    table.iloc[recompute_from:] = fresh.iloc[recompute_from - context_from:].to_numpy()
+    return table, len(grid) - recompute_from
+
+
+def load_feature_store(lat, lon, store_dir='features', columns=None, start=None, end=None):
+    """
+    Nạp kho feature của trạm (memmap, chỉ đọc) -> DataFrame index là ngày. None nếu chưa có kho.
+    start / end (tuỳ chọn): lọc khoảng ngày, ví dụ '2024-01-01'.
+    """
+    path = store_path(store_dir, lat, lon)
+    if _load_meta(path) is None:
+        return None
+    table = load_columnar_cache(path, columns)
+    table.index.name = 'time'
+    if start is not None or end is not None:
+        table = table.loc[start:end]
+    return table
+
+
+def training_matrix(table, features, target=TARGET_COLUMN):
+    """Ma trận (X, y) đã bỏ dòng thiếu — đọc thẳng từ kho, không dựng lại feature."""
+    data = table[list(features) + [target]].dropna()
+    return data[list(features)], data[target]
+
+
+def update_feature_store(lat, lon, years, processed_dir='processed', store_dir='features'):
+    """
+    Cập nhật kho feature của một trạm từ các file daily: chỉ đọc file mới hoặc đã đổi (so mtime),
+    chỉ tính lại các ngày bị ảnh hưởng. Trả về meta của kho (None nếu không có dữ liệu).
+    """
+    path = store_path(store_dir, lat, lon)
+    meta = _load_meta(path)
+    if meta is not None and meta.get('columns') != STORE_COLUMNS:
+        # Danh sách feature đã đổi -> dựng lại toàn bộ kho
+        meta = None
+    sources = dict(meta['sources']) if meta else {}
+
+    frames = []
+    for year in years:
+        file_path = f"{processed_dir}/daily_weather_aqi_{lat}_{lon}_{year}.csv"
+        if not os.path.exists(file_path):
+            print(f"Cảnh báo: Không tìm thấy file {file_path}, bỏ qua.")
+            continue
+        mtime = os.path.getmtime(file_path)
+        if sources.get(file_path) == mtime:
+            continue
+        frames.append(_read_daily_base(file_path))
+        sources[file_path] = mtime
+
+    if not frames:
+        if meta is not None:
+            print(f"Kho feature trạm ({lat}, {lon}): không có ngày mới ({meta['n_rows']} ngày) -> {path}")
+        return meta
+
+    stored = load_columnar_cache(path).copy() if meta else None
+    table, n_recomputed = merge_and_recompute(stored, pd.concat(frames))
+    meta = save_store(path, table, sources)
+    print(f"Kho feature trạm ({lat}, {lon}): {meta['n_rows']} ngày, tính lại {n_recomputed} ngày, "
+          f"{len(FEATURE_COLUMNS)} feature -> {path}")
+    return meta
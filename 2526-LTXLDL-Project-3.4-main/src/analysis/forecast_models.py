@@ -0,0 +1,236 @@
+import os
+import json
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from src.analysis.feature_store import MODEL_FEATURES, load_feature_store, training_matrix
+
+"""
+File: forecast_models.py
+Mô tả: Mô hình dự báo PM2.5 NGÀY HÔM SAU cho từng trạm, được LƯU lại để dùng nhiều lần.
+
+    - train_forecast_model(): huấn luyện LinearRegression trên kho feature của trạm (feature_store.py,
+      có lag / cửa sổ trượt / lịch); nếu trạm chưa có kho thì dựng từ file daily (một hoặc nhiều năm).
+      Lưu ra models/pm25_next_day_<lat>_<lon>.json gồm hệ số, intercept, danh sách feature
+      (schema), khoảng thời gian huấn luyện và sai số trên tập huấn luyện.
+    - ForecastModelStore: nạp mô hình LƯỜI (lazy) khi được hỏi tới, giữ các mô hình "nóng"
+      trong bộ đệm LRU, tự nạp lại nếu file mô hình được huấn luyện lại (mtime thay đổi).
+      predict() dự báo cho CẢ LÔ trạm trong một phép tính vector hoá (ma trận hệ số x ma trận feature),
+      không gọi model.predict() từng trạm.
+
+Mô hình được lưu dạng JSON (chỉ gồm các con số) thay vì pickle nên an toàn khi nạp
+và đọc được bằng mắt.
+"""
+
+FEATURES = ['pm2_5_mean', 'precipitation_sum', 'wind_speed_mean', 'temperature_mean', 'air_pressure']
+TARGET = 'pm2_5_mean'
+HORIZON_DAYS = 1
+MODEL_KIND = 'pm25_next_day'
+
+
+def station_key(lat, lon):
+    return f"{lat}_{lon}"
+
+
+def model_path(models_dir, station):
+    return os.path.join(models_dir, f"{MODEL_KIND}_{station}.json")
+
+
+def _load_daily_years(lat, lon, years, processed_dir):
+    """Ghép file daily của các năm (bỏ qua năm không có file), index là ngày, sắp xếp tăng dần."""
+    frames = []
+    for year in years:
+        file_path = f"{processed_dir}/daily_weather_aqi_{lat}_{lon}_{year}.csv"
+        if not os.path.exists(file_path):
+            print(f"Cảnh báo: Không tìm thấy file {file_path}, bỏ qua.")
+            continue
+        df = pd.read_csv(file_path, usecols=lambda c: c == 'time' or c in FEATURES)
+        df['time'] = pd.to_datetime(df['time'])
+        frames.append(df.set_index('time'))
+    if not frames:
+        return None
+    df = pd.concat(frames)
+    return df[~df.index.duplicated(keep='last')].sort_index()
+
+
+def build_training_set(df_daily, features=None, horizon_days=HORIZON_DAYS):
+    """
+    Cặp (feature ngày t, PM2.5 ngày t + horizon). Chỉ giữ cặp mà ngày t + horizon thực sự
+    có trong dữ liệu (không ghép nhầm qua chỗ thiếu ngày).
+    """
+    features = FEATURES if features is None else list(features)
+    target_time = df_daily.index + pd.Timedelta(days=horizon_days)
+    y = df_daily[TARGET].reindex(target_time).to_numpy()
+    data = df_daily[features].assign(target=y).dropna()
+    return data[features], data['target']
+
+
+def _store_years(lat, lon, years, store_dir):
+    """Bảng feature của trạm trong khoảng các năm 'years' (None nếu chưa có kho)."""
+    if store_dir is None:
+        return None
+    years = sorted(str(y) for y in years)
+    return load_feature_store(lat, lon, store_dir, start=f"{years[0]}-01-01", end=f"{years[-1]}-12-31")
+
+
+def train_forecast_model(lat, lon, years, processed_dir='processed', models_dir='models', features=None,
+                         store_dir='features'):
+    """Huấn luyện và lưu mô hình dự báo PM2.5 ngày hôm sau cho một trạm. Trả về dict mô hình."""
+    table = _store_years(lat, lon, years, store_dir)
+    if table is not None:
+        # Đọc thẳng ma trận đã tính sẵn trong kho feature
+        features = MODEL_FEATURES if features is None else list(features)
+        X, y = training_matrix(table, features)
+        feature_source = 'feature_store'
+    else:
+        features = FEATURES if features is None else list(features)
+        df_daily = _load_daily_years(lat, lon, years, processed_dir)
+        if df_daily is None:
+            print("Lỗi: Không có dữ liệu daily để huấn luyện.")
+            return None
+        X, y = build_training_set(df_daily, features)
+        feature_source = 'daily_csv'
+    if len(X) <= len(features):
+        print(f"Lỗi: Quá ít ngày để huấn luyện ({len(X)} cặp).")
+        return None
+
+    model = LinearRegression()
+    model.fit(X, y)
+    y_fit = model.predict(X)
+
+    station = station_key(lat, lon)
+    record = {
+        'kind': MODEL_KIND,
+        'station': station,
+        'lat': float(lat),
+        'lon': float(lon),
+        'target': TARGET,
+        'horizon_days': HORIZON_DAYS,
+        'features': features,
+        'feature_source': feature_source,
+        'coef': [float(c) for c in model.coef_],
+        'intercept': float(model.intercept_),
+        'train_start': X.index.min().strftime('%Y-%m-%d'),
+        'train_end': X.index.max().strftime('%Y-%m-%d'),
+        'n_train': int(len(X)),
+        'train_mae': float(mean_absolute_error(y, y_fit)),
+        'train_r2': float(r2_score(y, y_fit)),
+        'trained_at': pd.Timestamp.now(tz='UTC').isoformat(),
+    }
+
+    os.makedirs(models_dir, exist_ok=True)
+    path = model_path(models_dir, station)
+    # Ghi file tạm rồi os.replace để tiến trình đang dự báo không đọc phải file ghi dở
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+    print(f"Đã lưu mô hình dự báo PM2.5 ngày hôm sau ({record['n_train']} ngày, "
+          f"MAE={record['train_mae']:.2f}): {path}")
+    return record
+
+
+class ForecastModelStore:
+    """
+    Kho mô hình dự báo: nạp lười từ 'models_dir', giữ tối đa 'max_models' mô hình trong bộ đệm LRU.
+    """
+
+    def __init__(self, models_dir='models', max_models=128, check_interval=60.0):
+        self.models_dir = models_dir
+        self.max_models = max_models
+        # Chỉ kiểm tra mtime file tối đa mỗi 'check_interval' giây cho mỗi mô hình
+        self.check_interval = check_interval
+        self._cache = OrderedDict()  # station -> (mtime, checked_at, record, coef, intercept)
+
+    def _load(self, station):
+        path = model_path(self.models_dir, station)
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        entry = (mtime, time.monotonic(), record,
+                 np.asarray(record['coef'], dtype=float), float(record['intercept']))
+        self._cache[station] = entry
+        self._cache.move_to_end(station)
+        if len(self._cache) > self.max_models:
+            self._cache.popitem(last=False)
+        return entry
+
+    def get(self, station):
+        """Trả về entry của trạm (nạp nếu chưa có / file đã đổi); None nếu trạm chưa có mô hình."""
+        entry = self._cache.get(station)
+        if entry is not None:
+            self._cache.move_to_end(station)
+            if time.monotonic() - entry[1] < self.check_interval:
+                return entry
+            path = model_path(self.models_dir, station)
+            if os.path.exists(path) and os.path.getmtime(path) == entry[0]:
+                self._cache[station] = (entry[0], time.monotonic()) + entry[2:]
+                return self._cache[station]
+        if not os.path.exists(model_path(self.models_dir, station)):
+            self._cache.pop(station, None)
+            return None
+        return self._load(station)
+
+    def metadata(self, station):
+        entry = self.get(station)
+        return None if entry is None else entry[2]
+
+    def predict(self, features_df):
+        """
+        Dự báo PM2.5 ngày hôm sau cho nhiều trạm trong MỘT lần gọi.
+        - features_df: index là mã trạm ('<lat>_<lon>'), cột là feature của ngày hiện tại
+          (ít nhất các cột trong FEATURES). Có thể có cột 'time' (ngày của feature).
+        Trả về DataFrame: station, [time, forecast_time], pm2_5_pred, model_train_end.
+        Trạm không có mô hình hoặc thiếu feature -> pm2_5_pred = NaN.
+        """
+        stations = [str(s) for s in features_df.index]
+        entries = [self.get(s) for s in stations]
+
+        # Gom các mô hình có cùng schema feature để nhân ma trận một lần
+        pred = np.full(len(stations), np.nan)
+        train_end = np.full(len(stations), None, dtype=object)
+        schemas = {}
+        for i, entry in enumerate(entries):
+            if entry is not None:
+                schemas.setdefault(tuple(entry[2]['features']), []).append(i)
+                train_end[i] = entry[2]['train_end']
+
+        for schema, rows in schemas.items():
+            if any(c not in features_df.columns for c in schema):
+                continue  # thiếu cột feature của schema -> các trạm này giữ NaN
+            rows = np.asarray(rows)
+            X = features_df[list(schema)].to_numpy(dtype=float)[rows]          # (n, F)
+            W = np.stack([entries[i][3] for i in rows])                          # (n, F)
+            b = np.asarray([entries[i][4] for i in rows])                        # (n,)
+            pred[rows] = np.einsum('nf,nf->n', X, W) + b
+
+        out = pd.DataFrame({'station': stations})
+        if 'time' in features_df.columns:
+            out['time'] = pd.to_datetime(features_df['time']).to_numpy()
+            out['forecast_time'] = out['time'] + pd.Timedelta(days=HORIZON_DAYS)
+        out['pm2_5_pred'] = pred
+        out['model_train_end'] = train_end
+        return out
+
+
+def latest_features(lat, lon, year, processed_dir='processed', features=None, store_dir='features'):
+    """Feature của ngày mới nhất có đủ dữ liệu (kho feature, hoặc file daily nếu chưa có kho) — đầu vào cho predict."""
+    df_daily = _store_years(lat, lon, [year], store_dir)
+    if df_daily is not None:
+        features = MODEL_FEATURES if features is None else list(features)
+    else:
+        features = FEATURES if features is None else list(features)
+        df_daily = _load_daily_years(lat, lon, [year], processed_dir)
+        if df_daily is None:
+            return None
+    row = df_daily[features].dropna().tail(1)
+    if row.empty:
+        return None
+    out = row.reset_index()
+    out.index = [station_key(lat, lon)]
+    return out
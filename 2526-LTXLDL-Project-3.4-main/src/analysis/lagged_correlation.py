@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+"""
+File: lagged_correlation.py
+Mô tả: Tương quan chéo CÓ ĐỘ TRỄ (lagged cross-correlation) giữa các yếu tố khí tượng
+(mưa, gió, áp suất, nhiệt độ) và chất ô nhiễm (PM2.5, PM10, Ozone, CO), trên nhiều trạm.
+
+corr(lag) = Pearson( driver[t], pollutant[t + lag] ), lag > 0 nghĩa là khí tượng ĐI TRƯỚC ô nhiễm.
+
+Thay vì lặp từng lag (O(T x L) cho mỗi cặp), tất cả các tổng cần cho Pearson
+(n, Σx, Σy, Σx², Σy², Σxy trên các cặp cùng có dữ liệu) được tính cho MỌI lag bằng
+tích chập FFT (O(T log T)), vector hoá trên mảng (trạm x driver x pollutant x tần số).
+Giá trị thiếu (NaN) được xử lý đúng nhờ mặt nạ (mask) trong các tích chập.
+Mảng phổ phức có kích thước (trạm x driver x pollutant x n_fft) nên các trạm được xử lý theo
+từng nhóm (chunk_size trạm một lần); kết quả mỗi nhóm được ghi nối tiếp vào bảng kết quả.
+"""
+
+DRIVERS = ['prcp', 'wspd', 'pres', 'temp']
+POLLUTANTS = ['pm2_5', 'pm10', 'ozone', 'carbon_monoxide']
+
+
+def _to_regular_grid(df, freq):
+    """Bỏ trùng lặp, sắp xếp và đưa về lưới thời gian đều (giờ thiếu -> NaN)."""
+    df = df[~df.index.duplicated(keep='first')].sort_index()
+    return df.asfreq(freq)
+
+
+def _stack(frames, columns, length):
+    """Xếp các chuỗi thành mảng (trạm x biến x thời gian), đệm NaN cho đủ độ dài."""
+    out = np.full((len(frames), len(columns), length), np.nan)
+    for i, df in enumerate(frames):
+        out[i, :, :len(df)] = df[columns].to_numpy(dtype=float).T
+    return out
+
+
+def _cross_sums(a, b, n_fft, max_lag):
+    """
+    c[..., L] = Σ_t a[..., t] * b[..., t + L] cho L = -max_lag..max_lag, tính bằng FFT.
+    a: (S, D, 1, T), b: (S, 1, P, T) -> kết quả (S, D, P, 2*max_lag + 1).
+    """
+    fa = np.fft.rfft(a, n=n_fft, axis=-1)
+    fb = np.fft.rfft(b, n=n_fft, axis=-1)
+    full = np.fft.irfft(np.conj(fa) * fb, n=n_fft, axis=-1)
+    # Lag dương nằm ở đầu mảng, lag âm quay vòng về cuối mảng
+    return np.concatenate([full[..., n_fft - max_lag:], full[..., :max_lag + 1]], axis=-1)
+
+
+def _grid_length(df, freq):
+    """Số bước của lưới đều mà _to_regular_grid sẽ tạo (không cần dựng lưới)."""
+    if len(df) == 0:
+        return 0
+    return len(pd.date_range(df.index.min(), df.index.max(), freq=freq))
+
+
+def _chunk_correlation(grids, drivers, pollutants, length, max_lag, n_fft, min_pairs):
+    """Tương quan cho một nhóm trạm -> (n, corr) dạng (S, D, P, 2*max_lag + 1)."""
+    x = _stack(grids, drivers, length)      # (S, D, T)
+    y = _stack(grids, pollutants, length)   # (S, P, T)
+
+    # Chuẩn hoá từng chuỗi (giảm sai số số học khi trừ các tổng lớn)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = (x - np.nanmean(x, axis=-1, keepdims=True)) / np.nanstd(x, axis=-1, keepdims=True)
+        y = (y - np.nanmean(y, axis=-1, keepdims=True)) / np.nanstd(y, axis=-1, keepdims=True)
+
+    mx = (~np.isnan(x)).astype(float)[:, :, None, :]
+    my = (~np.isnan(y)).astype(float)[:, None, :, :]
+    x0 = np.nan_to_num(x)[:, :, None, :]
+    y0 = np.nan_to_num(y)[:, None, :, :]
+
+    n = _cross_sums(mx, my, n_fft, max_lag)
+    sx = _cross_sums(x0, my, n_fft, max_lag)
+    sy = _cross_sums(mx, y0, n_fft, max_lag)
+    sxx = _cross_sums(x0 ** 2, my, n_fft, max_lag)
+    syy = _cross_sums(mx, y0 ** 2, n_fft, max_lag)
+    sxy = _cross_sums(x0, y0, n_fft, max_lag)
+
+    n = np.rint(n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sxy - sx * sy
+        var_x = n * sxx - sx ** 2
+        var_y = n * syy - sy ** 2
+        corr = cov / np.sqrt(var_x * var_y)
+    corr = np.where((n >= min_pairs) & (var_x > 0) & (var_y > 0), np.clip(corr, -1, 1), np.nan)
+    return n, corr
+
+
+def lagged_cross_correlation(frames, drivers=None, pollutants=None, max_lag=72, freq='h', min_pairs=24,
+                             chunk_size=8):
+    """
+    Tính tương quan chéo có độ trễ cho mọi cặp (driver, pollutant) trên mọi trạm.
+
+    - frames: dict {trạm: DataFrame} hoặc một DataFrame (một trạm). Mỗi DataFrame có
+      DatetimeIndex và chứa cả cột khí tượng lẫn cột ô nhiễm (ví dụ bảng giờ đã ghép).
+    - max_lag: độ trễ tối đa (tính theo số bước 'freq'), xét cả lag âm và dương.
+    - min_pairs: số cặp tối thiểu để trả về hệ số tương quan (ít hơn -> NaN).
+    - chunk_size: số trạm tính FFT cùng lúc (giới hạn bộ nhớ ~ chunk_size x driver x pollutant x n_fft
+      số phức); kết quả không phụ thuộc chunk_size.
+
+    Trả về bảng dạng dài: station, driver, pollutant, lag, lag_hours, n_pairs, corr.
+    """
+    drivers = DRIVERS if drivers is None else list(drivers)
+    pollutants = POLLUTANTS if pollutants is None else list(pollutants)
+    if isinstance(frames, pd.DataFrame):
+        frames = {'station': frames}
+    if chunk_size < 1:
+        raise ValueError("chunk_size phải >= 1.")
+
+    station_names = list(frames)
+    columns = ['station', 'driver', 'pollutant', 'lag', 'lag_hours', 'n_pairs', 'corr']
+    # Độ dài lưới chung của MỌI trạm -> cùng max_lag / n_fft cho mọi nhóm
+    length = max((_grid_length(frames[name], freq) for name in station_names), default=0)
+    if length == 0:
+        return pd.DataFrame(columns=columns)
+    max_lag = min(max_lag, length - 1)
+
+    # Đệm 0 tới độ dài >= T + max_lag để tránh chồng vòng (circular wrap)
+    n_fft = 1 << int(np.ceil(np.log2(length + max_lag + 1)))
+    lags = np.arange(-max_lag, max_lag + 1)
+    step_hours = pd.Timedelta(freq if freq[0].isdigit() else '1' + freq) / pd.Timedelta(hours=1)
+
+    tables = []
+    for start in range(0, len(station_names), chunk_size):
+        chunk_names = station_names[start:start + chunk_size]
+        grids = [_to_regular_grid(frames[name], freq) for name in chunk_names]
+        n, corr = _chunk_correlation(grids, drivers, pollutants, length, max_lag, n_fft, min_pairs)
+
+        # Làm phẳng (S, D, P, L) -> bảng dạng dài
+        s_idx, d_idx, p_idx, l_idx = np.indices(corr.shape).reshape(4, -1)
+        tables.append(pd.DataFrame({
+            'station': np.asarray(chunk_names, dtype=object)[s_idx],
+            'driver': np.asarray(drivers, dtype=object)[d_idx],
+            'pollutant': np.asarray(pollutants, dtype=object)[p_idx],
+            'lag': lags[l_idx],
+            'lag_hours': lags[l_idx] * step_hours,
+            'n_pairs': n.ravel().astype(int),
+            'corr': corr.ravel(),
+        }))
+    return pd.concat(tables, ignore_index=True)
+
+
+def best_lags(corr_table):
+    """Với mỗi (trạm, driver, pollutant): lag có |corr| lớn nhất."""
+    valid = corr_table.dropna(subset=['corr'])
+    idx = valid['corr'].abs().groupby([valid['station'], valid['driver'], valid['pollutant']]).idxmax()
+    return valid.loc[idx.to_numpy()].reset_index(drop=True)
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import json
+from src.cleaning_data_src.artifact_manifest import publish_json
 """
 File: QA_rule.py
 Mô tả: Thư viện chứa các quy tắc Đảm bảo Chất lượng (QA) 
@@ -226,6 +227,124 @@ def check_aq_uv_night_logic(df: pd.DataFrame, night_start=19, night_end=5, uv_th
     
     return {'id': RULE_ID, 'reason': REASON, 'indices': failing_indices}
 
+#=======================================================
+# [PHẦN 4 : BỘ QUI TẮC PHÁT HIỆN ĐỘT BIẾN (SPIKE) THEO CỬA SỔ TRƯỢT ]
+# Bắt các giá trị "hợp lý về vật lý" nhưng nhảy đột ngột (ví dụ PM2.5 20 -> 400 trong 1 giờ).
+# Dùng rolling median / MAD theo thời gian của pandas (cài đặt C, O(n log w)),
+# KHÔNG dùng rolling().apply() với callback Python.
+# *** YÊU CẦU: df.index phải là DatetimeIndex ***
+
+def _sorted_unique_series(df: pd.DataFrame, col: str) -> pd.Series:
+    """Chuỗi số của cột col, sắp theo thời gian, bỏ các mốc thời gian trùng (giữ bản đầu)."""
+    series = pd.to_numeric(df[col], errors='coerce')
+    series = series[~series.index.duplicated(keep='first')]
+    if not series.index.is_monotonic_increasing:
+        series = series.sort_index()
+    return series
+
+SPIKE_MAX_RUN = 2  # số điểm liên tiếp tối đa của một đột biến; dài hơn -> coi là đợt thật
+
+def _isolated_runs(flags: np.ndarray, max_run: int) -> np.ndarray:
+    """
+    Giữ các đoạn True liên tiếp dài <= max_run và có điểm False ở CẢ HAI đầu (giá trị đã quay về nền).
+    Đoạn dài hơn hoặc chạm đầu/cuối chuỗi -> bỏ (không chứng minh được là đột biến đơn lẻ).
+    """
+    n = len(flags)
+    edges = np.diff(np.r_[0, flags.astype(np.int8), 0])
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts <= max_run) & (starts > 0) & (ends < n)
+    marks = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(marks, starts[keep], 1)
+    np.add.at(marks, ends[keep], -1)
+    return np.cumsum(marks[:n]) > 0
+
+def rolling_mad_spike_mask(series: pd.Series, window='25h', n_mad=6.0, min_abs_dev=0.0,
+                           max_run=SPIKE_MAX_RUN) -> pd.Series:
+    """
+    Mặt nạ đột biến theo median/MAD trượt (cửa sổ thời gian, căn giữa):
+        |x - median_w| > n_mad * 1.4826 * MAD_w  và  |x - median_w| > min_abs_dev
+    MAD_w = median trượt của |x - median_w| (xấp xỉ Hampel filter, 2 lượt rolling median).
+    Chỉ giữ đột biến ĐƠN LẺ: tối đa max_run điểm có dữ liệu liên tiếp lệch median, điểm có dữ liệu
+    liền trước và liền sau đều gần median. Một đợt ô nhiễm kéo dài (ví dụ 6 giờ ở mức 150 trên nền 20)
+    lệch median nhiều giờ liền -> không gắn cờ (không bị xoá trước khi phát hiện đợt / tính AQI).
+    """
+    med = series.rolling(window, center=True, min_periods=3).median()
+    abs_dev = (series - med).abs()
+    mad = abs_dev.rolling(window, center=True, min_periods=3).median()
+    deviates = (abs_dev > n_mad * 1.4826 * mad) & (abs_dev > min_abs_dev)
+    valid = series.notna().to_numpy()
+    mask = np.zeros(len(series), dtype=bool)
+    mask[valid] = _isolated_runs(deviates.to_numpy()[valid], max_run)
+    return pd.Series(mask, index=series.index)
+
+def rate_of_change_mask(series: pd.Series, max_rate_per_hour: float) -> pd.Series:
+    """
+    Mặt nạ tốc độ thay đổi: chỉ gắn cờ điểm mà tốc độ VÀO (so với điểm có dữ liệu liền trước) và tốc độ RA
+    (so với điểm có dữ liệu liền sau) đều vượt ngưỡng và NGƯỢC DẤU (nhảy lên rồi rơi xuống hoặc ngược lại).
+        - Một đột biến đơn lẻ -> đúng 1 giờ bị gắn cờ (giờ hồi phục ngay sau nó không bị xoá nhầm).
+        - Bước nhảy kéo dài (ví dụ 20 -> 150 khi bắt đầu có khói) -> không gắn cờ.
+    """
+    valid = series.dropna()
+    hours = valid.index.to_series().diff().dt.total_seconds() / 3600
+    rate_in = valid.diff() / hours
+    rate_out = rate_in.shift(-1)
+    failing = ((rate_in.abs() > max_rate_per_hour) & (rate_out.abs() > max_rate_per_hour)
+               & (np.sign(rate_in) == -np.sign(rate_out)))
+    return failing.reindex(series.index, fill_value=False)
+
+def _spike_rule(df, col, rule_id, reason, window, n_mad, min_abs_dev):
+    series = _sorted_unique_series(df, col)
+    failing_indices = series.index[rolling_mad_spike_mask(series, window, n_mad, min_abs_dev)].tolist()
+    return {'id': rule_id, 'reason': reason, 'indices': failing_indices}
+
+def _rate_rule(df, col, rule_id, reason, max_rate_per_hour):
+    series = _sorted_unique_series(df, col)
+    failing_indices = series.index[rate_of_change_mask(series, max_rate_per_hour)].tolist()
+    return {'id': rule_id, 'reason': reason, 'indices': failing_indices}
+
+def check_aq_pm25_spike(df: pd.DataFrame, window='25h', n_mad=6.0, min_abs_dev=30.0) -> dict:
+    """
+    (AQ-SPIKE-1) Đột biến PM2.5 ĐƠN LẺ (<= SPIKE_MAX_RUN giờ liền) so với median trượt (robust z-score theo MAD).
+    """
+    REASON = f"Đột biến PM2.5 (lệch median {window} > {n_mad} MAD và > {min_abs_dev} µg/m³)."
+    return _spike_rule(df, 'pm2_5', "AQ-SPIKE-1", REASON, window, n_mad, min_abs_dev)
+
+def check_aq_pm10_spike(df: pd.DataFrame, window='25h', n_mad=6.0, min_abs_dev=45.0) -> dict:
+    """
+    (AQ-SPIKE-2) Đột biến PM10 ĐƠN LẺ (<= SPIKE_MAX_RUN giờ liền) so với median trượt (robust z-score theo MAD).
+    """
+    REASON = f"Đột biến PM10 (lệch median {window} > {n_mad} MAD và > {min_abs_dev} µg/m³)."
+    return _spike_rule(df, 'pm10', "AQ-SPIKE-2", REASON, window, n_mad, min_abs_dev)
+
+def check_aq_pm25_rate_of_change(df: pd.DataFrame, max_rate_per_hour=100.0) -> dict:
+    """
+    (AQ-ROC-1) PM2.5 nhảy vọt rồi quay lại (tốc độ vào và ra đều vượt ngưỡng, ngược dấu).
+    """
+    REASON = f"PM2.5 thay đổi quá nhanh (> {max_rate_per_hour} µg/m³/giờ)."
+    return _rate_rule(df, 'pm2_5', "AQ-ROC-1", REASON, max_rate_per_hour)
+
+def check_aq_pm10_rate_of_change(df: pd.DataFrame, max_rate_per_hour=150.0) -> dict:
+    """
+    (AQ-ROC-2) PM10 nhảy vọt rồi quay lại (tốc độ vào và ra đều vượt ngưỡng, ngược dấu).
+    """
+    REASON = f"PM10 thay đổi quá nhanh (> {max_rate_per_hour} µg/m³/giờ)."
+    return _rate_rule(df, 'pm10', "AQ-ROC-2", REASON, max_rate_per_hour)
+
+def check_w_temp_spike(df: pd.DataFrame, window='25h', n_mad=6.0, min_abs_dev=6.0) -> dict:
+    """
+    (W-SPIKE-1) Đột biến nhiệt độ ĐƠN LẺ (<= SPIKE_MAX_RUN giờ liền) so với median trượt (robust z-score theo MAD).
+    """
+    REASON = f"Đột biến nhiệt độ (lệch median {window} > {n_mad} MAD và > {min_abs_dev}°C)."
+    return _spike_rule(df, 'temp', "W-SPIKE-1", REASON, window, n_mad, min_abs_dev)
+
+def check_w_temp_rate_of_change(df: pd.DataFrame, max_rate_per_hour=10.0) -> dict:
+    """
+    (W-ROC-1) Nhiệt độ nhảy vọt rồi quay lại (tốc độ vào và ra đều vượt ngưỡng, ngược dấu).
+    """
+    REASON = f"Nhiệt độ thay đổi quá nhanh (> {max_rate_per_hour}°C/giờ)."
+    return _rate_rule(df, 'temp', "W-ROC-1", REASON, max_rate_per_hour)
+
 #============================================================================
 # HÀM ÁP DỤNG RULES.
 
@@ -239,11 +358,15 @@ WEATHER_RULES_SET=[check_w_negative_values,
                    check_w_pres_bounds,
                    check_w_temp_bounds,
                    check_w_wdir_bounds,
-                   check_w_wind_logic]
+                   check_w_wind_logic,
+                   check_w_temp_spike,
+                   check_w_temp_rate_of_change]
 
-AIR_QUALITY_SET=[check_aq_negative_values,check_aq_pm_logic,check_aq_uv_night_logic]
+AIR_QUALITY_SET=[check_aq_negative_values,check_aq_pm_logic,check_aq_uv_night_logic,
+                 check_aq_pm25_spike,check_aq_pm10_spike,
+                 check_aq_pm25_rate_of_change,check_aq_pm10_rate_of_change]
 
-def apply_qa_rules(df: pd.DataFrame, rule_set: list,name_rule_set:str):
+def apply_qa_rules(df: pd.DataFrame, rule_set: list,name_rule_set:str, evaluator=None):
     """
     Hàm chính để áp dụng một bộ quy tắc QA vào DataFrame.
     
@@ -252,6 +375,8 @@ def apply_qa_rules(df: pd.DataFrame, rule_set: list,name_rule_set:str):
     2. Chạy từng quy tắc trong 'rule_set'.
     3. Gắn cờ (flag) vào cột 'qa_flags' cho các dòng vi phạm.
     4. Tạo một báo cáo tóm tắt về số lượng lỗi.
+    evaluator: hàm (df, [(luật, [tham số])]) -> danh sách kết quả, dùng để chạy các luật theo cách khác
+    (ví dụ song song theo shard thời gian, xem parallel_qa.py). Mặc định chạy tuần tự từng luật.
     """
 
     # Tạo bản sao để tránh thay đổi DataFrame gốc (SettingWithCopyWarning)
@@ -265,8 +390,14 @@ def apply_qa_rules(df: pd.DataFrame, rule_set: list,name_rule_set:str):
 
     print(f"Bắt đầu chạy {len(rule_set)} quy tắc QA...")
 
-    for rule_function in rule_set:
-        result = rule_function(df_flagged)
+    # Các luật chỉ đọc dữ liệu (không đọc cột qa_flags) nên có thể chạy trước rồi mới gắn cờ
+    rule_calls = [(rule_function, []) for rule_function in rule_set]
+    if evaluator is None:
+        results = [rule_function(df_flagged) for rule_function in rule_set]
+    else:
+        results = evaluator(df_flagged, rule_calls)
+
+    for result in results:
         
         rule_id = result['id']
         reason = result['reason']
@@ -287,20 +418,19 @@ def apply_qa_rules(df: pd.DataFrame, rule_set: list,name_rule_set:str):
             df_flagged.loc[failing_indices, 'qa_flags'] = \
                 df_flagged.loc[failing_indices, 'qa_flags'].apply(lambda x: x + [rule_id])
             
-        report_file_json = f'reports/qa_summary_{name_rule_set}.json'
-
-        # 3. Mở file và dùng json.dump()
-        try:
-            with open(report_file_json, 'w', encoding='utf-8') as f:
-                json.dump(
-                    summary_report, 
-                    f,                  
-                    ensure_ascii=False, # <-- Rất quan trọng để lưu tiếng Việt
-                    indent=4          
-                )
-            print("Đã lưu báo cáo JSON thành công.")
-        except Exception as e:
-            print(f"Không thể lưu báo cáo JSON: {e}")
+    report_file_json = f'reports/qa_summary_{name_rule_set}.json'
+
+    # 3. Ghi báo cáo MỘT lần sau khi chạy hết các luật (chỉ ghi khi nội dung thay đổi, xem artifact_manifest.py)
+    try:
+        publish_json(
+            summary_report,
+            report_file_json,
+            ensure_ascii=False, # <-- Rất quan trọng để lưu tiếng Việt
+            indent=4
+        )
+        print("Đã lưu báo cáo JSON thành công.")
+    except Exception as e:
+        print(f"Không thể lưu báo cáo JSON: {e}")
                         
     print("Hoàn tất chạy QA.")
     return df_flagged, summary_report
\ No newline at end of file
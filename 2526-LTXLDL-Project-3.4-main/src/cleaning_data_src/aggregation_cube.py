@@ -0,0 +1,158 @@
+import io
+import zipfile
+import numpy as np
+import pandas as pd
+
+from src.cleaning_data_src.artifact_manifest import publish_bytes
+
+"""
+File: aggregation_cube.py
+Mô tả: "Cube" tổng hợp tính sẵn cho mỗi trạm: với mỗi biến, lưu count / sum / sum-of-squares
+theo 3 trục Tháng (12) x Thứ (7) x Giờ trong ngày (24) = 2016 ô.
+
+Cube được tạo MỘT lần từ dữ liệu giờ đã làm sạch (np.bincount, vector hoá). Sau đó các truy vấn
+như bản đồ nhiệt Tháng x Thứ, biểu đồ chu kỳ ngày (diurnal profile), độ lệch chuẩn...
+chỉ cần cộng dồn trên cube (vài nghìn số), không phải đọc lại dữ liệu gốc.
+Cube của nhiều năm / nhiều trạm có thể cộng lại với nhau (merge_cubes).
+"""
+
+CUBE_AXES = ('month', 'weekday', 'hour')
+CUBE_SHAPE = (12, 7, 24)
+
+
+def build_cube(df_hourly, columns):
+    """
+    Tạo cube từ DataFrame giờ (DatetimeIndex, giờ địa phương).
+    Trả về dict: 'columns', 'count', 'sum', 'sumsq' (mỗi mảng có dạng (n_biến, 12, 7, 24)).
+    """
+    index = pd.DatetimeIndex(df_hourly.index)
+    flat = ((index.month.to_numpy() - 1) * 7 + index.weekday.to_numpy()) * 24 + index.hour.to_numpy()
+    n_cells = int(np.prod(CUBE_SHAPE))
+
+    count = np.zeros((len(columns), n_cells))
+    total = np.zeros((len(columns), n_cells))
+    total_sq = np.zeros((len(columns), n_cells))
+    for i, col in enumerate(columns):
+        values = pd.to_numeric(df_hourly[col], errors='coerce').to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        count[i] = np.bincount(flat[valid], minlength=n_cells)
+        total[i] = np.bincount(flat[valid], weights=values[valid], minlength=n_cells)
+        total_sq[i] = np.bincount(flat[valid], weights=values[valid] ** 2, minlength=n_cells)
+
+    shape = (len(columns),) + CUBE_SHAPE
+    return {
+        'columns': list(columns),
+        'count': count.reshape(shape),
+        'sum': total.reshape(shape),
+        'sumsq': total_sq.reshape(shape),
+    }
+
+
+def merge_cubes(cubes):
+    """Cộng nhiều cube (cùng danh sách biến), ví dụ nhiều năm của cùng một trạm."""
+    cubes = list(cubes)
+    columns = cubes[0]['columns']
+    for cube in cubes[1:]:
+        if cube['columns'] != columns:
+            raise ValueError("Các cube phải có cùng danh sách biến.")
+    return {
+        'columns': list(columns),
+        'count': sum(c['count'] for c in cubes),
+        'sum': sum(c['sum'] for c in cubes),
+        'sumsq': sum(c['sumsq'] for c in cubes),
+    }
+
+
+def concat_cubes(cubes):
+    """Ghép cube của các biến KHÁC nhau (ví dụ cube weather + cube air) thành một cube."""
+    cubes = list(cubes)
+    columns = [col for c in cubes for col in c['columns']]
+    if len(set(columns)) != len(columns):
+        raise ValueError("Các cube bị trùng tên biến.")
+    return {
+        'columns': columns,
+        'count': np.concatenate([c['count'] for c in cubes]),
+        'sum': np.concatenate([c['sum'] for c in cubes]),
+        'sumsq': np.concatenate([c['sumsq'] for c in cubes]),
+    }
+
+
+def cube_bytes(cube):
+    """
+    Nội dung file .npz nén của cube (đọc được bằng np.load / load_cube).
+    Khác np.savez_compressed, mốc thời gian trong zip được cố định nên cùng dữ liệu -> cùng bytes
+    (so checksum được với manifest).
+    """
+    arrays = {'columns': np.array(cube['columns']), 'count': cube['count'],
+              'sum': cube['sum'], 'sumsq': cube['sumsq']}
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, array in arrays.items():
+            info = zipfile.ZipInfo(f'{name}.npy', date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w') as f:
+                np.lib.format.write_array(f, np.asarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def save_cube(cube, path):
+    """Lưu cube ra file .npz nén (~100 KB mỗi trạm cho 10 biến) qua manifest: chỉ ghi khi nội dung đổi."""
+    return publish_bytes(path, cube_bytes(cube))
+
+
+def load_cube(path):
+    with np.load(path) as data:
+        return {
+            'columns': data['columns'].tolist(),
+            'count': data['count'],
+            'sum': data['sum'],
+            'sumsq': data['sumsq'],
+        }
+
+
+def cube_stat(cube, column, axes=('month', 'weekday'), stat='mean'):
+    """
+    Truy vấn cube: gộp các trục KHÔNG có trong 'axes' rồi tính thống kê.
+    - axes: 1 hoặc 2 trục giữ lại trong ('month', 'weekday', 'hour').
+    - stat: 'mean', 'std' hoặc 'count'.
+    Trả về Series (1 trục) hoặc DataFrame (2 trục: trục đầu là index, trục sau là cột).
+    """
+    if column not in cube['columns']:
+        raise KeyError(f"Cube không có biến '{column}'.")
+    var = cube['columns'].index(column)
+    drop_axes = tuple(i for i, name in enumerate(CUBE_AXES) if name not in axes)
+
+    count = cube['count'][var].sum(axis=drop_axes)
+    total = cube['sum'][var].sum(axis=drop_axes)
+    total_sq = cube['sumsq'][var].sum(axis=drop_axes)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if stat == 'count':
+            result = count
+        elif stat == 'mean':
+            result = np.where(count > 0, total / count, np.nan)
+        elif stat == 'std':
+            var_pop = total_sq / count - (total / count) ** 2
+            result = np.where(count > 1, np.sqrt(np.clip(var_pop, 0, None) * count / (count - 1)), np.nan)
+        else:
+            raise ValueError("stat phải là 'mean', 'std' hoặc 'count'.")
+
+    labels = {
+        'month': pd.Index(range(1, 13), name='month'),
+        'weekday': pd.Index(range(7), name='weekday'),  # 0 = Thứ 2 (giống pandas)
+        'hour': pd.Index(range(24), name='hour'),
+    }
+    kept = [name for name in CUBE_AXES if name in axes]
+    if len(kept) == 1:
+        return pd.Series(result, index=labels[kept[0]], name=column)
+    if len(kept) == 2:
+        return pd.DataFrame(result, index=labels[kept[0]], columns=labels[kept[1]])
+    raise ValueError("axes phải gồm 1 hoặc 2 trục.")
+
+
+def diurnal_profile(cube, column, month=None, stat='mean'):
+    """Chu kỳ ngày (24 giờ) của một biến, cho cả năm hoặc một tháng cụ thể (1-12)."""
+    if month is None:
+        return cube_stat(cube, column, axes=('hour',), stat=stat)
+    table = cube_stat(cube, column, axes=('month', 'hour'), stat=stat)
+    return table.loc[month].rename(column)
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+"""
+File: aqi.py
+Mô tả: Tính chỉ số chất lượng không khí (AQI) chuẩn US EPA (bảng breakpoint cập nhật 2024)
+cho PM2.5, PM10, O3, CO:
+    - AQI GIỜ: PM2.5 / PM10 dùng NowCast (12 giờ gần nhất, trọng số theo độ biến động),
+      O3 dùng trung bình 8 giờ (và O3 1 giờ khi nồng độ cao), CO dùng trung bình 8 giờ.
+    - AQI NGÀY: PM trung bình 24 giờ, O3 / CO lấy trung bình 8 giờ lớn nhất trong ngày.
+AQI tổng = max các AQI thành phần, kèm chất ô nhiễm chi phối (dominant) và mức phân loại.
+
+Tra bảng breakpoint được vector hoá bằng np.searchsorted trên mảng đã sắp xếp,
+không dùng if/else theo từng dòng.
+"""
+
+# Bảng breakpoint: (ngưỡng nồng độ trên của từng khoảng, AQI thấp, AQI cao) — nồng độ thấp
+# của khoảng i là ngưỡng trên của khoảng i-1 (sau khi làm tròn theo số chữ số của chất đó).
+# Đơn vị: PM µg/m³, O3 / CO ppm.
+AQI_BREAKPOINTS = {
+    'pm2_5': {
+        'c_lo': [0.0, 9.1, 35.5, 55.5, 125.5, 225.5],
+        'c_hi': [9.0, 35.4, 55.4, 125.4, 225.4, 325.4],
+        'decimals': 1,
+    },
+    'pm10': {
+        'c_lo': [0, 55, 155, 255, 355, 425],
+        'c_hi': [54, 154, 254, 354, 424, 604],
+        'decimals': 0,
+    },
+    'o3_8h': {
+        'c_lo': [0.000, 0.055, 0.071, 0.086, 0.106],
+        'c_hi': [0.054, 0.070, 0.085, 0.105, 0.200],
+        'decimals': 3,
+    },
+    'o3_1h': {
+        'c_lo': [0.125, 0.165, 0.205, 0.405],
+        'c_hi': [0.164, 0.204, 0.404, 0.604],
+        'i_lo': [101, 151, 201, 301],
+        'i_hi': [150, 200, 300, 500],
+        'decimals': 3,
+    },
+    'co': {
+        'c_lo': [0.0, 4.5, 9.5, 12.5, 15.5, 30.5],
+        'c_hi': [4.4, 9.4, 12.4, 15.4, 30.4, 50.4],
+        'decimals': 1,
+    },
+}
+AQI_I_LO = [0, 51, 101, 151, 201, 301]
+AQI_I_HI = [50, 100, 150, 200, 300, 500]
+
+AQI_CATEGORY_EDGES = [50, 100, 150, 200, 300]
+AQI_CATEGORIES = np.array(['Tốt', 'Trung bình', 'Kém', 'Xấu', 'Rất xấu', 'Nguy hại'], dtype=object)
+
+# Khối lượng mol (g/mol) để đổi µg/m³ -> ppm ở 25°C, 1 atm (thể tích mol 24.45 L)
+MOLAR_MASS = {'ozone': 48.00, 'carbon_monoxide': 28.01}
+
+
+def ugm3_to_ppm(values, pollutant):
+    """Đổi nồng độ khí từ µg/m³ (Open-Meteo) sang ppm (bảng EPA)."""
+    return np.asarray(values, dtype=float) * 24.45 / (MOLAR_MASS[pollutant] * 1000)
+
+
+def concentration_to_aqi(concentration, table_name):
+    """
+    Đổi nồng độ -> AQI bằng nội suy tuyến tính trong khoảng breakpoint (vector hoá).
+    Nồng độ vượt khoảng cao nhất bị chặn ở AQI cận trên của bảng đó: 500 cho hầu hết các bảng,
+    nhưng 300 cho 'o3_8h' (trên 0.200 ppm EPA dùng bảng 'o3_1h'). 'o3_1h' dưới 0.125 ppm -> NaN.
+    NaN giữ nguyên NaN.
+    """
+    table = AQI_BREAKPOINTS[table_name]
+    c_lo = np.asarray(table['c_lo'], dtype=float)
+    c_hi = np.asarray(table['c_hi'], dtype=float)
+    i_lo = np.asarray(table.get('i_lo', AQI_I_LO[:len(c_hi)]), dtype=float)
+    i_hi = np.asarray(table.get('i_hi', AQI_I_HI[:len(c_hi)]), dtype=float)
+
+    # Làm tròn xuống theo số chữ số của chất (quy tắc truncate của EPA)
+    scale = 10.0 ** table['decimals']
+    c = np.floor(np.asarray(concentration, dtype=float) * scale + 1e-9) / scale
+
+    idx = np.searchsorted(c_hi, c, side='left')
+    idx = np.clip(idx, 0, len(c_hi) - 1)
+    aqi = (i_hi[idx] - i_lo[idx]) / (c_hi[idx] - c_lo[idx]) * (np.clip(c, c_lo[idx], c_hi[idx]) - c_lo[idx]) + i_lo[idx]
+    aqi = np.where(c < c_lo[0], np.nan if table_name == 'o3_1h' else i_lo[0], aqi)
+    return np.where(np.isnan(c), np.nan, np.rint(aqi))
+
+
+def nowcast(hourly_values, window=12, min_recent=2):
+    """
+    NowCast của EPA cho PM trên chuỗi giờ ĐỀU (numpy, vector hoá bằng sliding window):
+        w* = min/max của 12 giờ gần nhất, w = max(w*, 0.5)
+        NowCast = Σ w^(i-1)·c_i / Σ w^(i-1)  (c_1 là giờ gần nhất, bỏ qua giờ thiếu)
+    Yêu cầu ít nhất 'min_recent' trong 3 giờ gần nhất có dữ liệu, nếu không trả NaN.
+    """
+    values = np.asarray(hourly_values, dtype=float)
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    # Cửa sổ (n, 12), đảo để cột 0 là giờ hiện tại
+    windows = sliding_window_view(padded, window)[:, ::-1]
+    valid = ~np.isnan(windows)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        c_min = np.where(valid, windows, np.inf).min(axis=1)
+        c_max = np.where(valid, windows, -np.inf).max(axis=1)
+        w = np.where(c_max > 0, c_min / c_max, 1.0)
+    w = np.clip(w, 0.5, 1.0)
+
+    powers = w[:, None] ** np.arange(window)[None, :]
+    powers = np.where(valid, powers, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (powers * np.nan_to_num(windows)).sum(axis=1) / powers.sum(axis=1)
+    enough = valid[:, :3].sum(axis=1) >= min_recent
+    return np.where(enough, result, np.nan)
+
+
+def _dominant_and_category(aqi_table):
+    """AQI tổng (max), chất chi phối (argmax) và mức phân loại cho bảng AQI thành phần."""
+    values = aqi_table.to_numpy(dtype=float)
+    has_any = ~np.isnan(values).all(axis=1)
+    filled = np.where(np.isnan(values), -np.inf, values)
+    dominant_idx = filled.argmax(axis=1)
+
+    aqi = np.where(has_any, filled.max(axis=1), np.nan)
+    names = np.array([c.replace('aqi_', '') for c in aqi_table.columns], dtype=object)
+    dominant = np.where(has_any, names[dominant_idx], None)
+    category_idx = np.searchsorted(AQI_CATEGORY_EDGES, np.nan_to_num(aqi), side='left')
+    category = np.where(has_any, AQI_CATEGORIES[category_idx], None)
+    return aqi, dominant, category
+
+
+def compute_hourly_aqi(df_air):
+    """
+    AQI giờ cho DataFrame không khí (DatetimeIndex giờ, cột pm2_5, pm10, ozone, carbon_monoxide µg/m³).
+    Trả về DataFrame trên lưới giờ đều với nồng độ trung gian, AQI thành phần,
+    'aqi', 'aqi_dominant', 'aqi_category'.
+    """
+    df = df_air[~df_air.index.duplicated(keep='first')].sort_index()
+    df = df[['pm2_5', 'pm10', 'ozone', 'carbon_monoxide']].apply(pd.to_numeric, errors='coerce').asfreq('h')
+
+    out = pd.DataFrame(index=df.index)
+    out['nowcast_pm2_5'] = nowcast(df['pm2_5'].to_numpy())
+    out['nowcast_pm10'] = nowcast(df['pm10'].to_numpy())
+    o3_ppm = pd.Series(ugm3_to_ppm(df['ozone'], 'ozone'), index=df.index)
+    co_ppm = pd.Series(ugm3_to_ppm(df['carbon_monoxide'], 'carbon_monoxide'), index=df.index)
+    out['o3_1h_ppm'] = o3_ppm
+    out['o3_8h_ppm'] = o3_ppm.rolling(8, min_periods=6).mean()
+    out['co_8h_ppm'] = co_ppm.rolling(8, min_periods=6).mean()
+
+    out['aqi_pm2_5'] = concentration_to_aqi(out['nowcast_pm2_5'], 'pm2_5')
+    out['aqi_pm10'] = concentration_to_aqi(out['nowcast_pm10'], 'pm10')
+    # O3: dùng 8 giờ; khi O3 1 giờ >= 0.125 ppm lấy giá trị lớn hơn (quy tắc EPA)
+    aqi_o3_8h = concentration_to_aqi(out['o3_8h_ppm'], 'o3_8h')
+    aqi_o3_1h = concentration_to_aqi(out['o3_1h_ppm'], 'o3_1h')
+    out['aqi_o3'] = np.fmax(aqi_o3_8h, aqi_o3_1h)
+    out['aqi_co'] = concentration_to_aqi(out['co_8h_ppm'], 'co')
+
+    aqi_cols = ['aqi_pm2_5', 'aqi_pm10', 'aqi_o3', 'aqi_co']
+    out['aqi'], out['aqi_dominant'], out['aqi_category'] = _dominant_and_category(out[aqi_cols])
+    return out
+
+
+def compute_daily_aqi(df_air, hourly_aqi=None, min_hours=18):
+    """
+    AQI ngày: PM2.5 / PM10 trung bình 24 giờ (cần >= min_hours giờ có dữ liệu),
+    O3 / CO lấy trung bình 8 giờ LỚN NHẤT trong ngày.
+    """
+    if hourly_aqi is None:
+        hourly_aqi = compute_hourly_aqi(df_air)
+    df = df_air[~df_air.index.duplicated(keep='first')].sort_index()
+    pm = df[['pm2_5', 'pm10']].apply(pd.to_numeric, errors='coerce').resample('D')
+    pm_mean = pm.mean().where(pm.count() >= min_hours)
+    gas_max = hourly_aqi[['o3_8h_ppm', 'co_8h_ppm']].resample('D').max()
+
+    out = pd.DataFrame(index=pm_mean.index)
+    out['aqi_pm2_5'] = concentration_to_aqi(pm_mean['pm2_5'], 'pm2_5')
+    out['aqi_pm10'] = concentration_to_aqi(pm_mean['pm10'], 'pm10')
+    out['aqi_o3'] = concentration_to_aqi(gas_max['o3_8h_ppm'].reindex(out.index), 'o3_8h')
+    out['aqi_co'] = concentration_to_aqi(gas_max['co_8h_ppm'].reindex(out.index), 'co')
+    out['aqi'], out['aqi_dominant'], out['aqi_category'] = _dominant_and_category(out)
+    return out
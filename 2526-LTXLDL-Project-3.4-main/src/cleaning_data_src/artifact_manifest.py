@@ -0,0 +1,192 @@
+import io
+import os
+import json
+import hashlib
+import pandas as pd
+
+"""
+File: artifact_manifest.py
+Mô tả: Chỉ GHI LẠI các file kết quả (processed/*.csv, reports/*.json, figures/*.png) khi NỘI DUNG thay đổi.
+
+    - Mỗi file kết quả có một dòng trong manifest (reports/artifact_manifest.json):
+      checksum SHA-256, kích thước, lần chạy cập nhật gần nhất.
+    - publish_*(): tạo nội dung trong bộ nhớ, so checksum với manifest (hoặc với file đang có trên đĩa
+      nếu manifest chưa biết file đó) -> giống nhau thì BỎ QUA, khác thì ghi NGUYÊN TỬ
+      (file tạm + os.replace, không bao giờ để lại file ghi dở).
+    - end_run() lưu manifest và NỐI THÊM danh sách file đã thay đổi của lần chạy vào
+      reports/changed_artifacts.json cho các hệ thống phía sau (đồng bộ, dashboard).
+      Các bước pipeline -> visualization -> advanced_analysis chạy nối tiếp nên danh sách được CỘNG DỒN
+      qua các lần chạy cho tới khi hệ thống phía sau gọi acknowledge_changes() (đã đồng bộ xong).
+"""
+
+MANIFEST_PATH = os.path.join('reports', 'artifact_manifest.json')
+CHANGED_PATH = os.path.join('reports', 'changed_artifacts.json')
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write_bytes(path, data):
+    """Ghi file nguyên tử: ghi ra file tạm cùng thư mục, fsync rồi os.replace."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ArtifactManifest:
+    """Manifest checksum của các file kết quả + danh sách file thay đổi trong lần chạy hiện tại."""
+
+    def __init__(self, manifest_path=MANIFEST_PATH, changed_path=CHANGED_PATH):
+        self.manifest_path = manifest_path
+        self.changed_path = changed_path
+        self.entries = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('artifacts', {})
+        self.start_run()
+
+    def start_run(self, name=None):
+        self.run_id = pd.Timestamp.now(tz='UTC').strftime('%Y%m%dT%H%M%S%fZ')
+        self.run_name = name
+        self.changed = []
+        self.unchanged = []
+
+    def _is_unchanged(self, key, checksum):
+        if not os.path.exists(key):
+            return False
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry['sha256'] == checksum and entry['size'] == os.path.getsize(key)
+        # Manifest chưa biết file này (lần đầu dùng manifest) -> so với nội dung trên đĩa
+        return sha256_file(key) == checksum
+
+    def publish(self, path, data):
+        """Ghi 'data' (bytes) vào path nếu nội dung khác lần trước. Trả về True nếu đã ghi."""
+        key = os.path.normpath(path)
+        checksum = sha256_bytes(data)
+        if self._is_unchanged(key, checksum):
+            self.unchanged.append(key)
+            if key not in self.entries:
+                self.entries[key] = {'sha256': checksum, 'size': len(data), 'run_id': self.run_id}
+            return False
+        atomic_write_bytes(key, data)
+        self.entries[key] = {'sha256': checksum, 'size': len(data), 'run_id': self.run_id}
+        self.changed.append(key)
+        return True
+
+    def end_run(self):
+        """Lưu manifest và nối lần chạy vào danh sách thay đổi chờ xác nhận. Trả về file đổi trong lần chạy này."""
+        manifest = {'updated_run_id': self.run_id, 'artifacts': dict(sorted(self.entries.items()))}
+        atomic_write_bytes(self.manifest_path,
+                           json.dumps(manifest, ensure_ascii=False, indent=4).encode('utf-8'))
+        run = {
+            'run_id': self.run_id,
+            'run_name': self.run_name,
+            'changed': sorted(set(self.changed)),
+            'unchanged_count': len(set(self.unchanged) - set(self.changed)),
+        }
+        runs = pending_changes(self.changed_path)['runs'] + [run]
+        _write_pending(self.changed_path, runs)
+        print(f" -> Manifest: {len(run['changed'])} file thay đổi, "
+              f"{run['unchanged_count']} file giữ nguyên ({self.changed_path}, {len(runs)} lần chạy chờ xác nhận)")
+        return run['changed']
+
+
+def _write_pending(changed_path, runs):
+    pending = {
+        'changed': sorted({path for run in runs for path in run['changed']}),
+        'runs': runs,
+    }
+    atomic_write_bytes(changed_path, json.dumps(pending, ensure_ascii=False, indent=4).encode('utf-8'))
+
+
+def pending_changes(changed_path=CHANGED_PATH):
+    """
+    Các lần chạy chưa được xác nhận: {'changed': hợp các file đã đổi, 'runs': [{run_id, run_name, changed, ...}]}.
+    """
+    if not os.path.exists(changed_path):
+        return {'changed': [], 'runs': []}
+    with open(changed_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    runs = data.get('runs')
+    if runs is None:  # định dạng cũ: chỉ một lần chạy
+        runs = [data] if 'run_id' in data else []
+    return {'changed': sorted({path for run in runs for path in run['changed']}), 'runs': runs}
+
+
+def acknowledge_changes(run_id=None, changed_path=CHANGED_PATH):
+    """
+    Hệ thống phía sau gọi sau khi đã xử lý các file thay đổi: bỏ các lần chạy tới (và gồm) run_id
+    khỏi danh sách chờ (mặc định: tất cả). Truyền run_id cuối cùng đã đọc để không bỏ sót
+    lần chạy kết thúc sau khi đọc danh sách.
+    Trả về danh sách file đã xác nhận.
+    """
+    runs = pending_changes(changed_path)['runs']
+    if run_id is None:
+        done, rest = runs, []
+    else:
+        ids = [run['run_id'] for run in runs]
+        cut = ids.index(run_id) + 1 if run_id in ids else 0
+        done, rest = runs[:cut], runs[cut:]
+    _write_pending(changed_path, rest)
+    return sorted({path for run in done for path in run['changed']})
+
+
+_default_manifest = None
+
+
+def get_manifest():
+    """Manifest dùng chung trong tiến trình (nạp lười ở lần dùng đầu tiên)."""
+    global _default_manifest
+    if _default_manifest is None:
+        _default_manifest = ArtifactManifest()
+    return _default_manifest
+
+
+def start_run(name=None):
+    get_manifest().start_run(name)
+
+
+def end_run():
+    return get_manifest().end_run()
+
+
+def changed_artifacts():
+    """Danh sách file đã thay đổi trong lần chạy hiện tại (chưa gọi end_run)."""
+    return sorted(set(get_manifest().changed))
+
+
+def publish_bytes(path, data):
+    return get_manifest().publish(path, data)
+
+
+def publish_csv(df, path, **to_csv_kwargs):
+    """DataFrame.to_csv nhưng chỉ ghi khi nội dung thay đổi."""
+    return publish_bytes(path, df.to_csv(**to_csv_kwargs).encode('utf-8'))
+
+
+def publish_json(obj, path, **json_kwargs):
+    """json.dump (UTF-8, giữ tiếng Việt) nhưng chỉ ghi khi nội dung thay đổi."""
+    json_kwargs.setdefault('ensure_ascii', False)
+    return publish_bytes(path, json.dumps(obj, **json_kwargs).encode('utf-8'))
+
+
+def publish_figure(fig, path, **savefig_kwargs):
+    """fig.savefig vào bộ nhớ rồi chỉ ghi ra đĩa khi ảnh thay đổi."""
+    buffer = io.BytesIO()
+    fmt = savefig_kwargs.pop('format', os.path.splitext(path)[1].lstrip('.') or 'png')
+    fig.savefig(buffer, format=fmt, **savefig_kwargs)
+    return publish_bytes(path, buffer.getvalue())
@@ -0,0 +1,93 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+"""
+File: columnar_cache.py
+Mô tả: Cache dạng CỘT, độ rộng cố định, đọc bằng memory-map cho dữ liệu giờ thô (raw/*.csv).
+
+Chuyển đổi MỘT lần mỗi file CSV thành:
+    <cache_dir>/time.npy       : int64, epoch nano giây (UTC)
+    <cache_dir>/<cột>.npy      : float64, mỗi biến một file
+    <cache_dir>/meta.json      : danh sách cột, múi giờ, số dòng, file nguồn + mtime
+Sau đó load_columnar_cache() mở các file bằng np.load(mmap_mode='r'): không parse CSV,
+không copy dữ liệu. Nhiều tiến trình cùng đọc một trạm sẽ dùng CHUNG các trang nhớ
+trong page cache của hệ điều hành.
+
+Lưu ý: giá trị phi số (text) trong CSV được ép thành NaN khi tạo cache, nên luật
+DTYPE-1 không còn phát hiện được chúng nếu đọc từ cache.
+"""
+
+TIME_FILE = 'time.npy'
+META_FILE = 'meta.json'
+CACHE_TZ = 'Asia/Ho_Chi_Minh'
+
+
+def build_columnar_cache(csv_path, cache_dir):
+    """Đọc CSV giờ (cột 'time' hoặc 'date'), ghi ra các file cột .npy + meta.json."""
+    df = pd.read_csv(csv_path)
+    time_col = 'time' if 'time' in df.columns else 'date'
+    times = pd.DatetimeIndex(pd.to_datetime(df[time_col]))
+    # Múi giờ giống load_data: không có tz -> coi là UTC
+    times = times.tz_localize('UTC') if times.tz is None else times.tz_convert('UTC')
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, TIME_FILE), times.as_unit('ns').asi8.astype(np.int64))
+
+    columns = [c for c in df.columns if c != time_col]
+    for col in columns:
+        values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+        np.save(os.path.join(cache_dir, f'{col}.npy'), values)
+
+    meta = {
+        'columns': columns,
+        'tz': CACHE_TZ,
+        'n_rows': len(df),
+        'source': os.path.abspath(csv_path),
+        'source_mtime': os.path.getmtime(csv_path),
+    }
+    # Ghi meta.json SAU CÙNG: cache chỉ được coi là hợp lệ khi đã ghi xong mọi cột
+    with open(os.path.join(cache_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=4)
+    print(f"Đã tạo cache cột cho {csv_path} ({len(df)} dòng, {len(columns)} cột): {cache_dir}")
+    return meta
+
+
+def is_cache_fresh(csv_path, cache_dir):
+    """Cache tồn tại và được tạo từ đúng phiên bản hiện tại của file CSV."""
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return (meta.get('source') == os.path.abspath(csv_path)
+            and meta.get('source_mtime') == os.path.getmtime(csv_path))
+
+
+def load_columnar_arrays(cache_dir, columns=None):
+    """Trả về (time_ns, {cột: mảng}) — các mảng là memmap chỉ đọc, không copy."""
+    with open(os.path.join(cache_dir, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    columns = meta['columns'] if columns is None else list(columns)
+    time_ns = np.load(os.path.join(cache_dir, TIME_FILE), mmap_mode='r')
+    arrays = {col: np.load(os.path.join(cache_dir, f'{col}.npy'), mmap_mode='r') for col in columns}
+    return time_ns, arrays
+
+
+def load_columnar_cache(cache_dir, columns=None):
+    """
+    Nạp cache thành DataFrame (DatetimeIndex múi giờ Asia/Ho_Chi_Minh) mà các cột
+    vẫn trỏ vào vùng nhớ memmap (copy=False). Dữ liệu chỉ đọc: muốn sửa thì .copy() trước.
+    Chỉ index thời gian được dựng mới (8 byte/dòng) do phải gắn múi giờ.
+    """
+    time_ns, arrays = load_columnar_arrays(cache_dir, columns)
+    index = pd.DatetimeIndex(np.asarray(time_ns).view('datetime64[ns]')).tz_localize('UTC').tz_convert(CACHE_TZ)
+    return pd.DataFrame(arrays, index=index, copy=False)
+
+
+def load_csv_cached(csv_path, cache_dir):
+    """Nạp file CSV qua cache cột: tạo (lại) cache nếu chưa có hoặc CSV đã thay đổi."""
+    if not is_cache_fresh(csv_path, cache_dir):
+        build_columnar_cache(csv_path, cache_dir)
+    return load_columnar_cache(cache_dir)
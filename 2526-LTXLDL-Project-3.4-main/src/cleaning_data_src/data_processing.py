@@ -3,6 +3,7 @@ import os
 import numpy as np
 import json
 import math
+from functools import partial
 
 # ----- 1. KÉO CÁC LUẬT QA VÀO -----
 try:
@@ -12,18 +13,51 @@ except ImportError:
     print("TOANG RỒI: Không tìm thấy file 'QA_rules.py'. Kiểm tra lại đường dẫn đi bạn ơi.")
     exit()
 
+from src.analysis.episode_detection import detect_episodes
+from src.analysis.climatology import load_state, month_baseline
+from src.analysis.feature_store import update_feature_store
+from src.cleaning_data_src.quantile_sketch import TDigest, digest_quantile
+from src.cleaning_data_src.aggregation_cube import build_cube, concat_cubes, save_cube
+from src.cleaning_data_src.columnar_cache import load_csv_cached
+from src.cleaning_data_src.multi_file_ingestion import load_multi_file_data
+from src.cleaning_data_src.artifact_manifest import start_run, end_run, publish_csv, publish_json
+from src.cleaning_data_src.parallel_qa import evaluate_rules_sharded
+from src.cleaning_data_src.aqi import compute_hourly_aqi, compute_daily_aqi
+from src.cleaning_data_src.hourly_alignment import align_hourly_sources, alignment_summary
+from src.cleaning_data_src.multi_resample import multi_resample
+
 
 # --- 2. CÁC HÀM HỖ TRỢ (HELPER FUNCTIONS) ---
 RAW_DIR = 'raw'
 METEOSTAT_FILE_PATH = os.path.join(RAW_DIR, 'meteostat_hcm_2024.csv')
 OPENMETEO_FILE_PATH = os.path.join(RAW_DIR, 'openmeteo_hcm_2024.csv')
+COLUMNAR_CACHE_DIR = os.path.join(RAW_DIR, 'columnar_cache')
+
+def load_data(use_columnar_cache=False, weather_glob=None, air_glob=None, n_jobs=4):
+    """
+    Load dữ liệu và ép về múi giờ Việt Nam.
+    use_columnar_cache=True: đọc qua cache cột memory-map (columnar_cache.py), chỉ parse CSV
+    ở lần đầu hoặc khi file CSV thay đổi.
+    weather_glob / air_glob: nạp từ NHIỀU file (có thể nén .gz/.zst) khớp glob, ví dụ
+    'raw/meteostat/*.csv.gz' (multi_file_ingestion.py); n_jobs tiến trình đọc song song.
+    """
+    if weather_glob is not None and air_glob is not None:
+        try:
+            return load_multi_file_data(weather_glob, air_glob, n_jobs=n_jobs)
+        except Exception as e:
+            print(f"\nLỖI khi tải dữ liệu: {e}")
+            return None, None
 
-def load_data():
-    """Load dữ liệu và ép về múi giờ Việt Nam."""
     print(f"\nĐang đọc dữ liệu thời tiết từ: {METEOSTAT_FILE_PATH}")
     print(f"Đang đọc dữ liệu không khí từ: {OPENMETEO_FILE_PATH}")
     
     try:
+        if use_columnar_cache:
+            # Cache đã lưu sẵn ở múi giờ 'Asia/Ho_Chi_Minh', các cột là memmap (không copy)
+            df_weather = load_csv_cached(METEOSTAT_FILE_PATH, os.path.join(COLUMNAR_CACHE_DIR, 'meteostat'))
+            df_air = load_csv_cached(OPENMETEO_FILE_PATH, os.path.join(COLUMNAR_CACHE_DIR, 'openmeteo'))
+            return df_weather, df_air
+
         # 1. Đọc weather
         df_weather = pd.read_csv(METEOSTAT_FILE_PATH)
         time_col_w = 'time' if 'time' in df_weather.columns else 'date'
@@ -77,7 +111,7 @@ def merge_flags(series):
             combined.append(flags)
     return list(sorted(set(combined)))
 
-def run_general_rules(df, numeric_cols, report_name):
+def run_general_rules(df, numeric_cols, report_name, evaluator=None):
     df_flagged = df.copy()
     if 'qa_flags' not in df_flagged.columns:
         df_flagged['qa_flags'] = [[] for _ in range(len(df_flagged))]
@@ -92,10 +126,12 @@ def run_general_rules(df, numeric_cols, report_name):
     }
     
     print(f"Đang chạy bộ test tổng quát ({report_name})...")
-    for func_name, (rule_function, args) in rules_to_run.items():
-        all_args = [df_flagged] + args
-        result = rule_function(*all_args)
-        
+    if evaluator is None:
+        results = [rule_function(*([df_flagged] + args)) for rule_function, args in rules_to_run.values()]
+    else:
+        results = evaluator(df_flagged, list(rules_to_run.values()))
+
+    for result in results:
         rule_id = result['id']
         reason = result['reason']
         failing_indices = result['indices']
@@ -118,8 +154,7 @@ def run_general_rules(df, numeric_cols, report_name):
     # Lưu báo cáo JSON QA
     report_file_json = f'reports/qa_summary_{report_name}.json'
     try:
-        with open(report_file_json, 'w', encoding='utf-8') as f:
-            json.dump(summary_report, f, ensure_ascii=False, indent=4)
+        publish_json(summary_report, report_file_json, ensure_ascii=False, indent=4)
     except Exception as e:
         print(f"Lỗi ghi file báo cáo: {e}")
         
@@ -127,10 +162,28 @@ def run_general_rules(df, numeric_cols, report_name):
 
 
 # --- 3. CHƯƠNG TRÌNH CHÍNH (PIPELINE) ---
-def run_processing_pipeline(LAT, LON, YEAR):
+def run_processing_pipeline(LAT, LON, YEAR, use_quantile_sketch=False, use_columnar_cache=False,
+                            join_tolerance='30min', join_direction='nearest',
+                            multi_freqs=('3h', 'D', 'W', 'MS'), weather_glob=None, air_glob=None,
+                            qa_n_jobs=1, qa_n_shards=None, feature_store_dir='features'):
+    """
+    Pipeline Load -> QA -> Clean -> Aggregate -> Fill -> Save.
+    use_quantile_sketch=True: các cột phân vị (p50/p95) tính từ t-digest gộp được
+    (xem quantile_sketch.py); p95 tháng là p95 thật của dữ liệu giờ trong tháng.
+    use_columnar_cache=True: nạp dữ liệu thô qua cache cột memory-map (xem load_data).
+    join_tolerance / join_direction: dung sai và hướng khi ghép bảng giờ thời tiết + không khí
+    (xem hourly_alignment.py).
+    multi_freqs: các tần suất xuất thêm ra multi_*.csv (kèm chu kỳ ngày); được gom trong CÙNG lần duyệt
+    bảng giờ đã ghép tạo ra bảng ngày (xem multi_resample.py).
+    weather_glob / air_glob: nạp dữ liệu thô từ nhiều file nén thay cho 2 file CSV mặc định (xem load_data).
+    qa_n_jobs / qa_n_shards: chia chuỗi thành shard thời gian và chạy luật QA song song (parallel_qa.py).
+    feature_store_dir: thư mục kho feature theo ngày cho mô hình (feature_store.py); None để bỏ qua.
+    """
     print("--- Bắt đầu quy trình 'Làm sạch & Tổng hợp' dữ liệu ---")
+    start_run(f'processing_{LAT}_{LON}_{YEAR}')
     
-    df_weather, df_air = load_data()
+    df_weather, df_air = load_data(use_columnar_cache=use_columnar_cache,
+                                   weather_glob=weather_glob, air_glob=air_glob)
     
     if df_weather is not None and df_air is not None:
         if not os.path.exists('reports'): os.makedirs('reports')
@@ -141,15 +194,20 @@ def run_processing_pipeline(LAT, LON, YEAR):
         # ------------------------------------------------------
         print("\n[1/5] Bắt đầu soi lỗi (QA)...")
         
+        # Chuỗi dài: chia theo shard thời gian và chạy luật song song (kết quả giống hệt chạy một lượt)
+        evaluator = None
+        if qa_n_jobs > 1 or (qa_n_shards or 1) > 1:
+            evaluator = partial(evaluate_rules_sharded, n_shards=qa_n_shards, n_jobs=qa_n_jobs)
+
         # Weather QA
-        df_weather_flagged, _ = qa.apply_qa_rules(df_weather, qa.WEATHER_RULES_SET, "weather_specific")
+        df_weather_flagged, _ = qa.apply_qa_rules(df_weather, qa.WEATHER_RULES_SET, "weather_specific", evaluator=evaluator)
         weather_cols = ['temp', 'prcp', 'wspd', 'wdir', 'pres']
-        df_weather_flagged, _ = run_general_rules(df_weather_flagged, weather_cols, "weather_general")
+        df_weather_flagged, _ = run_general_rules(df_weather_flagged, weather_cols, "weather_general", evaluator=evaluator)
 
         # Air QA
-        df_air_flagged, _ = qa.apply_qa_rules(df_air, qa.AIR_QUALITY_SET, "air_quality_specific")
+        df_air_flagged, _ = qa.apply_qa_rules(df_air, qa.AIR_QUALITY_SET, "air_quality_specific", evaluator=evaluator)
         air_cols = ['pm10', 'pm2_5', 'uv_index', 'ozone', 'carbon_monoxide']
-        df_air_flagged, _ = run_general_rules(df_air_flagged, air_cols, "air_quality_general")
+        df_air_flagged, _ = run_general_rules(df_air_flagged, air_cols, "air_quality_general", evaluator=evaluator)
 
         # KHỞI TẠO IMPACT REPORT
         impact_report = {
@@ -199,6 +257,7 @@ def run_processing_pipeline(LAT, LON, YEAR):
         df_weather_cleaned.loc[df_weather_cleaned['qa_flags'].apply(lambda x: 'W-NEG-1' in x), ['prcp', 'wspd']] = np.nan
         df_weather_cleaned.loc[df_weather_cleaned['qa_flags'].apply(lambda x: 'W-BOUND-1' in x), 'temp'] = np.nan
         df_weather_cleaned.loc[df_weather_cleaned['qa_flags'].apply(lambda x: 'W-BOUND-2' in x), 'wdir'] = np.nan
+        df_weather_cleaned.loc[df_weather_cleaned['qa_flags'].apply(lambda x: 'W-SPIKE-1' in x or 'W-ROC-1' in x), 'temp'] = np.nan
         
         w_logic_1_mask = df_weather_cleaned['qa_flags'].apply(lambda x: 'W-LOGIC-1' in x)
         impact_report["cleaning_actions"]["cells_corrected_by_qa"]["W-LOGIC-1 (wdir=0)"] = int(w_logic_1_mask.sum())
@@ -207,6 +266,8 @@ def run_processing_pipeline(LAT, LON, YEAR):
         # Air
         df_air_cleaned.loc[df_air_cleaned['qa_flags'].apply(lambda x: 'AQ-NEG-1' in x), air_cols] = np.nan
         df_air_cleaned.loc[df_air_cleaned['qa_flags'].apply(lambda x: 'AQ-LOGIC-1' in x), ['pm10', 'pm2_5']] = np.nan
+        df_air_cleaned.loc[df_air_cleaned['qa_flags'].apply(lambda x: 'AQ-SPIKE-1' in x or 'AQ-ROC-1' in x), 'pm2_5'] = np.nan
+        df_air_cleaned.loc[df_air_cleaned['qa_flags'].apply(lambda x: 'AQ-SPIKE-2' in x or 'AQ-ROC-2' in x), 'pm10'] = np.nan
         
         aq_logic_2_mask = df_air_cleaned['qa_flags'].apply(lambda x: 'AQ-LOGIC-2' in x)
         impact_report["cleaning_actions"]["cells_corrected_by_qa"]["AQ-LOGIC-2 (uv_index=0)"] = int(aq_logic_2_mask.sum())
@@ -223,6 +284,15 @@ def run_processing_pipeline(LAT, LON, YEAR):
         
         print("Dọn dẹp xong. Đã ghi nhận vào báo cáo.")
 
+        # Ghép bảng GIỜ hai nguồn (as-of, có dung sai), giữ cờ QA của cả hai bên
+        df_hourly_joined = align_hourly_sources(df_weather_cleaned, df_air_cleaned,
+                                                tolerance=join_tolerance, direction=join_direction)
+        impact_report["hourly_alignment"] = {
+            "tolerance": join_tolerance,
+            "direction": join_direction,
+            **alignment_summary(df_hourly_joined)
+        }
+
         # ------------------------------------------------------
         # [BƯỚC 3] GOM DỮ LIỆU: GIỜ -> NGÀY (RESAMPLE)
         # ------------------------------------------------------
@@ -233,54 +303,63 @@ def run_processing_pipeline(LAT, LON, YEAR):
             "air_rows_hourly": len(df_air_cleaned)
         }
 
-        # [SỬA ĐỔI] Thêm 'qa_flags': merge_flags vào quy tắc
-        weather_agg_rules = {
-            'temp': ['mean', 'median', lambda x: x.quantile(0.95)],
-            'prcp': 'sum',
-            'wspd': 'mean',
-            'wdir': calculate_vector_mean_wind_direction,
-            'pres': 'mean',
-            'qa_flags': merge_flags # <--- GIỮ LẠI FLAG
+        # MỘT lần duyệt bảng giờ đã ghép cho mọi tần suất (multi_resample.py): bảng ngày bên dưới và
+        # các tệp multi_* (bước 11) dùng chung tổng hợp cục bộ nên luôn khớp nhau.
+        # Phân vị ngày (p50/p95) tính chính xác trong cùng lần duyệt, hoặc từ t-digest nếu use_quantile_sketch.
+        daily_quantiles = {} if use_quantile_sketch else {'temp': [0.5, 0.95], 'pm10': [0.95], 'pm2_5': [0.95]}
+        resample_freqs = ['D'] + [freq for freq in (multi_freqs or ()) if freq != 'D']
+        multi_frames = multi_resample(df_hourly_joined, freqs=resample_freqs,
+                                      diurnal=bool(multi_freqs), quantiles=daily_quantiles)
+        df_day = multi_frames['D']
+
+        # Cột ngày của từng nguồn (thống kê giống luật gom cũ: mean / sum / max / vector mean hướng gió)
+        weather_daily_cols = {
+            'temp': 'temperature_mean',
+            'temp_p50': 'temperature_p50',
+            'temp_p95': 'temperature_p95',
+            'prcp': 'precipitation_sum',
+            'wspd': 'wind_speed_mean',
+            'wdir': 'wind_direction_mean',
+            'pres': 'air_pressure',
         }
-        air_agg_rules = {
-            'pm10': ['mean', lambda x: x.quantile(0.95)],
-            'pm2_5': ['mean', lambda x: x.quantile(0.95)],
-            'uv_index': 'max',
-            'ozone': 'mean',
-            'carbon_monoxide': 'mean',
-            'qa_flags': merge_flags 
+        air_daily_cols = {
+            'pm10': 'pm10_mean',
+            'pm10_p95': 'pm10_p95',
+            'pm2_5': 'pm2_5_mean',
+            'pm2_5_p95': 'pm2_5_p95',
+            'uv_index': 'uv_index_max',
+            'ozone': 'ozone_mean',
+            'carbon_monoxide': 'carbon_monoxide_mean',
         }
 
-        daily_weather = df_weather_cleaned.resample('D').agg(weather_agg_rules)
-        daily_air = df_air_cleaned.resample('D').agg(air_agg_rules)
-        
+        def source_daily(df_source, columns):
+            """Cột ngày của một nguồn, giới hạn trong các ngày nguồn đó có dữ liệu (như resample riêng từng nguồn)."""
+            days = df_source.index.normalize()
+            columns = {col: name for col, name in columns.items() if col in df_day.columns}
+            return df_day.loc[days.min():days.max(), list(columns)].rename(columns=columns)
+
+        daily_weather = source_daily(df_weather_cleaned, weather_daily_cols)
+        daily_air = source_daily(df_air_cleaned, air_daily_cols)
+
         impact_report["fill_actions"]["resampling_effect"]["daily_rows"] = len(daily_weather)
 
-        # Làm phẳng tên cột MultiIndex
-        daily_weather.columns = ['_'.join(col).strip('_') for col in daily_weather.columns.values]
-        daily_air.columns = ['_'.join(col).strip('_') for col in daily_air.columns.values]
-
-        # Rename cột cho chuẩn
-        daily_weather = daily_weather.rename(columns={
-            'temp_mean': 'temperature_mean',
-            'temp_median': 'temperature_p50',
-            'temp_<lambda_0>': 'temperature_p95',
-            'prcp_sum': 'precipitation_sum',
-            'wspd_mean': 'wind_speed_mean',
-            'wdir_calculate_vector_mean_wind_direction': 'wind_direction_mean',
-            'pres_mean': 'air_pressure',
-            'qa_flags_merge_flags': 'qa_flags' 
-        })
-        daily_air = daily_air.rename(columns={
-            'pm10_mean': 'pm10_mean',
-            'pm10_<lambda_0>': 'pm10_p95',
-            'pm2_5_mean': 'pm2_5_mean',
-            'pm2_5_<lambda_0>': 'pm2_5_p95',
-            'uv_index_max': 'uv_index_max',
-            'ozone_mean': 'ozone_mean',
-            'carbon_monoxide_mean': 'carbon_monoxide_mean',
-            'qa_flags_merge_flags': 'qa_flags' 
-        })
+        if use_quantile_sketch:
+            # Digest theo ngày: trạng thái gộp được cho tháng / năm / trạm khác.
+            # Mỗi biến là một Series RIÊNG: nguồn thời tiết và không khí có thể phủ các ngày khác nhau,
+            # ghép chung một DataFrame sẽ để lại ô NaN (float) thay vì digest.
+            daily_digests = {
+                'temp': df_weather_cleaned['temp'].resample('D').apply(TDigest.from_values),
+                'pm10': df_air_cleaned['pm10'].resample('D').apply(TDigest.from_values),
+                'pm2_5': df_air_cleaned['pm2_5'].resample('D').apply(TDigest.from_values),
+            }
+            sketch_q = lambda col, q: daily_digests[col].apply(
+                lambda d: d.quantile(q) if isinstance(d, TDigest) else np.nan)
+            daily_weather.insert(daily_weather.columns.get_loc('temperature_mean') + 1,
+                                 'temperature_p50', sketch_q('temp', 0.5))
+            daily_weather.insert(daily_weather.columns.get_loc('temperature_p50') + 1,
+                                 'temperature_p95', sketch_q('temp', 0.95))
+            daily_air.insert(daily_air.columns.get_loc('pm10_mean') + 1, 'pm10_p95', sketch_q('pm10', 0.95))
+            daily_air.insert(daily_air.columns.get_loc('pm2_5_mean') + 1, 'pm2_5_p95', sketch_q('pm2_5', 0.95))
 
         # --- FILL DỮ LIỆU ---
         # 1. Fill mưa
@@ -306,25 +385,15 @@ def run_processing_pipeline(LAT, LON, YEAR):
             "air": int(nan_before_interp_a - nan_after_interp_a)
         }
 
-        # Ghép bảng (Merge) Daily
+        # Ghép bảng (Merge) Daily; cờ QA ngày = hợp cờ của mọi giờ (cả hai nguồn) trong ngày
         df_daily_final = pd.merge(daily_weather, daily_air, left_index=True, right_index=True, how='outer')
-        
-        # [SỬA ĐỔI] Gộp cờ sau khi merge (xử lý qa_flags_x và qa_flags_y)
-        def combine_daily_flags(row):
-            flags = []
-            if 'qa_flags_x' in row and isinstance(row['qa_flags_x'], list): 
-                flags.extend(row['qa_flags_x'])
-            if 'qa_flags_y' in row and isinstance(row['qa_flags_y'], list): 
-                flags.extend(row['qa_flags_y'])
-            # Cũng có thể nó chưa bị đổi tên nếu merge index
-            if 'qa_flags' in row and isinstance(row['qa_flags'], list):
-                 flags.extend(row['qa_flags'])
-            return list(sorted(set(flags)))
-
-        # Pandas merge có thể tạo ra suffixes _x, _y nếu trùng tên
-        df_daily_final['qa_flags'] = df_daily_final.apply(combine_daily_flags, axis=1)
-        # Xóa các cột thừa sau gộp
-        df_daily_final = df_daily_final.drop(columns=['qa_flags_x', 'qa_flags_y'], errors='ignore')
+        df_daily_final['qa_flags'] = df_day['qa_flags'].reindex(df_daily_final.index)
+        df_daily_final['qa_flags'] = [flags if isinstance(flags, list) else [] for flags in df_daily_final['qa_flags']]
+
+        # AQI chuẩn (EPA): NowCast giờ + AQI ngày, tính trên dữ liệu giờ đã làm sạch
+        hourly_aqi = compute_hourly_aqi(df_air_cleaned)
+        daily_aqi = compute_daily_aqi(df_air_cleaned, hourly_aqi)
+        df_daily_final = df_daily_final.join(daily_aqi[['aqi', 'aqi_dominant', 'aqi_category']], how='left')
 
         # ------------------------------------------------------
         # [BƯỚC 4] TẠO BẢNG TUẦN VÀ THÁNG
@@ -364,6 +433,14 @@ def run_processing_pipeline(LAT, LON, YEAR):
             'polluted_day': 'sum',
             'qa_flags': merge_flags }
         df_monthly = df_daily_final.resample('MS').agg(monthly_aggs)
+        if use_quantile_sketch:
+            # Gộp digest ngày -> phân vị tháng của dữ liệu GIỜ (thay vì p95 của các p95 ngày)
+            # (digest_quantile -> merge_digests chỉ gộp các phần tử là TDigest, bỏ qua ô trống)
+            monthly_temp_digests = daily_digests['temp'].resample('MS')
+            df_monthly['temperature_p50'] = monthly_temp_digests.apply(
+                lambda x: digest_quantile([d for d in x if isinstance(d, TDigest)], 0.5))
+            df_monthly['temperature_p95'] = monthly_temp_digests.apply(
+                lambda x: digest_quantile([d for d in x if isinstance(d, TDigest)], 0.95))
         df_monthly = df_monthly.rename(columns={
             'precipitation_sum': 'precipitation_total',
             'rainy_day': 'rainy_days_count',
@@ -380,6 +457,14 @@ def run_processing_pipeline(LAT, LON, YEAR):
         baseline_pm25 = df_monthly['pm2_5_mean'].mean()
         df_monthly['AQI_index_100'] = (df_monthly['pm2_5_mean'] / baseline_pm25) * 100
 
+        # Index 100 theo đường nền NHIỀU NĂM (nếu đã chạy climatology cho trạm, xem climatology.py)
+        clim_path = f'climatology/clim_{LAT}_{LON}.npz'
+        if os.path.exists(clim_path):
+            clim_month = month_baseline(load_state(clim_path))['pm2_5_mean']
+            df_monthly['AQI_clim_index_100'] = (
+                df_monthly['pm2_5_mean'] / clim_month.reindex(df_monthly.index.month).to_numpy()
+            ) * 100
+
         # ------------------------------------------------------
         # [BƯỚC 5] LÀM TRÒN, FORMAT FLAGS & LƯU FILE
         # ------------------------------------------------------
@@ -401,8 +486,7 @@ def run_processing_pipeline(LAT, LON, YEAR):
 
         impact_report_path = 'reports/qa_impact_report.json'
         try:
-            with open(impact_report_path, 'w', encoding='utf-8') as f:
-                json.dump(impact_report, f, ensure_ascii=False, indent=4)
+            publish_json(impact_report, impact_report_path, ensure_ascii=False, indent=4)
             print(f" -> Đã lưu Báo cáo Tác động: {impact_report_path}")
         except Exception as e:
             print(f"Lỗi lưu report: {e}")
@@ -433,12 +517,82 @@ def run_processing_pipeline(LAT, LON, YEAR):
         path_weekly = f'processed/weekly_weather_aqi_{LAT}_{LON}_{YEAR}.csv'
         path_monthly = f'processed/monthly_weather_aqi_{LAT}_{LON}_{YEAR}.csv'
 
-        df_daily_final.to_csv(path_daily, index=False)
-        df_weekly.to_csv(path_weekly, index=False)
-        df_monthly.to_csv(path_monthly, index=False)
+        # Chỉ ghi file có nội dung thay đổi (ghi nguyên tử, checksum trong reports/artifact_manifest.json)
+        publish_csv(df_daily_final, path_daily, index=False)
+        publish_csv(df_weekly, path_weekly, index=False)
+        publish_csv(df_monthly, path_monthly, index=False)
 
         print(f" -> Xong file Ngày: {path_daily}")
         print(f" -> Xong file Tuần: {path_weekly}")
         print(f" -> Xong file Tháng: {path_monthly}")
+
+        if use_quantile_sketch:
+            path_sketch = f'processed/quantile_sketch_{LAT}_{LON}_{YEAR}.json'
+            sketch_states = {}
+            for col, digests in daily_digests.items():
+                for ts, digest in digests.items():
+                    if isinstance(digest, TDigest):
+                        sketch_states.setdefault(ts.isoformat(), {})[col] = digest.to_dict()
+            sketch_states = dict(sorted(sketch_states.items()))
+            publish_json(sketch_states, path_sketch)
+            print(f" -> Xong file trạng thái sketch phân vị (theo ngày): {path_sketch}")
+
+        # 7. AQI giờ (NowCast + AQI thành phần)
+        path_hourly_aqi = f'processed/hourly_aqi_{LAT}_{LON}_{YEAR}.csv'
+        hourly_aqi_out = hourly_aqi.reset_index().rename(columns={hourly_aqi.index.name or 'index': 'time'})
+        numeric_cols = hourly_aqi_out.select_dtypes(include=[np.number]).columns
+        hourly_aqi_out[numeric_cols] = hourly_aqi_out[numeric_cols].round(4)
+        publish_csv(hourly_aqi_out, path_hourly_aqi, index=False)
+        print(f" -> Xong file AQI giờ: {path_hourly_aqi}")
+
+        # 8. Cube tổng hợp Tháng x Thứ x Giờ (count / sum / sumsq) từ dữ liệu giờ đã làm sạch
+        cube = concat_cubes([build_cube(df_weather_cleaned, weather_cols),
+                             build_cube(df_air_cleaned, air_cols)])
+        path_cube = f'processed/cube_{LAT}_{LON}_{YEAR}.npz'
+        save_cube(cube, path_cube)
+        print(f" -> Xong file Cube (Tháng x Thứ x Giờ): {path_cube}")
+
+        # 9. Bảng đợt ô nhiễm (chuỗi giờ/ngày liên tiếp PM2.5 > 50)
+        episodes_hourly = detect_episodes(df_air_cleaned, value_col='pm2_5', threshold=50, min_duration=3, freq='h')
+        episodes_daily = detect_episodes(df_daily_final, value_col='pm2_5_mean', threshold=50, min_duration=2,
+                                         freq='D', time_col='time')
+        episodes_hourly.insert(0, 'resolution', 'hourly')
+        episodes_daily.insert(0, 'resolution', 'daily')
+        df_episodes = pd.concat([episodes_hourly, episodes_daily], ignore_index=True)
+        numeric_cols = df_episodes.select_dtypes(include=[np.number]).columns
+        df_episodes[numeric_cols] = df_episodes[numeric_cols].round(2)
+
+        path_episodes = f'processed/episodes_pm2_5_{LAT}_{LON}_{YEAR}.csv'
+        publish_csv(df_episodes, path_episodes, index=False)
+        print(f" -> Xong file Đợt ô nhiễm ({len(episodes_hourly)} đợt giờ, {len(episodes_daily)} đợt ngày): {path_episodes}")
+
+        # 10. Bảng giờ đã ghép (thời tiết + không khí) cho mô hình hoá
+        path_hourly_joined = f'processed/hourly_joined_{LAT}_{LON}_{YEAR}.csv'
+        hourly_joined_out = df_hourly_joined.reset_index()
+        for col in ['qa_flags_weather', 'qa_flags_air', 'qa_flags']:
+            hourly_joined_out[col] = hourly_joined_out[col].apply(format_flags_to_string)
+        numeric_cols = hourly_joined_out.select_dtypes(include=[np.number]).columns
+        hourly_joined_out[numeric_cols] = hourly_joined_out[numeric_cols].round(4)
+        publish_csv(hourly_joined_out, path_hourly_joined, index=False)
+        print(f" -> Xong file Giờ đã ghép: {path_hourly_joined}")
+
+        # 11. Gom nhiều tần suất + chu kỳ ngày: lấy từ cùng lần duyệt đã tạo bảng ngày (bước 3)
+        if multi_freqs:
+            for freq in [*multi_freqs, 'diurnal']:
+                df_freq = multi_frames[freq]
+                path_freq = f'processed/multi_{freq}_{LAT}_{LON}_{YEAR}.csv'
+                df_freq_out = df_freq.reset_index().rename(columns={'index': 'time'})
+                df_freq_out['qa_flags'] = df_freq_out['qa_flags'].apply(format_flags_to_string)
+                numeric_cols = df_freq_out.select_dtypes(include=[np.floating]).columns
+                df_freq_out[numeric_cols] = df_freq_out[numeric_cols].round(2)
+                publish_csv(df_freq_out, path_freq, index=False)
+            print(f" -> Xong file gom đa tần suất ({', '.join(multi_freqs)} + diurnal): processed/multi_*_{LAT}_{LON}_{YEAR}.csv")
+
+        # 12. Kho feature theo ngày (lag / cửa sổ trượt / lịch) cho các mô hình, cập nhật tăng dần
+        if feature_store_dir:
+            update_feature_store(LAT, LON, [YEAR], processed_dir='processed', store_dir=feature_store_dir)
+
+        # Danh sách file thay đổi trong lần chạy (reports/changed_artifacts.json) cho hệ thống phía sau
+        end_run()
         
         print("\n--- DONE ---")
\ No newline at end of file
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+"""
+File: hourly_alignment.py
+Mô tả: Ghép dữ liệu GIỜ của hai nguồn (thời tiết Meteostat + không khí Open-Meteo) theo thời gian
+với dung sai (tolerance) và hướng (direction) cấu hình được.
+
+Hai nguồn có thể lệch mốc (ví dụ :30 so với :00) hoặc không đều giờ, nên không thể merge
+bằng index chính xác. Ở đây mỗi nguồn được ghép "as-of" (pd.merge_asof, hai con trỏ trên dữ liệu
+đã sắp xếp, không reindex/tạo bảng trung gian lớn) vào một lưới giờ đều chung:
+    - direction='nearest'  : lấy bản ghi GẦN NHẤT trong khoảng ±tolerance
+    - direction='backward' : lấy bản ghi GẦN NHẤT TRƯỚC (hoặc bằng) mốc lưới
+    - direction='forward'  : lấy bản ghi GẦN NHẤT SAU (hoặc bằng) mốc lưới
+Cờ QA của từng nguồn được giữ riêng (qa_flags_weather / qa_flags_air) và gộp vào 'qa_flags'.
+"""
+
+SOURCE_NAMES = ('weather', 'air')
+
+
+def _prepare_source(df, name):
+    """Bỏ mốc trùng (giữ bản đầu), sắp xếp theo thời gian, đưa index thành cột '<name>_time'."""
+    df = df[~df.index.duplicated(keep='first')]
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    time_col = f'{name}_time'
+    out = df.rename(columns={'qa_flags': f'qa_flags_{name}'})
+    out.index = out.index.rename(time_col)
+    return out.reset_index()
+
+
+def align_hourly_sources(df_weather, df_air, tolerance='30min', direction='nearest', freq='h'):
+    """
+    Ghép bảng giờ thời tiết và không khí (DatetimeIndex cùng múi giờ) lên lưới 'freq' đều.
+
+    - tolerance: độ lệch thời gian tối đa được chấp nhận (chuỗi Timedelta, ví dụ '30min').
+    - direction: 'nearest' | 'backward' | 'forward' (xem mô tả file).
+    Trả về DataFrame index 'time' (lưới đều phủ khoảng thời gian của cả hai nguồn) gồm:
+    các cột số của hai nguồn, 'weather_time' / 'air_time' (mốc gốc được ghép, NaT nếu không ghép được),
+    'qa_flags_weather', 'qa_flags_air' và 'qa_flags' (hợp của hai bên, đã sắp xếp).
+    """
+    if direction not in ('nearest', 'backward', 'forward'):
+        raise ValueError("direction phải là 'nearest', 'backward' hoặc 'forward'.")
+    tolerance = pd.Timedelta(tolerance)
+    overlap = set(df_weather.columns) & set(df_air.columns) - {'qa_flags'}
+    if overlap:
+        raise ValueError(f"Hai nguồn bị trùng tên cột: {sorted(overlap)}")
+
+    frames = dict(zip(SOURCE_NAMES, (df_weather, df_air)))
+    sources = {name: _prepare_source(df, name) for name, df in frames.items()}
+
+    starts = [s[f'{n}_time'].iloc[0] for n, s in sources.items() if len(s)]
+    ends = [s[f'{n}_time'].iloc[-1] for n, s in sources.items() if len(s)]
+    if not starts:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='time'))
+    grid = pd.DataFrame({'time': pd.date_range(min(starts).floor(freq), max(ends).ceil(freq), freq=freq)})
+
+    joined = grid
+    for name, source in sources.items():
+        joined = pd.merge_asof(joined, source, left_on='time', right_on=f'{name}_time',
+                               tolerance=tolerance, direction=direction)
+
+    # Cờ QA: hàng không ghép được -> list rỗng; 'qa_flags' = hợp của hai nguồn
+    flag_cols = [f'qa_flags_{name}' for name in SOURCE_NAMES]
+    for col in flag_cols:
+        if col not in joined.columns:
+            joined[col] = None
+        joined[col] = [flags if isinstance(flags, list) else [] for flags in joined[col]]
+    joined['qa_flags'] = [sorted(set(w) | set(a)) for w, a in zip(joined[flag_cols[0]], joined[flag_cols[1]])]
+
+    return joined.set_index('time')
+
+
+def alignment_summary(joined):
+    """Thống kê nhanh chất lượng ghép: số giờ ghép được từng nguồn và độ lệch thời gian."""
+    summary = {'grid_rows': len(joined)}
+    for name in SOURCE_NAMES:
+        offsets = (joined[f'{name}_time'] - joined.index.to_series()).dt.total_seconds() / 60
+        matched = offsets.notna()
+        summary[name] = {
+            'matched_rows': int(matched.sum()),
+            'exact_rows': int((offsets == 0).sum()),
+            'max_abs_offset_minutes': float(np.abs(offsets[matched]).max()) if matched.any() else None,
+        }
+    return summary
@@ -0,0 +1,97 @@
+import io
+import os
+import glob
+import gzip
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# zstd là tuỳ chọn: chỉ cần khi có file .zst
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+File: multi_file_ingestion.py
+Mô tả: Nạp dữ liệu thô từ NHIỀU file (ví dụ mỗi tháng một file, mỗi trạm một thư mục),
+có thể NÉN gzip (.gz) hoặc zstd (.zst/.zstd), không cần giải nén ra đĩa trước.
+
+    - Mỗi file được giải nén DẠNG LUỒNG (stream) và parse thẳng bằng pd.read_csv.
+    - Các file được đọc song song (ProcessPoolExecutor, n_jobs > 1).
+    - Ghép theo thứ tự thời gian; với mốc thời gian xuất hiện ở NHIỀU file (các file tháng
+      chồng lấn nhau) thì giữ bản ghi của file ĐỨNG SAU trong thứ tự tên file (file mới hơn thắng).
+      Bản ghi trùng NẰM TRONG cùng một file được giữ nguyên để luật GEN-DUP-1 vẫn phát hiện được.
+Kết quả có cùng dạng với load_data() (index thời gian múi giờ Asia/Ho_Chi_Minh) nên đưa thẳng vào QA.
+"""
+
+LOCAL_TZ = 'Asia/Ho_Chi_Minh'
+
+
+def open_text_stream(path):
+    """Mở file (nén hoặc không) thành luồng text, giải nén dần khi đọc."""
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if lower.endswith(('.zst', '.zstd')):
+        if zstandard is None:
+            raise ImportError(f"Cần cài thư viện 'zstandard' để đọc file {path}.")
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def read_raw_file(path):
+    """Đọc một file thô: cột thời gian 'time' hoặc 'date' -> DatetimeIndex múi giờ Việt Nam."""
+    with open_text_stream(path) as stream:
+        df = pd.read_csv(stream)
+    time_col = 'time' if 'time' in df.columns else 'date'
+    index = pd.DatetimeIndex(pd.to_datetime(df[time_col]))
+    # Giống load_data: không có múi giờ -> coi là UTC
+    index = index.tz_localize('UTC') if index.tz is None else index
+    df = df.drop(columns=time_col)
+    df.index = index.tz_convert(LOCAL_TZ).rename(time_col)
+    return df
+
+
+def combine_files(frames):
+    """
+    Ghép các DataFrame theo thứ tự file: sắp theo thời gian, mốc trùng GIỮA các file -> giữ file sau.
+    Trả về (DataFrame, số dòng bị thay thế do chồng lấn).
+    """
+    frames = [df for df in frames if len(df)]
+    if not frames:
+        return pd.DataFrame(), 0
+    ranks = np.concatenate([np.full(len(df), i) for i, df in enumerate(frames)])
+    combined = pd.concat(frames)
+    # Thứ hạng file lớn nhất của từng mốc thời gian (vector hoá bằng groupby.transform)
+    times = pd.Series(combined.index.asi8)
+    best_rank = pd.Series(ranks).groupby(times.to_numpy()).transform('max').to_numpy()
+    keep = ranks == best_rank
+    combined = combined[keep]
+    order = np.argsort(combined.index.asi8, kind='stable')
+    return combined.iloc[order], int((~keep).sum())
+
+
+def load_source_files(pattern, n_jobs=4):
+    """Đọc mọi file khớp glob 'pattern' (sắp theo tên), song song nếu n_jobs > 1."""
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise FileNotFoundError(f"Không có file nào khớp: {pattern}")
+    if n_jobs is not None and n_jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(paths))) as executor:
+            frames = list(executor.map(read_raw_file, paths))
+    else:
+        frames = [read_raw_file(path) for path in paths]
+
+    df, n_replaced = combine_files(frames)
+    print(f"Đã nạp {len(paths)} file ({len(df)} dòng, {n_replaced} dòng chồng lấn bị thay bằng file sau): {pattern}")
+    return df
+
+
+def load_multi_file_data(weather_glob, air_glob, n_jobs=4):
+    """Giống load_data() nhưng nạp từ nhiều file nén. Trả về (df_weather, df_air)."""
+    print(f"\nĐang đọc dữ liệu thời tiết từ: {weather_glob}")
+    print(f"Đang đọc dữ liệu không khí từ: {air_glob}")
+    return load_source_files(weather_glob, n_jobs), load_source_files(air_glob, n_jobs)
@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+
+"""
+File: multi_resample.py
+Mô tả: Gom dữ liệu GIỜ ra NHIỀU tần suất cùng lúc (ví dụ 3 giờ, ngày, tuần, tháng)
+và chu kỳ ngày (diurnal profile, 24 giờ) trong MỘT lần duyệt dữ liệu.
+
+Cách làm:
+    1. Duyệt dữ liệu giờ MỘT lần, tính tổng hợp cục bộ (count, sum, min, max, tổng sin/cos
+       cho hướng gió, OR bitmask cờ QA) theo các ô thời gian MỊN NHẤT (ví dụ 3 giờ)
+       bằng np.*.reduceat trên dữ liệu đã sắp xếp; cùng lúc gom theo giờ trong ngày (bincount).
+    2. Các tần suất thô hơn (ngày / tuần / tháng) được gộp từ tổng hợp cục bộ của ô mịn
+       (số ô ít hơn số giờ nhiều lần) — không resample lại dữ liệu gốc cho từng tần suất.
+Cờ QA được mã hoá thành bitmask (mỗi mã cờ một bit) nên phép gộp chỉ là OR số nguyên.
+Phân vị (quantiles) KHÔNG gộp được từ tổng hợp cục bộ: với mỗi tần suất, các giá trị giờ được sắp xếp
+theo (khoảng, giá trị) một lần rồi lấy thống kê thứ tự — nội suy tuyến tính giống pandas quantile.
+
+Nhãn khoảng giống pandas resample: tần suất giờ -> đầu khoảng, 'D' -> đầu ngày,
+'W' -> Chủ nhật cuối tuần, 'MS' -> ngày đầu tháng, 'ME' -> ngày cuối tháng.
+"""
+
+# Thống kê của từng biến (giống luật gom ngày trong run_processing_pipeline)
+DEFAULT_AGG_SPEC = {
+    'temp': 'mean',
+    'prcp': 'sum',
+    'wspd': 'mean',
+    'wdir': 'vector_mean',
+    'pres': 'mean',
+    'pm10': 'mean',
+    'pm2_5': 'mean',
+    'uv_index': 'max',
+    'ozone': 'mean',
+    'carbon_monoxide': 'mean',
+}
+DEFAULT_FREQS = ('3h', 'D', 'W', 'MS')
+DAY_NS = 86_400 * 10**9
+
+
+def _tick_ns(freq):
+    """Số nano giây của tần suất dạng giờ/phút ('h', '3h', '30min'); None nếu không phải."""
+    try:
+        offset = pd.tseries.frequencies.to_offset(freq)
+    except ValueError:
+        return None
+    if not isinstance(offset, pd.offsets.Tick) or isinstance(offset, pd.offsets.Day):
+        return None
+    return int(pd.Timedelta(offset).value)
+
+
+def _bin_labels(index, freq):
+    """Nhãn khoảng (giống resample) cho mỗi mốc thời gian trong index."""
+    tick = _tick_ns(freq)
+    if tick is not None:
+        if DAY_NS % tick:
+            raise ValueError(f"Tần suất '{freq}' phải chia hết cho 1 ngày.")
+        return index.floor(freq)
+    day = index.normalize()
+    if freq == 'D':
+        return day
+    if freq in ('W', 'W-SUN'):
+        return day + pd.to_timedelta(6 - day.weekday, unit='D')
+    if freq == 'MS':
+        return day - pd.to_timedelta(day.day - 1, unit='D')
+    if freq in ('ME', 'M'):
+        return day + pd.to_timedelta(day.days_in_month - day.day, unit='D')
+    raise ValueError(f"Tần suất không hỗ trợ: '{freq}' (dùng giờ/phút, 'D', 'W', 'MS', 'ME').")
+
+
+def _full_range(labels, freq):
+    """Dải nhãn đầy đủ (kể cả khoảng rỗng) giống kết quả của resample."""
+    alias = {'W': 'W-SUN', 'M': 'ME'}.get(freq, freq)
+    return pd.date_range(labels.min(), labels.max(), freq=alias, name=labels.name)
+
+
+def encode_flags(flag_lists):
+    """Danh sách cờ mỗi dòng -> (mảng bitmask int64, danh sách mã cờ theo thứ tự bit)."""
+    cache = {}
+    codes = []
+    masks = np.zeros(len(flag_lists), dtype=np.int64)
+    for i, flags in enumerate(flag_lists):
+        if not isinstance(flags, list) or not flags:
+            continue
+        key = tuple(flags)
+        mask = cache.get(key)
+        if mask is None:
+            mask = 0
+            for flag in flags:
+                if flag not in codes:
+                    if len(codes) == 63:
+                        raise ValueError("Quá 63 mã cờ QA khác nhau, không mã hoá được bằng bitmask int64.")
+                    codes.append(flag)
+                mask |= 1 << codes.index(flag)
+            cache[key] = mask
+        masks[i] = mask
+    return masks, codes
+
+
+def decode_flags(masks, codes):
+    """Bitmask -> danh sách cờ đã sắp xếp (giải mã một lần cho mỗi giá trị mask khác nhau)."""
+    uniques, inverse = np.unique(np.asarray(masks, dtype=np.int64), return_inverse=True)
+    decoded = [sorted(code for bit, code in enumerate(codes) if int(m) >> bit & 1) for m in uniques]
+    return [list(decoded[i]) for i in inverse.ravel()]
+
+
+def _partials(values, starts, angle):
+    """Tổng hợp cục bộ của một biến trên các đoạn [starts[i], starts[i+1]) của mảng đã sắp xếp."""
+    valid = ~np.isnan(values)
+    zeros = np.where(valid, values, 0.0)
+    part = {
+        'count': np.add.reduceat(valid.astype(float), starts),
+        'sum': np.add.reduceat(zeros, starts),
+        'min': np.fmin.reduceat(values, starts),
+        'max': np.fmax.reduceat(values, starts),
+    }
+    if angle:
+        rads = np.deg2rad(values)
+        part['sin'] = np.add.reduceat(np.where(valid, np.sin(rads), 0.0), starts)
+        part['cos'] = np.add.reduceat(np.where(valid, np.cos(rads), 0.0), starts)
+    return part
+
+
+def _combine(part, starts):
+    """Gộp tổng hợp cục bộ của các ô liên tiếp thành ô thô hơn."""
+    out = {}
+    for key, arr in part.items():
+        if key == 'min':
+            out[key] = np.fmin.reduceat(arr, starts)
+        elif key == 'max':
+            out[key] = np.fmax.reduceat(arr, starts)
+        else:
+            out[key] = np.add.reduceat(arr, starts)
+    return out
+
+
+def _finalize(part, stat):
+    """Tổng hợp cục bộ -> giá trị cuối theo thống kê của biến."""
+    count = part['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if stat == 'mean':
+            return np.where(count > 0, part['sum'] / count, np.nan)
+        if stat == 'sum':
+            return part['sum']  # giống pandas: tổng của khoảng không có dữ liệu = 0
+        if stat in ('min', 'max'):
+            return part[stat]
+        if stat == 'vector_mean':
+            deg = np.rad2deg(np.arctan2(part['sin'] / count, part['cos'] / count))
+            return np.where(count > 0, np.where(deg < 0, deg + 360, deg), np.nan)
+    raise ValueError(f"Thống kê không hỗ trợ: '{stat}'")
+
+
+def _segment_quantiles(values, seg_ids, starts, qs):
+    """
+    Phân vị của từng đoạn (seg_ids không giảm, starts: vị trí đầu mỗi đoạn), bỏ qua NaN.
+    Nội suy tuyến tính giống numpy/pandas quantile; đoạn không có dữ liệu -> NaN.
+    """
+    valid = ~np.isnan(values)
+    sorted_vals = values[np.lexsort((values, seg_ids))]  # NaN nằm cuối mỗi đoạn
+    count = np.add.reduceat(valid.astype(float), starts)
+    last = len(values) - 1
+    out = {}
+    for q in qs:
+        pos = q * (count - 1)
+        lo = np.floor(pos)
+        frac = pos - lo
+        a = sorted_vals[np.clip(starts + lo.astype(np.int64), 0, last)]
+        b = sorted_vals[np.clip(starts + np.ceil(pos).astype(np.int64), 0, last)]
+        diff = b - a
+        with np.errstate(invalid='ignore'):
+            value = np.where(frac >= 0.5, b - diff * (1 - frac), a + diff * frac)
+        out[q] = np.where(count > 0, value, np.nan)
+    return out
+
+
+def quantile_column(col, q):
+    """Tên cột phân vị: ('temp', 0.95) -> 'temp_p95'."""
+    return f'{col}_p{q * 100:g}'
+
+
+def _segment_starts(labels_ns):
+    """Vị trí bắt đầu của mỗi đoạn nhãn bằng nhau trong mảng nhãn đã sắp xếp."""
+    return np.flatnonzero(np.r_[True, labels_ns[1:] != labels_ns[:-1]])
+
+
+def _build_frame(labels, parts, n_rows, flag_masks, flag_codes, agg_spec, freq, extra=None):
+    data = {col: _finalize(parts[col], stat) for col, stat in agg_spec.items()}
+    data.update(extra or {})
+    data['n_hours'] = n_rows
+    data['qa_flag_mask'] = flag_masks
+    out = pd.DataFrame(data, index=labels)
+    if freq is not None:
+        out = out.reindex(_full_range(labels, freq))
+        fill = {'n_hours': 0, 'qa_flag_mask': 0}
+        fill.update({col: 0.0 for col, stat in agg_spec.items() if stat == 'sum'})
+        out = out.fillna(fill)
+        out['n_hours'] = out['n_hours'].astype(int)
+        out['qa_flag_mask'] = out['qa_flag_mask'].astype(np.int64)
+    out['qa_flags'] = decode_flags(out['qa_flag_mask'].to_numpy(), flag_codes)
+    out.attrs['qa_flag_bits'] = list(flag_codes)
+    return out
+
+
+def multi_resample(df_hourly, freqs=DEFAULT_FREQS, agg_spec=None, diurnal=True, quantiles=None):
+    """
+    Gom bảng giờ (DatetimeIndex, cột số + tuỳ chọn 'qa_flags' dạng list) ra nhiều tần suất.
+
+    - freqs: các tần suất cần xuất (tần suất giờ/phút phải chia hết 1 ngày; 'D', 'W', 'MS', 'ME').
+    - agg_spec: {cột: 'mean' | 'sum' | 'min' | 'max' | 'vector_mean'}; mặc định DEFAULT_AGG_SPEC
+      (chỉ giữ các cột có trong dữ liệu).
+    - diurnal=True: thêm khoá 'diurnal' — chu kỳ ngày (index 0..23 giờ); các biến 'sum'
+      được lấy TRUNG BÌNH theo giờ (tổng cả năm theo giờ không có ý nghĩa).
+    - quantiles: {cột: [q, ...]} -> thêm cột phân vị chính xác '<cột>_p<100q>' (ví dụ 'temp_p95')
+      cho mọi tần suất trong freqs (không áp dụng cho diurnal).
+
+    Mỗi bảng có: các biến, 'n_hours' (số dòng giờ), 'qa_flag_mask' (bitmask) và 'qa_flags' (list);
+    thứ tự bit nằm trong DataFrame.attrs['qa_flag_bits'].
+    Trả về dict {freq: DataFrame}.
+    """
+    spec = DEFAULT_AGG_SPEC if agg_spec is None else agg_spec
+    spec = {col: stat for col, stat in spec.items() if col in df_hourly.columns}
+    quantiles = {col: list(qs) for col, qs in (quantiles or {}).items() if col in df_hourly.columns}
+    freqs = list(freqs)
+
+    df = df_hourly[~df_hourly.index.duplicated(keep='first')]
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    index = pd.DatetimeIndex(df.index)
+    if len(index) == 0:
+        return {}
+
+    flag_lists = df['qa_flags'].tolist() if 'qa_flags' in df.columns else [None] * len(df)
+    row_masks, flag_codes = encode_flags(flag_lists)
+    values = {col: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+              for col in set(spec) | set(quantiles)}
+
+    # Ô mịn nhất: ước chung lớn nhất của các tần suất giờ (và 1 ngày)
+    base_ns = DAY_NS
+    for freq in freqs:
+        tick = _tick_ns(freq)
+        if tick is not None:
+            base_ns = int(np.gcd(base_ns, tick))
+    base_labels = _bin_labels(index, pd.Timedelta(base_ns))
+    base_starts = _segment_starts(base_labels.asi8)
+    base_index = base_labels[base_starts]
+
+    # --- MỘT lần duyệt dữ liệu giờ ---
+    base_parts = {col: _partials(values[col], base_starts, stat == 'vector_mean') for col, stat in spec.items()}
+    base_rows = np.diff(np.r_[base_starts, len(index)])
+    base_masks = np.bitwise_or.reduceat(row_masks, base_starts)
+    base_of_row = np.repeat(np.arange(len(base_starts)), base_rows)
+
+    results = {}
+    for freq in freqs:
+        labels = _bin_labels(base_index, freq)
+        starts = _segment_starts(labels.asi8)
+        parts = {col: _combine(p, starts) for col, p in base_parts.items()}
+        n_rows = np.add.reduceat(base_rows, starts)
+        masks = np.bitwise_or.reduceat(base_masks, starts)
+        extra = {}
+        if quantiles:
+            # Phân vị cần giá trị giờ: đánh số khoảng cho từng dòng (qua ô mịn) rồi sắp xếp trong khoảng
+            seg_of_base = np.zeros(len(base_starts), dtype=np.int64)
+            seg_of_base[starts[1:]] = 1
+            seg_ids = np.cumsum(seg_of_base)[base_of_row]
+            row_starts = np.r_[0, np.cumsum(n_rows)[:-1]]
+            for col, qs in quantiles.items():
+                for q, value in _segment_quantiles(values[col], seg_ids, row_starts, qs).items():
+                    extra[quantile_column(col, q)] = value
+        results[freq] = _build_frame(labels[starts], parts, n_rows, masks, flag_codes, spec, freq, extra)
+
+    if diurnal:
+        hours = index.hour.to_numpy()
+        order = np.argsort(hours, kind='stable')
+        sorted_hours = hours[order]
+        starts = _segment_starts(sorted_hours)
+        diurnal_spec = {col: ('mean' if stat == 'sum' else stat) for col, stat in spec.items()}
+        parts = {col: _partials(values[col][order], starts, stat == 'vector_mean')
+                 for col, stat in diurnal_spec.items()}
+        n_rows = np.diff(np.r_[starts, len(index)])
+        masks = np.bitwise_or.reduceat(row_masks[order], starts)
+        labels = pd.Index(sorted_hours[starts], name='hour')
+        results['diurnal'] = _build_frame(labels, parts, n_rows, masks, flag_codes, diurnal_spec, None)
+
+    return results
@@ -0,0 +1,202 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import src.cleaning_data_src.QA_rules as qa
+
+"""
+File: parallel_qa.py
+Mô tả: Chạy các luật QA của MỘT chuỗi dài song song bằng cách chia chuỗi thành các đoạn thời gian (shard).
+Kết quả phải GIỐNG HỆT chạy một lượt trên toàn bộ chuỗi, nên mỗi luật được khai báo "phạm vi" (RULE_SCOPES):
+
+    - 'row'       : chỉ nhìn từng dòng (ngưỡng, logic, NaN, kiểu dữ liệu) -> chạy trên đúng các dòng của shard.
+    - 'duplicate' : so các dòng cùng mốc thời gian (GEN-DUP-1). Shard được cắt theo GIÁ TRỊ thời gian
+                    nên mọi bản ghi trùng một mốc luôn nằm cùng shard, thứ tự dòng gốc được giữ nguyên.
+    - 'window'    : cửa sổ trượt theo thời gian (AQ-SPIKE-*, W-SPIKE-1). Shard được nới thêm một lề (halo)
+                    hai phía; chỉ giữ kết quả nằm trong lõi của shard.
+                    Rolling median/MAD căn giữa cửa sổ 25h chạy 2 lượt -> lề = 2 x 25h.
+                    Luật SPIKE còn xét đoạn lệch liên tiếp (<= SPIKE_MAX_RUN điểm có dữ liệu) nên lề
+                    được tính từ điểm có dữ liệu thứ SPIKE_MAX_RUN + 1 trước / sau lõi ('valid_points').
+    - 'neighbor_valid': so với điểm CÓ DỮ LIỆU liền trước và liền sau (AQ-ROC-*, W-ROC-1). Lề kéo dài tới
+                    điểm hợp lệ cuối cùng trước shard và điểm hợp lệ đầu tiên sau shard
+                    (có thể rất xa nếu có đoạn NaN dài).
+    - 'global'    : cần toàn bộ chuỗi (GEN-GAP-1: giờ thiếu, kể cả khoảng trống vắt qua nhiều shard)
+                    -> chạy MỘT lần trên toàn bộ dữ liệu.
+Luật CHƯA khai báo trong RULE_SCOPES được coi là 'global' (an toàn, không song song hoá).
+Khi thêm luật cửa sổ mới, hãy khai báo lề tương ứng ở đây.
+"""
+
+RULE_SCOPES = {
+    qa.check_missing_values: {'kind': 'row'},
+    qa.check_g_invalid_timezone: {'kind': 'row'},
+    qa.check_numeric_types: {'kind': 'row'},
+    qa.check_w_negative_values: {'kind': 'row'},
+    qa.check_w_temp_bounds: {'kind': 'row'},
+    qa.check_w_wdir_bounds: {'kind': 'row'},
+    qa.check_w_pres_bounds: {'kind': 'row'},
+    qa.check_w_wind_logic: {'kind': 'row'},
+    qa.check_aq_negative_values: {'kind': 'row'},
+    qa.check_aq_pm_logic: {'kind': 'row'},
+    qa.check_aq_uv_night_logic: {'kind': 'row'},
+    qa.check_g_duplicated_timestamp: {'kind': 'duplicate'},
+    qa.check_aq_pm25_spike: {'kind': 'window', 'halo': '50h', 'col': 'pm2_5', 'valid_points': qa.SPIKE_MAX_RUN + 1},
+    qa.check_aq_pm10_spike: {'kind': 'window', 'halo': '50h', 'col': 'pm10', 'valid_points': qa.SPIKE_MAX_RUN + 1},
+    qa.check_w_temp_spike: {'kind': 'window', 'halo': '50h', 'col': 'temp', 'valid_points': qa.SPIKE_MAX_RUN + 1},
+    qa.check_aq_pm25_rate_of_change: {'kind': 'neighbor_valid', 'col': 'pm2_5'},
+    qa.check_aq_pm10_rate_of_change: {'kind': 'neighbor_valid', 'col': 'pm10'},
+    qa.check_w_temp_rate_of_change: {'kind': 'neighbor_valid', 'col': 'temp'},
+    qa.check_g_missing_hours_2024: {'kind': 'global'},
+}
+
+SHARD_LOCAL_KINDS = ('row', 'duplicate', 'window', 'neighbor_valid')
+MIN_ROWS_PER_SHARD = 2000
+
+
+def _ns(index):
+    """Mốc thời gian dạng int64 NANO giây, bất kể đơn vị của index (s / ms / us / ns)."""
+    return pd.DatetimeIndex(index).as_unit('ns').asi8
+
+
+def evaluate_rules(df, rule_calls):
+    """Chạy tuần tự: rule_calls là danh sách (hàm luật, [tham số thêm]) -> danh sách kết quả theo thứ tự."""
+    return [rule_function(df, *args) for rule_function, args in rule_calls]
+
+
+def shard_bounds(index, n_shards):
+    """
+    Mốc cắt (int64 ns) chia chuỗi thành n_shards đoạn có số dòng gần bằng nhau.
+    Mốc cắt luôn là một giá trị thời gian nên các bản ghi trùng mốc không bị tách.
+    """
+    times = np.sort(_ns(index))
+    cut_pos = (np.arange(1, n_shards) * len(times)) // n_shards
+    return np.unique(times[cut_pos])
+
+
+def _restrict_to_core(indices, core_start, core_end):
+    """Giữ các mốc thời gian (kết quả luật cửa sổ) nằm trong lõi [core_start, core_end) của shard."""
+    if len(indices) == 0:
+        return indices
+    times = _ns(indices)
+    keep = times >= core_start
+    if core_end is not None:
+        keep &= times < core_end
+    return [ts for ts, k in zip(indices, keep) if k]
+
+
+def _evaluate_shard(task):
+    """Chạy các luật cục bộ trên một shard (chạy trong tiến trình con). Trả về {vị trí luật: kết quả}."""
+    ext_df, core_start, core_end, rule_items = task
+    times = _ns(ext_df.index)
+    in_core = times >= core_start
+    if core_end is not None:
+        in_core &= times < core_end
+    core_df = ext_df[in_core]
+
+    results = {}
+    for pos, rule_function, args, scope, start, end in rule_items:
+        if scope['kind'] in ('row', 'duplicate'):
+            results[pos] = rule_function(core_df, *args)
+            continue
+        sel = times >= start
+        if end is not None:
+            sel &= times < end
+        result = rule_function(ext_df[sel], *args)
+        result['indices'] = _restrict_to_core(result['indices'], core_start, core_end)
+        results[pos] = result
+    return results
+
+
+def _merge_results(parts):
+    """Ghép kết quả một luật từ các shard (theo thứ tự thời gian), giữ nguyên kiểu của 'indices'."""
+    merged = dict(parts[0])
+    indices = [p['indices'] for p in parts]
+    if isinstance(indices[0], pd.DataFrame):
+        merged['indices'] = pd.concat(indices)
+    elif isinstance(indices[0], pd.Index):
+        merged['indices'] = indices[0].append(indices[1:]) if len(indices) > 1 else indices[0]
+    else:
+        merged['indices'] = [ts for part in indices for ts in part]
+    return merged
+
+
+def _prev_valid_time(valid_times, core_start, n=1):
+    """Mốc của điểm có dữ liệu thứ n TRƯỚC core_start (valid_times: mốc hợp lệ đã sắp); thiếu -> điểm đầu tiên."""
+    pos = np.searchsorted(valid_times, core_start, side='left') - n
+    if pos >= 0:
+        return valid_times[pos]
+    return min(valid_times[0], core_start) if len(valid_times) else core_start
+
+
+def _next_valid_end(valid_times, core_end, n=1):
+    """Mốc kết thúc (không tính) của lề sau: ngay sau điểm có dữ liệu thứ n từ core_end trở đi."""
+    if core_end is None:
+        return None
+    pos = np.searchsorted(valid_times, core_end, side='left') + n - 1
+    return valid_times[pos] + 1 if pos < len(valid_times) else None
+
+
+def evaluate_rules_sharded(df, rule_calls, n_shards=None, n_jobs=4, min_rows_per_shard=MIN_ROWS_PER_SHARD):
+    """
+    Giống evaluate_rules() nhưng chia chuỗi theo thời gian và chạy các luật cục bộ trên từng shard
+    song song (ProcessPoolExecutor, n_jobs > 1). Luật 'global' chạy một lần trên toàn bộ df.
+    Chuỗi quá ngắn (ít hơn min_rows_per_shard dòng mỗi shard) hoặc index không phải DatetimeIndex
+    -> chạy tuần tự như cũ.
+    """
+    n_shards = n_shards or n_jobs
+    n_shards = min(n_shards, len(df) // max(min_rows_per_shard, 1))
+    if n_shards <= 1 or not isinstance(df.index, pd.DatetimeIndex) or df.index.hasnans:
+        return evaluate_rules(df, rule_calls)
+
+    scopes = [RULE_SCOPES.get(rule_function, {'kind': 'global'}) for rule_function, _ in rule_calls]
+    local_pos = [pos for pos, scope in enumerate(scopes) if scope['kind'] in SHARD_LOCAL_KINDS]
+
+    bounds = shard_bounds(df.index, n_shards)
+    times = _ns(df.index)
+    core_starts = np.r_[times.min(), bounds]
+    core_ends = list(bounds) + [None]
+    # Mốc có dữ liệu của từng cột dùng cho luật 'neighbor_valid' / SPIKE (cùng cách lọc với _rate_rule)
+    valid_times = {scopes[pos]['col']: _ns(qa._sorted_unique_series(df, scopes[pos]['col']).dropna().index)
+                   for pos in local_pos if 'col' in scopes[pos]}
+
+    tasks = []
+    for core_start, core_end in zip(core_starts, core_ends):
+        rule_items, ext_start, ext_end = [], core_start, core_end
+        for pos in local_pos:
+            rule_function, args = rule_calls[pos]
+            scope = scopes[pos]
+            start, end = core_start, core_end
+            if scope['kind'] == 'window':
+                halo = pd.Timedelta(scope['halo']).value
+                if 'valid_points' in scope:
+                    col_times, n = valid_times[scope['col']], scope['valid_points']
+                    start = min(core_start, _prev_valid_time(col_times, core_start, n))
+                    end = _next_valid_end(col_times, core_end, n)  # None: tới cuối chuỗi
+                    end = None if end is None else max(end, core_end)
+                start -= halo
+                end = None if end is None else end + halo
+            elif scope['kind'] == 'neighbor_valid':
+                start = _prev_valid_time(valid_times[scope['col']], core_start)
+                end = _next_valid_end(valid_times[scope['col']], core_end)
+            ext_start = min(ext_start, start)
+            ext_end = None if ext_end is None or end is None else max(ext_end, end)
+            rule_items.append((pos, rule_function, args, scope, start, end))
+        sel = times >= ext_start
+        if ext_end is not None:
+            sel &= times < ext_end
+        tasks.append((df[sel], core_start, core_end, rule_items))
+
+    if n_jobs is not None and n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as executor:
+            shard_results = list(executor.map(_evaluate_shard, tasks))
+    else:
+        shard_results = [_evaluate_shard(task) for task in tasks]
+
+    results = []
+    for pos, (rule_function, args) in enumerate(rule_calls):
+        if scopes[pos]['kind'] in SHARD_LOCAL_KINDS:
+            results.append(_merge_results([shard[pos] for shard in shard_results]))
+        else:
+            results.append(rule_function(df, *args))
+    print(f"  > QA song song: {len(tasks)} shard, {len(local_pos)}/{len(rule_calls)} luật chạy theo shard.")
+    return results
@@ -0,0 +1,185 @@
+import os
+import itertools
+import numpy as np
+import pandas as pd
+
+from src.cleaning_data_src.data_processing import load_data
+
+"""
+File: qa_sensitivity.py
+Mô tả: Quét ĐỘ NHẠY của các ngưỡng QA (sweep) mà không chạy lại toàn bộ pipeline.
+
+Các ngưỡng đang là giá trị mặc định cố định của hàm luật:
+    - W-BOUND-1  check_w_temp_bounds(min_t=0, max_t=45)
+    - W-BOUND-3  check_w_pres_bounds(min_p=950, max_p=1050)
+    - AQ-LOGIC-2 check_aq_uv_night_logic(night_start=19, night_end=5, uv_threshold=0.1)
+
+Dữ liệu được đọc và parse MỘT lần. Mỗi cột được SẮP XẾP một lần (kèm tổng tích luỹ), sau đó
+số vi phạm của MỌI điểm trong lưới ngưỡng được đếm bằng np.searchsorted (tìm nhị phân)
+— không lọc lại dữ liệu cho từng điểm lưới. Kết quả là bảng: số vi phạm, % vi phạm,
+số NGÀY bị ảnh hưởng và trung bình của biến trước / sau khi áp dụng hành động làm sạch tương ứng
+(temp -> NaN, uv_index -> 0; riêng áp suất pipeline chưa làm sạch nên coi như bị loại -> NaN).
+"""
+
+DEFAULT_TEMP_GRID = {'min_t': [0, 5, 10, 15, 18, 20], 'max_t': [35, 37, 38, 40, 42, 45]}
+DEFAULT_PRES_GRID = {'min_p': [950, 980, 990, 995, 1000, 1005], 'max_p': [1015, 1018, 1020, 1030, 1050]}
+DEFAULT_UV_GRID = {'night_start': [18, 19, 20], 'night_end': [4, 5, 6], 'uv_threshold': [0.0, 0.1, 0.5, 1.0]}
+
+RULE_DEFAULTS = {
+    'W-BOUND-1': {'min_t': 0, 'max_t': 45},
+    'W-BOUND-3': {'min_p': 950, 'max_p': 1050},
+    'AQ-LOGIC-2': {'night_start': 19, 'night_end': 5, 'uv_threshold': 0.1},
+}
+
+
+def _grid(grid):
+    """{tham số: danh sách giá trị} -> DataFrame tích Descartes các điểm lưới."""
+    keys = list(grid)
+    return pd.DataFrame(list(itertools.product(*(grid[k] for k in keys))), columns=keys)
+
+
+class SortedColumn:
+    """Một cột đã sắp xếp MỘT lần (bỏ NaN) + tổng tích luỹ: đếm / tổng theo ngưỡng bằng tìm nhị phân."""
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=float)
+        self.sorted = np.sort(values[~np.isnan(values)])
+        self.csum = np.r_[0.0, np.cumsum(self.sorted)]
+        self.n = len(self.sorted)
+        self.total = self.csum[-1]
+
+    def count_below(self, thresholds):
+        """Số giá trị < ngưỡng (vector hoá trên mảng ngưỡng)."""
+        return np.searchsorted(self.sorted, thresholds, side='left')
+
+    def count_above(self, thresholds):
+        """Số giá trị > ngưỡng."""
+        return self.n - np.searchsorted(self.sorted, thresholds, side='right')
+
+    def sum_below(self, thresholds):
+        return self.csum[self.count_below(thresholds)]
+
+    def sum_above(self, thresholds):
+        return self.total - self.csum[self.n - self.count_above(thresholds)]
+
+
+def sweep_bounds(series, lows, highs, rule_id, low_name, high_name):
+    """
+    Quét luật ngưỡng "x < low hoặc x > high" cho mọi cặp (low, high).
+    Hành động làm sạch: giá trị vi phạm -> NaN (ảnh hưởng trung bình và các ngày chứa giá trị đó).
+    """
+    series = pd.to_numeric(series, errors='coerce')
+    col = SortedColumn(series.to_numpy())
+    lows = np.asarray(lows, dtype=float)
+    highs = np.asarray(highs, dtype=float)
+
+    n_low = col.count_below(lows)
+    n_high = col.count_above(highs)
+    # Nếu low > high thì một giá trị có thể bị đếm 2 lần -> giới hạn bởi n (lưới hợp lệ luôn có low <= high)
+    n_viol = np.minimum(n_low + n_high, col.n)
+    kept_sum = col.total - col.sum_below(lows) - col.sum_above(highs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_after = np.where(col.n - n_viol > 0, kept_sum / (col.n - n_viol), np.nan)
+
+    # Ngày bị ảnh hưởng: min ngày < low hoặc max ngày > high (ma trận ngày x điểm lưới)
+    daily = series.groupby(series.index.normalize())
+    day_min = daily.min().to_numpy()[:, None]
+    day_max = daily.max().to_numpy()[:, None]
+    affected_days = ((day_min < lows[None, :]) | (day_max > highs[None, :])).sum(axis=0)
+
+    return pd.DataFrame({
+        'rule_id': rule_id,
+        low_name: lows,
+        high_name: highs,
+        'n_violations': n_viol,
+        'pct_violations': n_viol / len(series) * 100 if len(series) else np.nan,
+        'affected_days': affected_days,
+        'mean_before': col.total / col.n if col.n else np.nan,
+        'mean_after': mean_after,
+    })
+
+
+def sweep_uv_night(df_air, night_starts, night_ends, thresholds):
+    """
+    Quét luật AQ-LOGIC-2 cho mọi bộ (night_start, night_end, uv_threshold).
+    Mỗi giờ trong ngày (24 nhóm) được sắp xếp MỘT lần; số vi phạm = Σ_giờ-đêm count(uv > ngưỡng).
+    Hành động làm sạch: uv_index vi phạm -> 0.
+    """
+    uv = pd.to_numeric(df_air['uv_index'], errors='coerce')
+    hours = df_air.index.hour.to_numpy()
+    values = uv.to_numpy()
+    night_starts = np.asarray(night_starts)
+    night_ends = np.asarray(night_ends)
+    thresholds = np.asarray(thresholds, dtype=float)
+
+    by_hour = [SortedColumn(values[hours == h]) for h in range(24)]
+    count_gt = np.stack([c.count_above(thresholds) for c in by_hour])      # (24, G)
+    sum_gt = np.stack([c.sum_above(thresholds) for c in by_hour])          # (24, G)
+
+    hour_axis = np.arange(24)[:, None]
+    night = (hour_axis >= night_starts[None, :]) | (hour_axis <= night_ends[None, :])  # (24, G)
+    n_viol = (night * count_gt).sum(axis=0)
+    removed_sum = (night * sum_gt).sum(axis=0)
+
+    n_valid = sum(c.n for c in by_hour)
+    total = sum(c.total for c in by_hour)
+
+    # Ngày bị ảnh hưởng: max UV của ngày trong các giờ đêm > ngưỡng
+    day_hour_max = uv.groupby([uv.index.normalize(), hours]).max().unstack().reindex(columns=range(24))
+    day_hour_max = day_hour_max.to_numpy()                                  # (ngày, 24)
+    affected_days = np.empty(len(thresholds), dtype=int)
+    for key in set(zip(night_starts.tolist(), night_ends.tolist())):
+        sel = (night_starts == key[0]) & (night_ends == key[1])
+        night_max = np.nanmax(np.where(night[:, np.flatnonzero(sel)[0]][None, :], day_hour_max, np.nan),
+                              axis=1, initial=-np.inf)
+        affected_days[sel] = (night_max[:, None] > thresholds[sel][None, :]).sum(axis=0)
+
+    return pd.DataFrame({
+        'rule_id': 'AQ-LOGIC-2',
+        'night_start': night_starts,
+        'night_end': night_ends,
+        'uv_threshold': thresholds,
+        'n_violations': n_viol,
+        'pct_violations': n_viol / len(uv) * 100 if len(uv) else np.nan,
+        'affected_days': affected_days,
+        'mean_before': total / n_valid if n_valid else np.nan,
+        'mean_after': (total - removed_sum) / n_valid if n_valid else np.nan,
+    })
+
+
+def run_threshold_sweep(temp_grid=None, pres_grid=None, uv_grid=None,
+                        output_path='reports/qa_threshold_sweep.csv', use_columnar_cache=False):
+    """
+    Đọc dữ liệu MỘT lần và quét các lưới ngưỡng. Trả về bảng kết quả (một dòng mỗi điểm lưới),
+    cột 'is_default' đánh dấu bộ ngưỡng đang dùng trong QA_rules.
+    """
+    print("--- Quét độ nhạy ngưỡng QA ---")
+    df_weather, df_air = load_data(use_columnar_cache=use_columnar_cache)
+    if df_weather is None or df_air is None:
+        return None
+    df_weather = df_weather[~df_weather.index.duplicated(keep='first')]
+    df_air = df_air[~df_air.index.duplicated(keep='first')]
+
+    temp = _grid(temp_grid or DEFAULT_TEMP_GRID)
+    pres = _grid(pres_grid or DEFAULT_PRES_GRID)
+    uv = _grid(uv_grid or DEFAULT_UV_GRID)
+
+    tables = [
+        sweep_bounds(df_weather['temp'], temp['min_t'], temp['max_t'], 'W-BOUND-1', 'min_t', 'max_t'),
+        sweep_bounds(df_weather['pres'], pres['min_p'], pres['max_p'], 'W-BOUND-3', 'min_p', 'max_p'),
+        sweep_uv_night(df_air, uv['night_start'], uv['night_end'], uv['uv_threshold']),
+    ]
+    result = pd.concat(tables, ignore_index=True)
+
+    result['is_default'] = False
+    for rule_id, params in RULE_DEFAULTS.items():
+        mask = result['rule_id'] == rule_id
+        for name, value in params.items():
+            mask &= result[name] == value
+        result.loc[mask, 'is_default'] = True
+
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        result.round(4).to_csv(output_path, index=False)
+        print(f" -> Đã lưu bảng quét ngưỡng ({len(result)} điểm lưới): {output_path}")
+    return result
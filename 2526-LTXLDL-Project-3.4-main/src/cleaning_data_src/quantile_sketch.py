@@ -0,0 +1,144 @@
+import numpy as np
+
+"""
+File: quantile_sketch.py
+Mô tả: Sketch phân vị GỘP ĐƯỢC (mergeable) kiểu t-digest, dùng cho các cột p95
+(temperature_p95, pm10_p95, pm2_5_p95).
+
+Khác với quantile(0.95) chính xác (cần giữ toàn bộ giá trị thô của nhóm), t-digest chỉ giữ
+một số lượng centroid (mean, weight) bị chặn bởi tham số 'compression'. Hai digest có thể
+GỘP lại (merge) thành digest của hợp hai tập dữ liệu, nên có thể:
+    - tính digest theo NGÀY, rồi gộp lên THÁNG / NĂM (p95 đúng của dữ liệu giờ,
+      thay vì "p95 của các p95 ngày"),
+    - tính theo từng chunk / worker / trạm rồi gộp lại.
+Sai số tập trung thấp ở hai đuôi phân phối (p95, p99) nhờ hàm tỉ lệ k1 (arcsin).
+"""
+
+DEFAULT_COMPRESSION = 200
+
+
+class TDigest:
+    """t-digest dạng 'merging digest', nén bằng numpy (không lặp Python theo từng giá trị)."""
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0, dtype=float)
+        self.weights = np.empty(0, dtype=float)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @classmethod
+    def from_values(cls, values, compression=DEFAULT_COMPRESSION):
+        """Tạo digest từ một mảng giá trị (NaN bị bỏ qua)."""
+        digest = cls(compression)
+        digest.update(values)
+        return digest
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values, weights=None):
+        """Thêm một mảng giá trị (mỗi giá trị là một centroid weight=1) rồi nén lại."""
+        values = np.asarray(values, dtype=float).ravel()
+        if weights is None:
+            weights = np.ones_like(values)
+        else:
+            weights = np.asarray(weights, dtype=float).ravel()
+        valid = ~np.isnan(values)
+        values, weights = values[valid], weights[valid]
+        if len(values) == 0:
+            return self
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.means = np.concatenate([self.means, values])
+        self.weights = np.concatenate([self.weights, weights])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Gộp digest khác vào digest này (in-place). Trả về self."""
+        if other.count == 0:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.means = np.concatenate([self.means, other.means])
+        self.weights = np.concatenate([self.weights, other.weights])
+        self._compress()
+        return self
+
+    def _compress(self):
+        """Gom các centroid liền kề có cùng 'bucket' của hàm tỉ lệ k1(q) = δ/(2π)·arcsin(2q-1)."""
+        if len(self.means) <= 1:
+            return
+        order = np.argsort(self.means, kind='mergesort')
+        means = self.means[order]
+        weights = self.weights[order]
+        total = weights.sum()
+
+        # q ở cạnh trái mỗi centroid -> bucket theo k1. Ở hai đuôi k1 thay đổi nhanh
+        # nên centroid nhỏ (chính xác cao), ở giữa centroid lớn.
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        bucket = np.floor(k).astype(np.int64)
+        _, bucket_id = np.unique(bucket, return_inverse=True)
+
+        new_weights = np.bincount(bucket_id, weights=weights)
+        new_means = np.bincount(bucket_id, weights=weights * means) / new_weights
+        self.means = new_means
+        self.weights = new_weights
+
+    def quantile(self, q):
+        """
+        Ước lượng phân vị q (0..1), nội suy tuyến tính giữa tâm các centroid.
+        Khi mọi centroid có weight=1 kết quả trùng với pandas quantile(q) (nội suy 'linear').
+        """
+        if self.count == 0:
+            return np.nan
+        if len(self.means) == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        # Vị trí (theo trọng số) của tâm mỗi centroid, thêm hai đầu min/max
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * (total - 1) + 0.5, positions, values))
+
+    def to_dict(self):
+        """Trạng thái gọn để lưu ra JSON / truyền giữa các worker."""
+        return {
+            'compression': self.compression,
+            'min': self.min,
+            'max': self.max,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        digest = cls(state.get('compression', DEFAULT_COMPRESSION))
+        digest.min = state['min']
+        digest.max = state['max']
+        digest.means = np.asarray(state['means'], dtype=float)
+        digest.weights = np.asarray(state['weights'], dtype=float)
+        return digest
+
+
+def merge_digests(digests, compression=DEFAULT_COMPRESSION):
+    """Gộp một dãy digest (ví dụ các digest ngày trong một tháng) thành digest mới."""
+    merged = TDigest(compression)
+    digests = [d for d in digests if isinstance(d, TDigest) and d.count > 0]
+    if not digests:
+        return merged
+    # Nối tất cả centroid rồi nén MỘT lần (nhanh và chính xác hơn gộp lần lượt)
+    merged.min = min(d.min for d in digests)
+    merged.max = max(d.max for d in digests)
+    merged.means = np.concatenate([d.means for d in digests])
+    merged.weights = np.concatenate([d.weights for d in digests])
+    merged._compress()
+    return merged
+
+
+def digest_quantile(digests, q=0.95, compression=DEFAULT_COMPRESSION):
+    """Hàm aggregate cho resample/groupby: gộp các digest trong nhóm rồi lấy phân vị q."""
+    return merge_digests(digests, compression).quantile(q)
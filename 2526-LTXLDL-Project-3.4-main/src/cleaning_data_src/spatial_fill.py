@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+"""
+File: spatial_fill.py
+Mô tả: Lấp khoảng trống (gap) của một trạm bằng dữ liệu CÁC TRẠM LÂN CẬN trong cùng giờ,
+theo trọng số nghịch đảo khoảng cách (IDW - Inverse Distance Weighting).
+
+Thay cho interpolate(method='linear') theo thời gian (tạo ra dữ liệu phẳng/tuyến tính
+trên các gap nhiều ngày):
+    1. Toạ độ (lat, lon) -> vector 3D trên mặt cầu đơn vị, dựng KD-tree (sklearn)
+       -> tìm k láng giềng gần nhất của mọi trạm trong O(S log S), không tính mọi cặp.
+    2. Với mỗi ô thiếu (giờ, trạm), chọn k láng giềng GẦN NHẤT CÓ DỮ LIỆU ở giờ đó
+       trong danh sách ứng viên, áp trọng số 1/d^p, tính tất cả ô thiếu cùng lúc (vector hoá).
+"""
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _to_unit_vectors(lat, lon):
+    """Đổi (lat, lon) độ -> toạ độ 3D trên mặt cầu đơn vị (khoảng cách dây cung đơn điệu với khoảng cách thật)."""
+    lat_r = np.deg2rad(np.asarray(lat, dtype=float))
+    lon_r = np.deg2rad(np.asarray(lon, dtype=float))
+    return np.column_stack([np.cos(lat_r) * np.cos(lon_r),
+                            np.cos(lat_r) * np.sin(lon_r),
+                            np.sin(lat_r)])
+
+
+def find_neighbors(stations, n_neighbors):
+    """
+    Tìm n_neighbors trạm gần nhất (không tính chính nó) cho mỗi trạm bằng KD-tree.
+    stations: DataFrame index = mã trạm, có cột 'lat', 'lon'.
+    Trả về (neighbor_idx, distance_km), mỗi mảng có dạng (n_stations, n_neighbors).
+    """
+    xyz = _to_unit_vectors(stations['lat'], stations['lon'])
+    n_query = min(len(stations), n_neighbors + 1)
+    tree = KDTree(xyz)
+    chord, idx = tree.query(xyz, k=n_query)
+
+    # Bỏ chính trạm đó khỏi danh sách láng giềng (không giả định nó luôn ở cột đầu)
+    is_self = idx == np.arange(len(stations))[:, None]
+    keep = ~is_self
+    # Nếu không tìm thấy chính nó (trùng toạ độ), bỏ cột cuối để giữ đủ n_query - 1 cột
+    no_self = ~is_self.any(axis=1)
+    keep[no_self, -1] = False
+    idx = idx[keep].reshape(len(stations), n_query - 1)
+    chord = chord[keep].reshape(len(stations), n_query - 1)
+
+    distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+    return idx, distance_km
+
+
+def fill_gaps_from_neighbors(values_wide, stations, k=4, power=2, max_distance_km=None,
+                             candidate_factor=3):
+    """
+    Lấp NaN trong bảng giờ x trạm bằng IDW từ k trạm gần nhất có dữ liệu ở cùng giờ.
+
+    - values_wide: DataFrame index = thời gian, mỗi cột là một trạm (một biến, ví dụ pm2_5).
+    - stations: DataFrame index = mã trạm (trùng tên cột của values_wide), cột 'lat', 'lon'.
+    - k: số láng giềng có dữ liệu dùng cho mỗi ô thiếu.
+    - power: số mũ trọng số 1/d^power.
+    - max_distance_km: bỏ các láng giềng xa hơn ngưỡng này (None = không giới hạn).
+    - candidate_factor: số ứng viên = k * candidate_factor (phòng khi láng giềng gần cũng bị thiếu).
+
+    Trả về (filled_wide, filled_mask): bảng đã lấp và mặt nạ True ở các ô được lấp.
+    Ô nào không đủ láng giềng có dữ liệu vẫn giữ NaN (có thể fallback nội suy thời gian).
+    """
+    missing_coords = [c for c in values_wide.columns if c not in stations.index]
+    if missing_coords:
+        raise ValueError(f"Thiếu toạ độ cho các trạm: {missing_coords}")
+    stations = stations.loc[values_wide.columns]
+
+    values = values_wide.to_numpy(dtype=float)
+    filled = values.copy()
+    gap_t, gap_s = np.nonzero(np.isnan(values))
+    filled_mask = np.zeros(values.shape, dtype=bool)
+
+    if len(gap_t) == 0 or len(stations) < 2:
+        return values_wide.copy(), pd.DataFrame(filled_mask, index=values_wide.index, columns=values_wide.columns)
+
+    neighbor_idx, distance_km = find_neighbors(stations, k * candidate_factor)
+
+    # (n_gaps, n_candidates): giá trị & khoảng cách của các ứng viên cho từng ô thiếu
+    cand_idx = neighbor_idx[gap_s]
+    cand_dist = distance_km[gap_s]
+    cand_val = values[gap_t[:, None], cand_idx]
+
+    available = ~np.isnan(cand_val)
+    if max_distance_km is not None:
+        available &= cand_dist <= max_distance_km
+    # Giữ k ứng viên gần nhất CÓ dữ liệu (ứng viên đã được sắp theo khoảng cách)
+    use = available & (np.cumsum(available, axis=1) <= k)
+
+    # Trạm trùng vị trí (d = 0) -> lấy trực tiếp giá trị đó
+    exact = use & (cand_dist == 0)
+    with np.errstate(divide='ignore'):
+        weights = np.where(use, 1.0 / np.power(cand_dist, power), 0.0)
+    weights = np.where(exact.any(axis=1)[:, None], exact.astype(float), weights)
+
+    weight_sum = weights.sum(axis=1)
+    estimate = np.einsum('gj,gj->g', weights, np.nan_to_num(cand_val)) / np.where(weight_sum > 0, weight_sum, 1)
+    ok = weight_sum > 0
+
+    filled[gap_t[ok], gap_s[ok]] = estimate[ok]
+    filled_mask[gap_t[ok], gap_s[ok]] = True
+
+    print(f"Lấp gap theo không gian: {int(ok.sum())}/{len(gap_t)} ô thiếu được lấp (k={k}, p={power}).")
+    return (pd.DataFrame(filled, index=values_wide.index, columns=values_wide.columns),
+            pd.DataFrame(filled_mask, index=values_wide.index, columns=values_wide.columns))
@@ -0,0 +1,364 @@
+import os
+import csv
+import json
+import math
+import time
+import socket
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from src.cleaning_data_src import QA_rules as qa
+
+"""
+File: stream_ingestion.py
+Mô tả: Chế độ STREAMING (gần thời gian thực) cho dữ liệu giờ.
+
+Luồng xử lý:
+    nguồn (tail file CSV / socket local) -> parse bản ghi -> micro-batch
+    -> QA (các luật của QA_rules) + làm sạch giống pipeline batch
+    -> cập nhật tổng hợp Ngày/Tuần/Tháng với chi phí O(1) mỗi bản ghi
+    -> công bố giá trị hiện tại (file JSON snapshot và/hoặc callback).
+
+Tổng hợp chạy (running aggregates) chỉ giữ tổng, số đếm, tổng bình phương, min/max
+và tổng sin/cos (hướng gió) nên không cần giữ dữ liệu thô.
+"""
+
+WEATHER_COLS = ['temp', 'prcp', 'wspd', 'wdir', 'pres']
+AIR_COLS = ['pm10', 'pm2_5', 'uv_index', 'ozone', 'carbon_monoxide']
+
+# Luật SPIKE (median trượt căn giữa 25h) và ROC (so với điểm liền trước VÀ liền sau) cần dữ liệu
+# xung quanh mỗi điểm, kể cả giờ TƯƠNG LAI; chạy trên từng micro-batch (mặc định 1 bản ghi) thì
+# không bao giờ kích hoạt. Chế độ streaming KHÔNG dùng các luật này — chúng chỉ chạy trong pipeline batch.
+STREAM_EXCLUDED_RULES = (
+    qa.check_w_temp_spike, qa.check_w_temp_rate_of_change,
+    qa.check_aq_pm25_spike, qa.check_aq_pm10_spike,
+    qa.check_aq_pm25_rate_of_change, qa.check_aq_pm10_rate_of_change,
+)
+
+STREAM_CONFIG = {
+    'weather': {'columns': WEATHER_COLS,
+                'rule_set': [r for r in qa.WEATHER_RULES_SET if r not in STREAM_EXCLUDED_RULES]},
+    'air_quality': {'columns': AIR_COLS,
+                    'rule_set': [r for r in qa.AIR_QUALITY_SET if r not in STREAM_EXCLUDED_RULES]},
+}
+
+# Hành động làm sạch theo cờ QA (giống BƯỚC 2 của run_processing_pipeline): cờ -> (cột, giá trị thay thế)
+STREAM_CLEANING_ACTIONS = {
+    'W-NEG-1': (['prcp', 'wspd'], np.nan),
+    'W-BOUND-1': (['temp'], np.nan),
+    'W-BOUND-2': (['wdir'], np.nan),
+    'W-LOGIC-1': (['wdir'], 0),
+    'AQ-NEG-1': (AIR_COLS, np.nan),
+    'AQ-LOGIC-1': (['pm10', 'pm2_5'], np.nan),
+    'AQ-LOGIC-2': (['uv_index'], 0),
+}
+
+ANGLE_COLS = ('wdir',)
+LEVELS = ('daily', 'weekly', 'monthly')
+
+
+# --- 1. NGUỒN DỮ LIỆU ---
+def tail_file(path, poll_interval=1.0, from_start=True, stop_when_idle=None):
+    """
+    Đọc file giống 'tail -f': trả về từng dòng mới khi được ghi thêm vào file.
+    - from_start=False: chỉ đọc dòng header rồi nhảy tới cuối file (bỏ qua dữ liệu cũ).
+    - stop_when_idle: dừng nếu không có dòng mới sau N giây (None = chạy mãi).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if not from_start:
+            header = f.readline()
+            if header:
+                yield header
+            f.seek(0, os.SEEK_END)
+
+        buffer = ''
+        idle_since = time.monotonic()
+        while True:
+            chunk = f.readline()
+            if chunk:
+                buffer += chunk
+                # Dòng chưa ghi xong (chưa có '\n') thì chờ lần đọc sau
+                if buffer.endswith('\n'):
+                    yield buffer
+                    buffer = ''
+                idle_since = time.monotonic()
+                continue
+            if stop_when_idle is not None and time.monotonic() - idle_since >= stop_when_idle:
+                if buffer:
+                    yield buffer
+                return
+            time.sleep(poll_interval)
+
+
+def read_socket_lines(host='127.0.0.1', port=9999):
+    """Kết nối tới một socket TCP local (giả lập nguồn live) và trả về từng dòng nhận được."""
+    with socket.create_connection((host, port)) as sock:
+        with sock.makefile('r', encoding='utf-8') as f:
+            for line in f:
+                yield line
+
+
+def parse_records(lines):
+    """
+    Chuyển các dòng text thành dict bản ghi.
+    Hỗ trợ JSON lines ({"time": ..., "pm2_5": ...}) hoặc CSV có dòng header đầu tiên.
+    """
+    header = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Cảnh báo: Bỏ qua dòng JSON lỗi: {line[:80]}")
+            continue
+        row = next(csv.reader([line]))
+        if header is None:
+            header = row
+            continue
+        if len(row) != len(header):
+            print(f"Cảnh báo: Bỏ qua dòng CSV sai số cột: {line[:80]}")
+            continue
+        yield dict(zip(header, row))
+
+
+# --- 2. TỔNG HỢP CHẠY O(1) ---
+class RunningStats:
+    """Thống kê cộng dồn cho một biến trong một khoảng thời gian (cập nhật O(1))."""
+    __slots__ = ('count', 'total', 'total_sq', 'min', 'max', 'sin_sum', 'cos_sum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sin_sum = 0.0
+        self.cos_sum = 0.0
+
+    def update(self, value, is_angle=False):
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if is_angle:
+            rad = math.radians(value)
+            self.sin_sum += math.sin(rad)
+            self.cos_sum += math.cos(rad)
+
+    def summary(self, is_angle=False):
+        if self.count == 0:
+            return {'count': 0}
+        mean = self.total / self.count
+        var = max(self.total_sq / self.count - mean * mean, 0.0)
+        result = {
+            'count': self.count,
+            'mean': mean,
+            'std': math.sqrt(var * self.count / (self.count - 1)) if self.count > 1 else 0.0,
+            'min': self.min,
+            'max': self.max,
+            'sum': self.total,
+        }
+        if is_angle:
+            # Vector mean giống calculate_vector_mean_wind_direction
+            mean_deg = math.degrees(math.atan2(self.sin_sum / self.count, self.cos_sum / self.count))
+            result['vector_mean'] = mean_deg + 360 if mean_deg < 0 else mean_deg
+        return result
+
+
+def _period_keys(ts):
+    """Khoá của khoảng Ngày / Tuần (nhãn Chủ nhật, giống resample('W')) / Tháng (đầu tháng)."""
+    day = ts.normalize()
+    return {
+        'daily': day,
+        'weekly': day + pd.Timedelta(days=6 - day.weekday()),
+        'monthly': day.replace(day=1),
+    }
+
+
+class StreamingAggregator:
+    """
+    Giữ tổng hợp Ngày/Tuần/Tháng cho luồng dữ liệu. Mỗi mức chỉ giữ tối đa
+    'max_buckets' khoảng gần nhất nên bộ nhớ là hằng số.
+    """
+
+    def __init__(self, columns, max_buckets=3):
+        self.columns = list(columns)
+        self.max_buckets = max_buckets
+        self.buckets = {level: OrderedDict() for level in LEVELS}
+        self.records_seen = 0
+
+    def _new_bucket(self):
+        return {'n_records': 0, 'qa_flags': set(), 'stats': {col: RunningStats() for col in self.columns}}
+
+    def update(self, ts, values, flags=()):
+        """Cập nhật một bản ghi (O(1)): ts là Timestamp có múi giờ, values là dict cột -> số."""
+        self.records_seen += 1
+        for level, key in _period_keys(ts).items():
+            buckets = self.buckets[level]
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = self._new_bucket()
+                buckets[key] = bucket
+                if len(buckets) > self.max_buckets:
+                    # Bỏ khoảng CŨ NHẤT (kể cả khi bản ghi đến trễ)
+                    del buckets[min(buckets)]
+                    if key not in buckets:
+                        continue
+            bucket['n_records'] += 1
+            bucket['qa_flags'].update(flags)
+            for col in self.columns:
+                value = values.get(col)
+                if value is None or value != value:  # bỏ qua NaN
+                    continue
+                bucket['stats'][col].update(float(value), is_angle=col in ANGLE_COLS)
+
+    def snapshot(self):
+        """Giá trị hiện tại của tất cả các khoảng đang giữ, dạng dict (ghi được ra JSON)."""
+        result = {'records_seen': self.records_seen}
+        for level, buckets in self.buckets.items():
+            result[level] = {}
+            for key in sorted(buckets):
+                bucket = buckets[key]
+                result[level][key.isoformat()] = {
+                    'n_records': bucket['n_records'],
+                    'qa_flags': sorted(bucket['qa_flags']),
+                    'values': {col: bucket['stats'][col].summary(is_angle=col in ANGLE_COLS)
+                               for col in self.columns},
+                }
+        return result
+
+
+# --- 3. QA + LÀM SẠCH CHO MICRO-BATCH ---
+def _to_hcm_time(value):
+    """Ép thời gian về múi giờ 'Asia/Ho_Chi_Minh' (giống load_data)."""
+    ts = pd.Timestamp(value)
+    if ts.tz is None:
+        return ts.tz_localize('UTC').tz_convert('Asia/Ho_Chi_Minh')
+    return ts.tz_convert('Asia/Ho_Chi_Minh')
+
+
+def qa_micro_batch(df_batch, rule_set):
+    """
+    Chạy các luật QA của QA_rules trên một micro-batch (không ghi file báo cáo).
+    Trả về list cờ cho từng dòng, theo đúng thứ tự dòng.
+    """
+    flags = [[] for _ in range(len(df_batch))]
+    for rule_function in rule_set:
+        result = rule_function(df_batch)
+        failing = result['indices']
+        # Một số luật trả về DataFrame các dòng lỗi thay vì danh sách index
+        if isinstance(failing, pd.DataFrame):
+            failing = failing.index
+        if len(failing) == 0:
+            continue
+        for pos in np.flatnonzero(df_batch.index.isin(failing)):
+            flags[pos].append(result['id'])
+    return flags
+
+
+def _process_batch(records, columns, rule_set, aggregator, seen_times):
+    """Parse -> QA -> làm sạch -> cập nhật tổng hợp cho một micro-batch."""
+    rows = []
+    for rec in records:
+        time_value = rec.get('time', rec.get('date'))
+        if time_value is None:
+            print("Cảnh báo: Bản ghi không có cột 'time'/'date'. Bỏ qua.")
+            continue
+        try:
+            ts = _to_hcm_time(time_value)
+        except (ValueError, TypeError):
+            print(f"Cảnh báo: Thời gian không hợp lệ: {time_value}. Bỏ qua.")
+            continue
+        # (GEN-DUP-1) Bỏ các giờ đã nhận trước đó
+        if ts in seen_times:
+            continue
+        seen_times.append(ts)
+        rows.append({'time': ts, **{col: rec.get(col) for col in columns}})
+
+    if not rows:
+        return 0
+
+    df_batch = pd.DataFrame(rows).set_index('time')
+    # (DTYPE-1) Giá trị phi số -> NaN
+    df_batch[columns] = df_batch[columns].apply(pd.to_numeric, errors='coerce')
+
+    batch_flags = qa_micro_batch(df_batch, rule_set)
+
+    values = df_batch[columns].to_numpy(dtype=float)
+    col_pos = {col: i for i, col in enumerate(columns)}
+    for i, (ts, row_flags) in enumerate(zip(df_batch.index, batch_flags)):
+        row = values[i]
+        for rule_id in row_flags:
+            if rule_id in STREAM_CLEANING_ACTIONS:
+                target_cols, replacement = STREAM_CLEANING_ACTIONS[rule_id]
+                for col in target_cols:
+                    if col in col_pos:
+                        row[col_pos[col]] = replacement
+        aggregator.update(ts, dict(zip(columns, row)), row_flags)
+    return len(rows)
+
+
+def _publish(snapshot, publish_path):
+    """Ghi snapshot ra JSON một cách nguyên tử (ghi file tạm rồi đổi tên)."""
+    os.makedirs(os.path.dirname(publish_path) or '.', exist_ok=True)
+    tmp_path = publish_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, publish_path)
+
+
+# --- 4. CHƯƠNG TRÌNH CHÍNH (STREAM) ---
+def run_stream(lines, kind='air_quality', batch_size=1, publish_path=None, on_update=None,
+               max_records=None, max_buckets=3, dedup_window=48):
+    """
+    Chạy chế độ streaming trên một nguồn dòng text (tail_file / read_socket_lines / list).
+
+    - kind: 'weather' hoặc 'air_quality' (chọn cột và bộ luật QA tương ứng).
+    - batch_size: số bản ghi mỗi micro-batch (1 = xử lý từng bản ghi).
+    - publish_path: file JSON snapshot (mặc định reports/stream_snapshot_{kind}.json).
+    - on_update: callback(snapshot) được gọi sau mỗi micro-batch.
+    - dedup_window: số mốc giờ gần nhất được nhớ để loại bản ghi trùng.
+    """
+    if kind not in STREAM_CONFIG:
+        raise ValueError(f"kind phải là một trong {list(STREAM_CONFIG)}")
+    columns = STREAM_CONFIG[kind]['columns']
+    rule_set = STREAM_CONFIG[kind]['rule_set']
+    if publish_path is None:
+        publish_path = f'reports/stream_snapshot_{kind}.json'
+
+    aggregator = StreamingAggregator(columns, max_buckets=max_buckets)
+    seen_times = deque(maxlen=dedup_window)
+    print(f"Bắt đầu streaming ({kind}), micro-batch = {batch_size} bản ghi...")
+
+    def flush(batch):
+        if _process_batch(batch, columns, rule_set, aggregator, seen_times) == 0:
+            return
+        snapshot = aggregator.snapshot()
+        if publish_path:
+            _publish(snapshot, publish_path)
+        if on_update is not None:
+            on_update(snapshot)
+
+    batch = []
+    n_records = 0
+    for record in parse_records(lines):
+        batch.append(record)
+        n_records += 1
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+        if max_records is not None and n_records >= max_records:
+            break
+    if batch:
+        flush(batch)
+
+    print(f"Kết thúc streaming: đã nhận {n_records} bản ghi.")
+    return aggregator
@@ -4,6 +4,10 @@ import seaborn as sns
 import os
 import numpy as np
 import matplotlib.dates as mdates
+from src.cleaning_data_src.aggregation_cube import load_cube, cube_stat
+from src.cleaning_data_src.artifact_manifest import start_run, end_run, publish_figure
+from src.visualizaton.plot_decimation import (decimate_series, density_scatter, binned_regression,
+                                              MAX_LINE_POINTS, MAX_SCATTER_POINTS)
 
 # Thư viện Windrose
 try:
@@ -20,6 +24,7 @@ MAU_COT_BIEU_DO = "#41b6c4" # Xanh trung tính
 
 def visualization_fun():
     print("--- Bắt đầu Mục 4: Trực quan hoá (Đồng nhất màu sắc & Tiếng Việt) ---")
+    start_run('visualization')
 
     FIGURES_DIR = 'figures'
     if not os.path.exists(FIGURES_DIR):
@@ -56,7 +61,9 @@ def visualization_fun():
     try:
         fig, ax1 = plt.subplots(figsize=(12, 6))
 
-        sns.lineplot(data=df_monthly, x=df_monthly.index, y='pm2_5_mean', ax=ax1, 
+        # Chuỗi dài (nhiều năm) được giảm điểm bằng LTTB trước khi vẽ
+        pm25_line = decimate_series(df_monthly['pm2_5_mean'], MAX_LINE_POINTS)
+        sns.lineplot(x=pm25_line.index, y=pm25_line.to_numpy(), ax=ax1,
                     marker='o', color=MAU_DUONG_LINE, label='Nồng độ PM2.5 trung bình', zorder=3)
         ax1.set_ylabel('Nồng độ PM2.5 (µg/m³)', color=MAU_DUONG_LINE)
         ax1.tick_params(axis='y', labelcolor=MAU_DUONG_LINE)
@@ -78,7 +85,7 @@ def visualization_fun():
         ax1.legend(line_handle + [gray_patch], ['Bụi mịn PM2.5 (µg/m³)', 'Chỉ số chuẩn hóa'], loc='upper left')
 
         plt.tight_layout()
-        plt.savefig(os.path.join(FIGURES_DIR, '1_pm25_xu_huong.png'), dpi=300)
+        publish_figure(plt.gcf(), os.path.join(FIGURES_DIR, '1_pm25_xu_huong.png'), dpi=300)
         plt.close()
     except Exception as e: print(f"Lỗi BĐ1: {e}")
 
@@ -97,7 +104,7 @@ def visualization_fun():
         plt.legend(['Số ngày có mưa', 'Số ngày bị ô nhiễm (PM2.5 > 50)'])
         plt.xticks(rotation=0)
         plt.tight_layout()
-        plt.savefig(os.path.join(FIGURES_DIR, '2_monthly_mua_vs_o_nhiem.png'), dpi=300)
+        publish_figure(plt.gcf(), os.path.join(FIGURES_DIR, '2_monthly_mua_vs_o_nhiem.png'), dpi=300)
         plt.close()
     except Exception as e: print(f"Lỗi BĐ2: {e}")
 
@@ -115,8 +122,15 @@ def visualization_fun():
         df_daily['thu'] = df_daily.index.day_name().map(ten_thu)
         thu_tu_thu = ['Thứ 2', 'Thứ 3', 'Thứ 4', 'Thứ 5', 'Thứ 6', 'Thứ 7', 'Chủ nhật']
         
-        heatmap_data = df_daily.pivot_table(values='pm2_5_mean', index='thang', columns='thu', aggfunc='mean')
-        heatmap_data = heatmap_data.reindex(columns=thu_tu_thu)
+        # Ưu tiên đọc từ cube tính sẵn (Tháng x Thứ x Giờ), không cần pivot lại dữ liệu ngày
+        cube_file = f'processed/cube_{LAT}_{LON}_{YEAR}.npz'
+        if os.path.exists(cube_file):
+            heatmap_data = cube_stat(load_cube(cube_file), 'pm2_5', axes=('month', 'weekday'))
+            heatmap_data.index.name = 'thang'
+            heatmap_data.columns = thu_tu_thu
+        else:
+            heatmap_data = df_daily.pivot_table(values='pm2_5_mean', index='thang', columns='thu', aggfunc='mean')
+            heatmap_data = heatmap_data.reindex(columns=thu_tu_thu)
 
         plt.figure(figsize=(10, 8))
         sns.heatmap(heatmap_data, annot=True, fmt=".1f", cmap=MAU_CHU_DAO, linewidths=.5, 
@@ -126,7 +140,7 @@ def visualization_fun():
         plt.ylabel('Tháng')
         plt.xlabel('Thứ trong tuần')
         plt.tight_layout()
-        plt.savefig(os.path.join(FIGURES_DIR, '3_heatmap_pm25.png'), dpi=300)
+        publish_figure(plt.gcf(), os.path.join(FIGURES_DIR, '3_heatmap_pm25.png'), dpi=300)
         plt.close()
     except Exception as e: print(f"Lỗi BĐ3: {e}")
 
@@ -149,7 +163,7 @@ def visualization_fun():
             
             ax.set_legend(title="Tốc độ gió (m/s)", loc='lower right', bbox_to_anchor=(1.25, 0.1))
             plt.title(f'Biểu đồ Hoa Gió TP.HCM {YEAR}', fontsize=14, fontweight='bold', y=1.08)
-            plt.savefig(os.path.join(FIGURES_DIR, '4_hoa_gio.png'), dpi=400)
+            publish_figure(plt.gcf(), os.path.join(FIGURES_DIR, '4_hoa_gio.png'), dpi=400)
             plt.close()
         except Exception as e: print(f"Lỗi BĐ4: {e}")
 
@@ -158,23 +172,59 @@ def visualization_fun():
     # ==============================================================================
     print("5. Vẽ Biểu đồ phân tán...")
     try:
-        plt.figure(figsize=(10, 6))
-        sns.scatterplot(data=df_daily, x='precipitation_sum', y='pm2_5_mean', 
-                        hue='pm2_5_mean', palette=MAU_CHU_DAO, alpha=0.7, legend=False)
+        fig, ax = plt.subplots(figsize=(10, 6))
+        if len(df_daily) > MAX_SCATTER_POINTS:
+            # Nhiều điểm -> vẽ mật độ hexbin (chi phí theo số ô, không theo số dòng)
+            hb = density_scatter(ax, df_daily['precipitation_sum'], df_daily['pm2_5_mean'],
+                                 cmap=MAU_CHU_DAO, extent=(-1, 100, 0, df_daily['pm2_5_mean'].max()))
+            fig.colorbar(hb, ax=ax, label='Số ngày (thang log)')
+        else:
+            sns.scatterplot(data=df_daily, x='precipitation_sum', y='pm2_5_mean', ax=ax,
+                            hue='pm2_5_mean', palette=MAU_CHU_DAO, alpha=0.7, legend=False)
         
         df_rain = df_daily[df_daily['precipitation_sum'] > 0]
 
-        sns.regplot(data=df_rain, x='precipitation_sum', y='pm2_5_mean', 
-                    scatter=False, color='red', line_kws={'linestyle':'--'})
+        # Đường hồi quy tính trên thống kê theo bin lượng mưa (không trên từng dòng thô)
+        coef, bins = binned_regression(df_rain['precipitation_sum'], df_rain['pm2_5_mean'])
+        if coef is not None:
+            x_line = np.linspace(bins['x_mean'].min(), bins['x_mean'].max(), 100)
+            ax.plot(x_line, np.polyval(coef, x_line), color='red', linestyle='--')
 
         plt.title('Tương quan giữa Lượng mưa và Nồng độ bụi mịn PM2.5', fontsize=14, fontweight='bold')
         plt.xlabel('Tổng lượng mưa trong ngày (mm)')
         plt.ylabel('PM2.5 Trung bình (µg/m³)')
         plt.xlim(-1, 100) 
         plt.tight_layout()
-        plt.savefig(os.path.join(FIGURES_DIR, '5_phan_tan_mua_bui.png'), dpi=300)
+        publish_figure(plt.gcf(), os.path.join(FIGURES_DIR, '5_phan_tan_mua_bui.png'), dpi=300)
         plt.close()
     except Exception as e: print(f"Lỗi BĐ5: {e}")
 
+    # ==============================================================================
+    # 7. BIỂU ĐỒ ĐƯỜNG: PM2.5 THEO GIỜ (GIẢM ĐIỂM LTTB)
+    # ==============================================================================
+    hourly_file = f'processed/hourly_joined_{LAT}_{LON}_{YEAR}.csv'
+    if os.path.exists(hourly_file):
+        print("7. Vẽ PM2.5 theo giờ (LTTB)...")
+        try:
+            df_hourly = pd.read_csv(hourly_file, usecols=['time', 'pm2_5'], parse_dates=['time'])
+            if df_hourly['time'].dt.tz is not None:
+                df_hourly['time'] = df_hourly['time'].dt.tz_localize(None)
+            pm25_hourly = df_hourly.set_index('time')['pm2_5']
+            pm25_line = decimate_series(pm25_hourly, MAX_LINE_POINTS)
+
+            fig, ax = plt.subplots(figsize=(14, 5))
+            ax.plot(pm25_line.index, pm25_line.to_numpy(), color=MAU_DUONG_LINE, linewidth=0.8)
+            ax.axhline(50, color='red', linestyle='--', linewidth=1, label='Ngưỡng 50 µg/m³')
+            plt.title(f'PM2.5 theo giờ ({len(pm25_line)}/{pm25_hourly.notna().sum()} điểm, giảm điểm LTTB)',
+                      fontsize=14, fontweight='bold')
+            ax.set_ylabel('PM2.5 (µg/m³)')
+            ax.set_xlabel('Thời gian')
+            ax.legend(loc='upper right')
+            plt.tight_layout()
+            publish_figure(plt.gcf(), os.path.join(FIGURES_DIR, '7_pm25_theo_gio_lttb.png'), dpi=200)
+            plt.close()
+        except Exception as e: print(f"Lỗi BĐ7: {e}")
+
+    end_run()
     print(f"\n HOÀN THÀNH! Kiểm tra thư mục '{FIGURES_DIR}' để xem kết quả.")
 
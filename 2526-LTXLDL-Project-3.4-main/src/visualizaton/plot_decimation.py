@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+"""
+File: plot_decimation.py
+Mô tả: Lớp "giảm điểm" cho biểu đồ khi dữ liệu lớn (nhiều năm dữ liệu giờ, nhiều trạm),
+để thời gian vẽ và dung lượng file ảnh KHÔNG tăng theo số dòng dữ liệu.
+
+    - lttb(): Largest-Triangle-Three-Buckets — chọn n_out điểm giữ được hình dạng chuỗi thời gian
+      (đỉnh, đáy, bước nhảy) tốt hơn nhiều so với lấy mẫu đều.
+    - density_scatter(): biểu đồ mật độ hexbin thay cho scatter từng điểm.
+    - binned_summary() / binned_regression(): hồi quy trên THỐNG KÊ THEO BIN (trung bình + số điểm)
+      thay vì trên từng dòng thô.
+"""
+
+MAX_LINE_POINTS = 2000
+MAX_SCATTER_POINTS = 5000
+
+
+def _as_float_x(x):
+    """Trục x (số hoặc thời gian) -> mảng float để tính diện tích tam giác."""
+    if isinstance(x, (pd.DatetimeIndex, pd.Series)) and pd.api.types.is_datetime64_any_dtype(x):
+        return pd.DatetimeIndex(x).asi8.astype(float)
+    return np.asarray(x, dtype=float)
+
+
+def lttb(x, y, n_out=MAX_LINE_POINTS):
+    """
+    Trả về CHỈ SỐ các điểm được giữ theo thuật toán LTTB (giữ điểm đầu và điểm cuối).
+    x phải tăng dần; y không được có NaN (lọc trước khi gọi).
+    Mỗi bin chỉ tính diện tích tam giác bằng numpy, tổng chi phí O(n).
+    """
+    xf = _as_float_x(x)
+    yf = np.asarray(y, dtype=float)
+    n = len(yf)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n - 2 điểm giữa chia thành n_out - 2 bin
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Điểm "neo" của bin kế tiếp: trung bình bin sau (bin cuối neo vào điểm cuối)
+        if i + 2 < len(edges):
+            nxt = slice(edges[i + 1], edges[i + 2])
+            anchor_x, anchor_y = xf[nxt].mean(), yf[nxt].mean()
+        else:
+            anchor_x, anchor_y = xf[-1], yf[-1]
+        bx, by = xf[start:end], yf[start:end]
+        area = np.abs((xf[prev] - anchor_x) * (by - yf[prev]) - (xf[prev] - bx) * (anchor_y - yf[prev]))
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+
+def decimate_series(series, n_out=MAX_LINE_POINTS):
+    """Chuỗi (index thời gian/số) -> chuỗi con theo LTTB; bỏ NaN; giữ nguyên nếu đã đủ ngắn."""
+    series = series.dropna()
+    if len(series) <= n_out:
+        return series
+    if not series.index.is_monotonic_increasing:
+        series = series.sort_index()
+    keep = lttb(series.index, series.to_numpy(), n_out)
+    return series.iloc[keep]
+
+
+def density_scatter(ax, x, y, gridsize=60, cmap='YlGnBu', log_scale=True, **kwargs):
+    """Biểu đồ mật độ hexbin (số điểm mỗi ô); chi phí vẽ phụ thuộc số ô, không phụ thuộc số dòng."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ok = ~(np.isnan(x) | np.isnan(y))
+    return ax.hexbin(x[ok], y[ok], gridsize=gridsize, cmap=cmap, mincnt=1,
+                     bins='log' if log_scale else None, **kwargs)
+
+
+def binned_summary(x, y, n_bins=40, min_count=3, strategy='quantile'):
+    """
+    Gom (x, y) theo bin của x: DataFrame x_mean, y_mean, y_std, count cho mỗi bin.
+    strategy='quantile': bin có số điểm xấp xỉ nhau; 'uniform': bin cùng độ rộng.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ok = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[ok], y[ok]
+    if len(x) == 0:
+        return pd.DataFrame(columns=['x_mean', 'y_mean', 'y_std', 'count'])
+
+    if strategy == 'quantile':
+        edges = np.unique(np.quantile(x, np.linspace(0, 1, n_bins + 1)))
+    else:
+        edges = np.linspace(x.min(), x.max(), n_bins + 1)
+    if len(edges) < 2:
+        edges = np.array([x.min(), x.max() + 1.0])
+    codes = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, len(edges) - 2)
+
+    n = len(edges) - 1
+    count = np.bincount(codes, minlength=n).astype(float)
+    sum_x = np.bincount(codes, weights=x, minlength=n)
+    sum_y = np.bincount(codes, weights=y, minlength=n)
+    sum_yy = np.bincount(codes, weights=y ** 2, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y_mean = sum_y / count
+        y_var = np.clip(sum_yy / count - y_mean ** 2, 0, None) * count / (count - 1)
+        out = pd.DataFrame({'x_mean': sum_x / count, 'y_mean': y_mean,
+                            'y_std': np.sqrt(y_var), 'count': count.astype(int)})
+    return out[out['count'] >= min_count].reset_index(drop=True)
+
+
+def binned_regression(x, y, n_bins=40, min_count=3, degree=1):
+    """
+    Hồi quy đa thức trên thống kê theo bin (trọng số = số điểm của bin).
+    Trả về (hệ số np.polyfit, bảng bin); (None, bảng bin) nếu không đủ bin.
+    """
+    bins = binned_summary(x, y, n_bins=n_bins, min_count=min_count)
+    if len(bins) <= degree:
+        return None, bins
+    # polyfit nhân trọng số vào phần dư -> dùng sqrt(count) để tương đương bình phương tối thiểu có trọng số count
+    coef = np.polyfit(bins['x_mean'], bins['y_mean'], degree, w=np.sqrt(bins['count']))
+    return coef, bins
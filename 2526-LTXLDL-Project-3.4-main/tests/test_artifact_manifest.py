@@ -0,0 +1,34 @@
+import os
+
+from src.cleaning_data_src.artifact_manifest import ArtifactManifest, acknowledge_changes, pending_changes
+
+
+def test_changed_artifacts_accumulate_until_acknowledged(tmp_path):
+    changed_path = str(tmp_path / 'changed_artifacts.json')
+    manifest = ArtifactManifest(str(tmp_path / 'manifest.json'), changed_path)
+    processed = os.path.join(tmp_path, 'daily.csv')
+    figure = os.path.join(tmp_path, 'fig.png')
+
+    manifest.start_run('pipeline')
+    manifest.publish(processed, b'a')
+    manifest.end_run()
+    manifest.start_run('visualization')
+    manifest.publish(figure, b'b')
+    manifest.end_run()
+    manifest.start_run('advanced_analysis')
+    manifest.end_run()
+
+    pending = pending_changes(changed_path)
+    assert pending['changed'] == sorted([os.path.normpath(processed), os.path.normpath(figure)])
+    assert [run['run_name'] for run in pending['runs']] == ['pipeline', 'visualization', 'advanced_analysis']
+
+    last_read = pending['runs'][-1]['run_id']
+    manifest.start_run('pipeline')
+    manifest.publish(processed, b'c')
+    manifest.end_run()
+
+    acknowledged = acknowledge_changes(last_read, changed_path)
+    assert acknowledged == pending['changed']
+    remaining = pending_changes(changed_path)
+    assert remaining['changed'] == [os.path.normpath(processed)]
+    assert [run['run_name'] for run in remaining['runs']] == ['pipeline']
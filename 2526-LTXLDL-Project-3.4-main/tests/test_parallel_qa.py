@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+import src.cleaning_data_src.QA_rules as qa
+import src.cleaning_data_src.parallel_qa as pqa
+
+
+def _hourly_us(n, seed=0):
+    # Index đơn vị micro giây (như load_data / date_range của pandas mới)
+    index = pd.date_range('2024-01-01', periods=n, freq='h', tz='Asia/Ho_Chi_Minh', unit='us')
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'pm2_5': 20.0 + rng.uniform(-3, 3, n)}, index=index)
+
+
+def test_window_halo_uses_index_unit(monkeypatch):
+    df = _hourly_us(20_000)
+    slice_sizes = []
+    evaluate_shard = pqa._evaluate_shard
+
+    def recording_shard(task):
+        slice_sizes.append(len(task[0]))
+        return evaluate_shard(task)
+
+    monkeypatch.setattr(pqa, '_evaluate_shard', recording_shard)
+    calls = [(qa.check_aq_pm25_spike, [])]
+    results = pqa.evaluate_rules_sharded(df, calls, n_shards=4, n_jobs=1, min_rows_per_shard=1000)
+
+    # Lõi 5000 giờ + lề 50h (+ vài điểm có dữ liệu) mỗi phía, không phải toàn bộ chuỗi
+    assert len(slice_sizes) == 4
+    assert max(slice_sizes) <= 5000 + 2 * 53
+    assert results[0]['indices'] == qa.check_aq_pm25_spike(df)['indices']
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from src.cleaning_data_src.QA_rules import (check_aq_pm25_rate_of_change, check_aq_pm25_spike,
+                                            check_w_temp_rate_of_change)
+
+
+def _hourly(values, col):
+    index = pd.date_range('2024-01-01', periods=len(values), freq='h', tz='Asia/Ho_Chi_Minh')
+    return pd.DataFrame({col: np.asarray(values, dtype=float)}, index=index)
+
+
+def test_single_spike_flags_exactly_one_hour():
+    values = [20.0] * 48
+    values[24] = 400.0
+    df = _hourly(values, 'pm2_5')
+    result = check_aq_pm25_rate_of_change(df)
+    assert result['indices'] == [df.index[24]]
+
+
+def test_sustained_step_is_not_flagged():
+    df = _hourly([20.0] * 24 + [150.0] * 24, 'pm2_5')
+    assert check_aq_pm25_rate_of_change(df)['indices'] == []
+
+
+def test_spike_across_missing_hours_uses_valid_neighbours():
+    values = [30.0] * 24
+    values[10] = np.nan
+    values[11] = 55.0
+    values[12] = np.nan
+    df = _hourly(values, 'temp')
+    # 30 -> 55 trong 2 giờ rồi về 30 trong 2 giờ: 12.5 °C/giờ hai chiều > 10
+    assert check_w_temp_rate_of_change(df)['indices'] == [df.index[11]]
+
+
+def _baseline_pm25(n=96, seed=0):
+    # Nền 20 ± 3 µg/m³
+    return 20.0 + np.random.default_rng(seed).uniform(-3, 3, n)
+
+
+def test_isolated_spike_flags_exactly_one_hour():
+    values = _baseline_pm25()
+    values[40] = 400.0
+    df = _hourly(values, 'pm2_5')
+    assert check_aq_pm25_spike(df)['indices'] == [df.index[40]]
+
+
+def test_multi_hour_plateau_is_not_flagged_as_spike():
+    values = _baseline_pm25()
+    values[40:46] = 150.0 + np.random.default_rng(1).uniform(-3, 3, 6)
+    assert check_aq_pm25_spike(_hourly(values, 'pm2_5'))['indices'] == []
+
+    values = _baseline_pm25()
+    values[40:51] = 90.0 + np.random.default_rng(2).uniform(-3, 3, 11)
+    assert check_aq_pm25_spike(_hourly(values, 'pm2_5'))['indices'] == []